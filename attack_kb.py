@@ -0,0 +1,339 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from db import connection, data_version
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+ATTACK_KB_ENABLED = os.getenv("ATTACK_KB", "0").lower() in ("1", "true", "yes")
+
+# entity type -> (table, external reference table, reference id column, extra columns)
+ENTITY_TABLES = {
+    'technique': ('techniques', 'external_references', 'technique_id', ['tactic', 'platforms', 'detection']),
+    'group': ('groups', 'group_external_references', 'group_id', []),
+    'software': ('software', 'software_external_references', 'software_id', ['software_type']),
+    'campaign': ('campaigns', 'campaign_external_references', 'campaign_id', []),
+}
+
+class AttackKB:
+    """
+    In-memory snapshot of the ATT&CK tables.
+    Entities are keyed by STIX id, ATT&CK external IDs map to STIX ids, and
+    relationships are held as adjacency lists, so lookups never touch MySQL.
+    """
+
+    def __init__(self):
+        self.entities: Dict[str, Dict[str, Dict[str, Any]]] = {etype: {} for etype in ENTITY_TABLES}
+        self.entity_types: Dict[str, str] = {}  # STIX id -> entity type
+        self.by_external_id: Dict[str, str] = {}  # ATT&CK ID (T1059, G0007, ...) -> STIX id
+        self.external_ids: Dict[str, str] = {}  # STIX id -> ATT&CK ID
+        self.adjacency: Dict[str, List[Tuple[str, str, str]]] = defaultdict(list)
+        self.group_techniques: Dict[str, List[str]] = defaultdict(list)
+        self.tactic_index: Dict[str, Set[str]] = defaultdict(set)  # tactic -> technique STIX ids
+        self._related_cache: Dict[str, List[Dict[str, str]]] = {}
+        self._sorted_technique_ids: List[str] = []
+        self.loaded_at: Optional[float] = None
+        self.data_version: Optional[str] = None
+
+    @classmethod
+    def load(cls) -> "AttackKB":
+        """Build a snapshot from the database."""
+        kb = cls()
+        started = time.monotonic()
+        # Read the stamp before the tables so a sync landing mid-load makes the snapshot look stale, not fresh
+        kb.data_version = data_version(max_age=0)
+        with connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            for entity_type, (table, ref_table, id_field, extra) in ENTITY_TABLES.items():
+                columns = ', '.join(['id', 'name', 'description'] + extra)
+                cursor.execute(f"SELECT {columns} FROM {table}")
+                for row in cursor.fetchall():
+                    kb.entities[entity_type][row['id']] = row
+                    kb.entity_types[row['id']] = entity_type
+                    if entity_type == 'technique' and row['tactic']:
+                        for tactic in row['tactic'].split(','):
+                            kb.tactic_index[tactic].add(row['id'])
+
+                cursor.execute(f"""
+                    SELECT {id_field} AS stix_id, external_id
+                    FROM {ref_table}
+                    WHERE source_name = 'mitre-attack' AND external_id IS NOT NULL
+                """)
+                for row in cursor.fetchall():
+                    kb.by_external_id[row['external_id']] = row['stix_id']
+                    kb.external_ids[row['stix_id']] = row['external_id']
+
+            cursor.execute("SELECT source_id, target_id, relationship_type FROM relationships")
+            for row in cursor.fetchall():
+                rel = (row['source_id'], row['target_id'], row['relationship_type'])
+                kb.adjacency[rel[0]].append(rel)
+                if rel[1] != rel[0]:
+                    kb.adjacency[rel[1]].append(rel)
+
+            cursor.execute("SELECT group_id, technique_id FROM group_technique_relationships")
+            for row in cursor.fetchall():
+                kb.group_techniques[row['group_id']].append(row['technique_id'])
+
+        kb._sorted_technique_ids = sorted(
+            ext_id for ext_id, stix_id in kb.by_external_id.items()
+            if kb.entity_types.get(stix_id) == 'technique'
+        )
+        kb.loaded_at = time.time()
+        logger.info(
+            f"Loaded ATT&CK snapshot: {len(kb.entity_types)} entities, "
+            f"{sum(len(v) for v in kb.adjacency.values()) // 2} relationships "
+            f"in {time.monotonic() - started:.2f}s"
+        )
+        return kb
+
+    # --- Helpers ---
+    def lookup(self, external_id: str, entity_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return the entity row for an ATT&CK external ID (any case, like SQL `=`), optionally restricted to a type."""
+        stix_id = self.by_external_id.get(external_id.upper())
+        if stix_id is None or (entity_type and self.entity_types.get(stix_id) != entity_type):
+            return None
+        return self.entities[self.entity_types[stix_id]][stix_id]
+
+    def _name_matches(self, entity_type: str, text: str) -> List[Dict[str, Any]]:
+        """Case-insensitive substring match on name, mirroring SQL `name LIKE '%text%'`."""
+        needle = text.lower()
+        return [row for row in self.entities[entity_type].values() if needle in (row['name'] or '').lower()]
+
+    def _technique_summary(self, row: Dict[str, Any]) -> Dict[str, str]:
+        return {"attack_id": row['id'], "name": row['name'], "ttp_id": self.external_ids.get(row['id'])}
+
+    # --- mitre.py equivalents ---
+    def search_by_ttp_id(self, ttp_id: str) -> List[Dict[str, str]]:
+        # ATT&CK IDs are stored uppercase; MySQL's LIKE ignores case, so the prefix match does too
+        ttp_id = ttp_id.strip().upper()
+        start = bisect.bisect_left(self._sorted_technique_ids, ttp_id)
+        results = []
+        for ext_id in self._sorted_technique_ids[start:]:
+            if not ext_id.startswith(ttp_id):
+                break
+            results.append(self._technique_summary(self.lookup(ext_id, 'technique')))
+        return results
+
+    def get_technique_details(self, ttp_id: str) -> Optional[Dict[str, Any]]:
+        technique = self.lookup(ttp_id, 'technique')
+        if technique is None:
+            return None
+        return {
+            "ttp_id": ttp_id,
+            "name": technique['name'],
+            "attack_id": technique['id'],
+            "description": technique['description'],
+            "related_ttps": [dict(r) for r in self.related_ttps(technique['id'])],
+        }
+
+    def get_technique_context(self, ttp_ids: List[str]) -> List[Dict[str, str]]:
+        results = []
+        for ttp_id in ttp_ids:
+            technique = self.lookup(ttp_id, 'technique')
+            if technique is not None:
+                results.append({
+                    "ttp_id": ttp_id,
+                    "name": technique['name'],
+                    "tactic": technique['tactic'],
+                    "platforms": technique['platforms'],
+                    "detection": technique['detection'],
+                })
+        return results
+
+    def related_ttps(self, technique_id: str) -> List[Dict[str, str]]:
+        """Techniques sharing a tactic with technique_id, computed once per technique."""
+        related = self._related_cache.get(technique_id)
+        if related is None:
+            technique = self.entities['technique'][technique_id]
+            ttp_id = self.external_ids.get(technique_id)
+            related_ids = set()
+            for tactic in (technique['tactic'] or '').split(','):
+                related_ids |= self.tactic_index.get(tactic, set())
+            related = sorted((
+                self._technique_summary(self.entities['technique'][stix_id]) for stix_id in related_ids
+                if stix_id in self.external_ids and self.external_ids[stix_id] != ttp_id
+            ), key=lambda r: r['ttp_id'])
+            self._related_cache[technique_id] = related
+        return related
+
+    def search_groups(self, query: str, by_id: bool) -> List[Dict[str, Any]]:
+        if by_id:
+            group = self.lookup(query, 'group')
+            groups = [group] if group else []
+        else:
+            groups = self._name_matches('group', query)
+        results = []
+        for group in groups:
+            related_techniques = []
+            for technique_id in self.group_techniques.get(group['id'], []):
+                technique = self.entities['technique'].get(technique_id)
+                if technique:
+                    related_techniques.append({
+                        "technique_attack_id": technique_id,
+                        "technique_name": technique['name'],
+                        "ttp_id": self.external_ids.get(technique_id),
+                    })
+            results.append({
+                "group_id": self.external_ids.get(group['id']),
+                "name": group['name'],
+                "attack_id": group['id'],
+                "description": group['description'],
+                "related_techniques": related_techniques,
+            })
+        return results
+
+    def search_software(self, query: str, by_id: bool) -> List[Dict[str, Any]]:
+        if by_id:
+            row = self.lookup(query, 'software')
+            rows = [row] if row else []
+        else:
+            rows = self._name_matches('software', query)
+        return [{
+            "attack_id": row['id'],
+            "name": row['name'],
+            "description": row['description'],
+            "software_type": row['software_type'],
+            "software_id": self.external_ids.get(row['id']),
+        } for row in rows]
+
+    def search_campaigns(self, query: str, by_id: bool) -> List[Dict[str, Any]]:
+        if by_id:
+            row = self.lookup(query, 'campaign')
+            rows = [row] if row else []
+        else:
+            rows = self._name_matches('campaign', query)
+        return [{
+            "attack_id": row['id'],
+            "name": row['name'],
+            "description": row['description'],
+            "campaign_id": self.external_ids.get(row['id']),
+        } for row in rows]
+
+    # --- graph.py equivalent ---
+    def fetch_linked_entities(self, query: str, entity_type: Optional[str], depth: int = 1,
+                              entity_types: Optional[Set[str]] = None,
+                              relationship_types: Optional[Set[str]] = None,
+                              max_nodes: Optional[int] = None) -> Optional[tuple]:
+        """
+        Return (entities, relationships) within `depth` hops of the focal entity, breadth first.
+        entity_type None means group name search; the filters and node budget match graph.expand_graph.
+        """
+        if entity_type:
+            focal = self.lookup(query, entity_type)
+        else:
+            entity_type = 'group'
+            matches = self._name_matches('group', query)
+            focal = matches[0] if matches else None
+        if focal is None:
+            return None
+
+        entities = {focal['id']: self._graph_node(focal['id'], entity_type)}
+        relationships = []
+        frontier = [focal['id']]
+        for _ in range(depth):
+            discovered = set()
+            for stix_id in frontier:
+                for rel in self.adjacency.get(stix_id, []):
+                    if relationship_types and rel[2] not in relationship_types:
+                        continue
+                    other = rel[1] if rel[0] == stix_id else rel[0]
+                    other_type = self.entity_types.get(other)
+                    if other_type is None or (entity_types and other_type not in entity_types):
+                        continue
+                    if other not in entities:
+                        discovered.add(other)
+                    relationships.append(rel)
+            # Sorted so the node budget always keeps the same entities
+            frontier = sorted(discovered)
+            if max_nodes is not None:
+                frontier = frontier[:max(max_nodes - len(entities), 0)]
+            for stix_id in frontier:
+                entities[stix_id] = self._graph_node(stix_id, self.entity_types[stix_id])
+            if not frontier:
+                break
+        relationships = list(dict.fromkeys(
+            rel for rel in relationships if rel[0] in entities and rel[1] in entities
+        ))
+        return entities, relationships
+
+    def _graph_node(self, stix_id: str, entity_type: str) -> Dict[str, str]:
+        node = {
+            'name': self.entities[entity_type][stix_id]['name'],
+            'attck_id': self.external_ids.get(stix_id) or stix_id,
+            'type': entity_type
+        }
+        if entity_type == 'technique':
+            node['tactic'] = self.entities[entity_type][stix_id]['tactic']
+        return node
+
+# Process-wide snapshot; None until loaded (queries then fall back to MySQL)
+_kb: Optional[AttackKB] = None
+_kb_lock = threading.RLock()
+
+def get_kb() -> Optional[AttackKB]:
+    """Return the loaded snapshot, or None if the in-memory KB is disabled or not loaded yet."""
+    return _kb
+
+def load_kb() -> Optional[AttackKB]:
+    """Load the snapshot if ATTACK_KB is enabled. Failures leave queries on the MySQL path."""
+    if not ATTACK_KB_ENABLED:
+        return None
+    return reload_kb()
+
+def reload_kb() -> Optional[AttackKB]:
+    """
+    Rebuild the snapshot from the database and swap it in atomically. Returns the new
+    snapshot, or None if loading failed; the previous snapshot (if any) keeps being served.
+    """
+    global _kb
+    with _kb_lock:
+        try:
+            kb = AttackKB.load()
+        except Exception as e:
+            logger.error(f"Failed to load ATT&CK snapshot, keeping previous state: {e}")
+            return None
+        _kb = kb
+    return kb
+
+# Database version a snapshot reload already failed for, so it isn't retried on every call
+_failed_version: Optional[str] = None
+
+def current_data_version() -> str:
+    """
+    Data version of the data being served. When a sync has moved the database past the
+    snapshot, the snapshot is reloaded first, so graphs cached from the old data stop
+    matching within DATA_VERSION_TTL seconds instead of waiting for /reload-attack.
+    """
+    global _failed_version
+    kb = _kb
+    if kb is None:
+        return data_version()
+    try:
+        version = data_version()
+    except Exception as e:
+        logger.warning(f"Could not check the ATT&CK data version, serving the snapshot as is: {e}")
+        return kb.data_version
+    if version == kb.data_version or version == _failed_version:
+        return kb.data_version
+    with _kb_lock:
+        if _kb is not kb:  # another command reloaded it meanwhile
+            return _kb.data_version if _kb is not None else data_version()
+        logger.info(f"ATT&CK data changed ({kb.data_version} -> {version}), reloading the snapshot")
+        fresh = reload_kb()
+        if fresh is None:
+            _failed_version = version
+            return kb.data_version
+        return fresh.data_version
+
+def clear_kb():
+    """Drop the snapshot so every query goes back to MySQL."""
+    global _kb
+    _kb = None
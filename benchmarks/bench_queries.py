@@ -0,0 +1,487 @@
+"""
+Benchmark the mitre.py and graph.py query paths under representative query mixes.
+
+The STIX bundle is loaded through mitre2sql into a scratch MySQL/MariaDB database
+(dropped and recreated; connection settings from DB_HOST / DB_USER / DB_PASS) or,
+with --sqlite, into an SQLite file that stands in for it. Each mix is then replayed
+at every --concurrency level, against MySQL and/or the in-memory snapshot (--paths).
+The query sequence is drawn from the loaded data with a fixed --seed, so two commits
+benchmarked on the same bundle run exactly the same queries.
+
+Results (per-operation latency percentiles, rows returned, SQL statements per
+operation, throughput) are printed as a table and written as JSON with --json.
+When both paths run, any operation returning different row counts on the sql and
+kb paths is printed as a MISMATCH line.
+Pass --compare with an earlier JSON file to flag regressions; the exit status is
+1 when any are found.
+
+Usage: python benchmarks/bench_queries.py enterprise-attack.json [--sqlite bench.db] [--database mitre_bench]
+       [--no-load] [--paths sql,kb] [--mixes lookup,search,graph,attack] [--concurrency 1,4,16]
+       [--ops 300] [--seed 0] [--json results.json] [--compare baseline.json] [--tolerance 0.2]
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+# Relative weights of each operation in a mix. "attack" approximates /attack traffic.
+MIXES = {
+    "lookup": {"search_by_ttp_id": 3, "get_technique_details": 3, "search_groups": 2,
+               "search_software": 1, "search_campaigns": 1},
+    "search": {"search_by_name_or_description": 4, "search_groups": 2, "search_software": 2,
+               "search_campaigns": 1},
+    "graph": {"fetch_linked_entities": 3, "expand_graph": 1},
+    "attack": {"search_by_ttp_id": 3, "get_technique_details": 2, "search_by_name_or_description": 2,
+               "search_groups": 2, "search_software": 1, "search_campaigns": 1,
+               "fetch_linked_entities": 2, "expand_graph": 1},
+}
+
+# --- Stand-in database ---
+class SQLiteCursor:
+    """Just enough of a mysql.connector cursor for the query modules: %s params and dict rows."""
+
+    def __init__(self, conn, dictionary=False):
+        self.cursor = conn.cursor()
+        self.dictionary = dictionary
+        self.rowcount = -1
+
+    def execute(self, query, params=()):
+        self.cursor.execute(query.replace('%s', '?').replace('INSERT IGNORE', 'INSERT OR IGNORE'), tuple(params))
+        self.rowcount = self.cursor.rowcount
+
+    def executemany(self, query, seq_params):
+        self.cursor.executemany(query.replace('%s', '?').replace('INSERT IGNORE', 'INSERT OR IGNORE'), seq_params)
+        self.rowcount = self.cursor.rowcount
+
+    def _row(self, row):
+        if row is None or not self.dictionary:
+            return row
+        return dict(zip((column[0] for column in self.cursor.description), row))
+
+    def fetchone(self):
+        return self._row(self.cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self.cursor.fetchall()]
+
+    def close(self):
+        self.cursor.close()
+
+class SQLiteDatabase:
+    """One SQLite connection per thread, handed out like db.connection() hands out pooled ones."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self._conn(), dictionary)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, check_same_thread=False)
+        return conn
+
+    def commit(self):
+        self._conn().commit()
+
+    def rollback(self):
+        self._conn().rollback()
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+def load_sqlite(json_file, path, batch_size):
+    """Load the bundle into a fresh SQLite file using mitre2sql's schema and row mapping."""
+    import mitre2sql
+
+    if os.path.exists(path):
+        os.remove(path)
+    verbs = {"INSERT": "INSERT", "INSERT IGNORE": "INSERT OR IGNORE", "REPLACE": "REPLACE"}
+    stats = mitre2sql.new_stats()
+    conn = sqlite3.connect(path)
+    try:
+        for table, columns, _, _ in mitre2sql.SCHEMA:
+            conn.execute(f"CREATE TABLE {table} ({' '.join(columns.split())})")
+        statements = {
+            table: f"{verbs[verb]} INTO {table} ({','.join(mitre2sql.COLUMNS[table])}) "
+                   f"VALUES ({','.join(['?'] * len(mitre2sql.COLUMNS[table]))})"
+            for table, _, verb, _ in mitre2sql.SCHEMA
+        }
+        pending = defaultdict(list)
+        for table, row in mitre2sql.iter_rows(mitre2sql.counted(mitre2sql.load_objects(json_file, True), stats)):
+            pending[table].append(row)
+            if len(pending[table]) >= batch_size:
+                conn.executemany(statements[table], pending.pop(table))
+        for table, rows in pending.items():
+            conn.executemany(statements[table], rows)
+        conn.execute(statements["attack_metadata"], ("data_version", mitre2sql.new_data_version()))
+        for table, _, _, indexes in mitre2sql.SCHEMA:
+            for index_name, column in indexes:
+                conn.execute(f"CREATE INDEX {index_name} ON {table} ({column})")
+        conn.commit()
+    finally:
+        conn.close()
+    return mitre2sql.finish_stats(stats)
+
+def create_mysql_database(database):
+    """Make sure the scratch database exists; mitre2sql drops and recreates its tables."""
+    import db
+
+    conn = db.connect_to_db(database=None)
+    try:
+        conn.cursor().execute(f"CREATE DATABASE IF NOT EXISTS `{database}`")
+    finally:
+        conn.close()
+
+# --- Instrumentation ---
+_counts = threading.local()
+
+class CountingCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        _counts.queries = getattr(_counts, 'queries', 0) + 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class CountingConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+def install_connection(base_connection):
+    """Route every query module through base_connection, counting statements per thread."""
+    import attack_kb, db, graph, mitre, search_index
+
+    @contextmanager
+    def connection():
+        with base_connection() as conn:
+            yield CountingConnection(conn)
+
+    for module in (db, mitre, graph, attack_kb, search_index):
+        module.connection = connection
+
+# --- Workload ---
+def sample_inputs(base_connection):
+    """IDs, names and keywords drawn from the loaded data, in a stable order."""
+    def column(cursor, sql):
+        cursor.execute(sql)
+        return sorted({row[0] for row in cursor.fetchall() if row[0]})
+
+    with base_connection() as conn:
+        cursor = conn.cursor()
+        inputs = {
+            "ttp_ids": column(cursor, "SELECT external_id FROM external_references WHERE source_name = 'mitre-attack'"),
+            "technique_names": column(cursor, "SELECT name FROM techniques"),
+            "group_ids": column(cursor, "SELECT external_id FROM group_external_references WHERE source_name = 'mitre-attack'"),
+            "group_names": column(cursor, "SELECT name FROM groups"),
+            "software_ids": column(cursor, "SELECT external_id FROM software_external_references WHERE source_name = 'mitre-attack'"),
+            "software_names": column(cursor, "SELECT name FROM software"),
+            "campaign_ids": column(cursor, "SELECT external_id FROM campaign_external_references WHERE source_name = 'mitre-attack'"),
+            "campaign_names": column(cursor, "SELECT name FROM campaigns"),
+        }
+    inputs["ttp_ids"] = [ttp_id for ttp_id in inputs["ttp_ids"] if re.match(r'^T\d{4}(\.\d{3})?$', ttp_id)]
+    inputs["parent_ttp_ids"] = sorted({ttp_id.split('.')[0] for ttp_id in inputs["ttp_ids"]})
+    inputs["keywords"] = sorted({word.lower() for name in inputs["technique_names"]
+                                 for word in re.findall(r'[A-Za-z]{5,}', name)})
+    return inputs
+
+def _name_fragment(rng, names):
+    """Part of a name, the way people type partial searches."""
+    name = rng.choice(names)
+    return name[:max(3, len(name) // 2)]
+
+def _id_or_name(rng, ids, names):
+    return rng.choice(ids) if ids and (rng.random() < 0.5 or not names) else _name_fragment(rng, names)
+
+def make_argument(operation, rng, inputs):
+    if operation == "search_by_ttp_id":
+        ttp_id = rng.choice(inputs["parent_ttp_ids"])
+        return ttp_id.lower() if rng.random() < 0.25 else ttp_id  # IDs typed in lowercase must match too
+    if operation == "get_technique_details":
+        return rng.choice(inputs["ttp_ids"])
+    if operation == "search_by_name_or_description":
+        return rng.choice(inputs["keywords"])
+    if operation == "search_groups":
+        return _id_or_name(rng, inputs["group_ids"], inputs["group_names"])
+    if operation == "search_software":
+        return _id_or_name(rng, inputs["software_ids"], inputs["software_names"])
+    if operation == "search_campaigns":
+        return _id_or_name(rng, inputs["campaign_ids"], inputs["campaign_names"])
+    # Graph operations start from any entity ID, weighted towards groups like /attack graph
+    pool = rng.choice(["group_ids", "group_ids", "software_ids", "campaign_ids", "ttp_ids"])
+    return rng.choice(inputs[pool] or inputs["group_ids"])
+
+def make_workload(mix, ops, seed, inputs):
+    """The same (operation, argument) sequence for a given mix, op count, seed and dataset."""
+    rng = random.Random(f"{seed}:{mix}")
+    operations = list(MIXES[mix])
+    weights = [MIXES[mix][operation] for operation in operations]
+    workload = []
+    for operation in rng.choices(operations, weights, k=ops):
+        workload.append((operation, make_argument(operation, rng, inputs)))
+    return workload
+
+def call(operation, argument):
+    import graph, mitre
+
+    if operation == "fetch_linked_entities":
+        return graph.fetch_linked_entities(argument)
+    if operation == "expand_graph":
+        return graph.expand_graph(argument, depth=2)
+    return getattr(mitre, operation)(argument)
+
+def rows_returned(result):
+    if result is None:
+        return 0
+    if isinstance(result, tuple):  # (entities, relationships) from the graph functions
+        return len(result[0]) + len(result[1])
+    if isinstance(result, dict):  # get_technique_details
+        return 1 + len(result.get("related_ttps", []))
+    return len(result)
+
+def percentile(values, pct):
+    """Nearest-rank percentile; 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+def run_workload(workload, concurrency):
+    """Replay workload on `concurrency` threads; returns per-operation samples and wall time."""
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def run_one(item):
+        operation, argument = item
+        _counts.queries = 0
+        started = time.perf_counter()
+        try:
+            result = call(operation, argument)
+        except Exception:
+            with lock:
+                errors[operation] += 1
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            samples[operation].append((elapsed, rows_returned(result), _counts.queries))
+
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):  # The query modules print() liberally
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(run_one, workload))
+        elapsed = time.perf_counter() - started
+    return samples, errors, elapsed
+
+def summarize(samples, errors, elapsed):
+    operations = {}
+    for operation in sorted(set(samples) | set(errors)):
+        latencies = [sample[0] * 1000 for sample in samples[operation]]
+        count = len(latencies)
+        operations[operation] = {
+            "count": count,
+            "errors": errors[operation],
+            "mean_ms": round(sum(latencies) / count, 3) if count else 0.0,
+            **{f"p{pct}_ms": round(percentile(latencies, pct), 3) for pct in (50, 95, 99)},
+            "rows_avg": round(sum(sample[1] for sample in samples[operation]) / count, 2) if count else 0.0,
+            "queries_avg": round(sum(sample[2] for sample in samples[operation]) / count, 2) if count else 0.0,
+        }
+    completed = sum(len(values) for values in samples.values())
+    all_latencies = [sample[0] * 1000 for values in samples.values() for sample in values]
+    return {
+        "ops": completed,
+        "errors": sum(errors.values()),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_ops_s": round(completed / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(all_latencies, 50), 3),
+        "p95_ms": round(percentile(all_latencies, 95), 3),
+        "operations": operations,
+    }
+
+def parity(report):
+    """Lines for each operation whose rows differ between the sql and kb paths on the same workload."""
+    by_path = defaultdict(dict)
+    for run in report["runs"]:
+        by_path[(run["mix"], run["concurrency"])][run["path"]] = run
+    mismatches = []
+    for (mix, concurrency), runs in by_path.items():
+        if "sql" not in runs or "kb" not in runs:
+            continue
+        for operation, stats in runs["sql"]["operations"].items():
+            other = runs["kb"]["operations"].get(operation)
+            if other is not None and other["rows_avg"] != stats["rows_avg"]:
+                mismatches.append(f"{mix}/c{concurrency} {operation}: sql {stats['rows_avg']} vs kb {other['rows_avg']} rows/op")
+    return mismatches
+
+# --- Regression comparison ---
+def run_key(run):
+    return (run["path"], run["mix"], run["concurrency"])
+
+def compare(report, baseline, tolerance):
+    """Lines describing each regression against baseline; empty when there are none."""
+    previous = {run_key(run): run for run in baseline["runs"]}
+    regressions = []
+    for run in report["runs"]:
+        before = previous.get(run_key(run))
+        if before is None:
+            continue
+        label = "{}/{}/c{}".format(*run_key(run))
+        if run["throughput_ops_s"] < before["throughput_ops_s"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {before['throughput_ops_s']} -> {run['throughput_ops_s']} ops/s")
+        for operation, stats in run["operations"].items():
+            old = before["operations"].get(operation)
+            if old is None:
+                continue
+            if stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{label} {operation}: p95 {old['p95_ms']} -> {stats['p95_ms']} ms")
+            # Statement counts are deterministic, so any increase is a real change
+            if stats["queries_avg"] > old["queries_avg"]:
+                regressions.append(f"{label} {operation}: {old['queries_avg']} -> {stats['queries_avg']} queries/op")
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def csv_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('json_file', nargs='?', help='STIX bundle, e.g. enterprise-attack.json')
+    parser.add_argument('--sqlite', metavar='PATH', help='use an SQLite file as a stand-in for MySQL')
+    parser.add_argument('--database', default='mitre_bench', help='scratch MySQL database (tables are recreated)')
+    parser.add_argument('--no-load', action='store_true', help='reuse the data already loaded')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--paths', type=csv_list, default=['sql', 'kb'],
+                        help='sql: query the database; kb: serve from the in-memory snapshot')
+    parser.add_argument('--mixes', type=csv_list, default=list(MIXES), help=f"any of {', '.join(MIXES)}")
+    parser.add_argument('--concurrency', type=lambda value: [int(item) for item in csv_list(value)],
+                        default=[1, 4, 16], help='worker threads per run, comma separated')
+    parser.add_argument('--ops', type=int, default=300, help='operations per run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='earlier results to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before flagging, as a fraction')
+    args = parser.parse_args()
+    if not args.no_load and not args.json_file:
+        parser.error('json_file is required unless --no-load is given')
+    for mix in args.mixes:
+        if mix not in MIXES:
+            parser.error(f"unknown mix {mix!r}")
+    if not args.sqlite:
+        os.environ['DB'] = args.database  # Before db is imported, so every connection uses it
+
+    import attack_kb, db, mitre, mitre2sql, search_index
+
+    load_stats = None
+    if args.sqlite:
+        if not args.no_load:
+            load_stats = load_sqlite(args.json_file, args.sqlite, args.batch_size)
+        base_connection = SQLiteDatabase(args.sqlite).connection
+    else:
+        if not args.no_load:
+            create_mysql_database(args.database)
+            load_stats = mitre2sql.load_into_database(args.json_file, stream=True, batch_size=args.batch_size)
+        db._pool = db.ConnectionPool(size=max(args.concurrency))
+        base_connection = db.connection
+    install_connection(base_connection)
+
+    inputs = sample_inputs(base_connection)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "backend": "sqlite" if args.sqlite else "mysql",
+            "bundle": os.path.basename(args.json_file) if args.json_file else None,
+            "bundle_sha256": file_digest(args.json_file) if args.json_file else None,
+            "load_s": round(load_stats["seconds"], 3) if load_stats else None,
+            "objects": load_stats["objects"] if load_stats else None,
+            "dataset": {name: len(values) for name, values in inputs.items() if name.endswith("ids")},
+            "python": platform.python_version(),
+            "ops": args.ops,
+            "seed": args.seed,
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        "setup": {},
+        "runs": [],
+    }
+
+    print(f"{'path':<5} {'mix':<7} {'conc':>4} {'ops/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>6}")
+    for path in args.paths:
+        if path == 'kb':
+            started = time.perf_counter()
+            if attack_kb.reload_kb() is None:
+                print("Could not load the in-memory snapshot, skipping the kb path")
+                continue
+            report["setup"]["kb_load_s"] = round(time.perf_counter() - started, 3)
+        else:
+            attack_kb.clear_kb()
+        for mix in args.mixes:
+            workload = make_workload(mix, args.ops, args.seed, inputs)
+            for concurrency in args.concurrency:
+                # Every run starts from the same state: cold query caches, freshly built search index
+                mitre.clear_caches()
+                search_index.reset_index()
+                started = time.perf_counter()
+                search_index.get_index()
+                report["setup"][f"index_build_{path}_s"] = round(time.perf_counter() - started, 3)
+
+                run = {"path": path, "mix": mix, "concurrency": concurrency,
+                       **summarize(*run_workload(workload, concurrency))}
+                report["runs"].append(run)
+                print(f"{path:<5} {mix:<7} {concurrency:>4} {run['throughput_ops_s']:>9.1f} "
+                      f"{run['p50_ms']:>8.2f} {run['p95_ms']:>8.2f} {run['errors']:>6}")
+    attack_kb.clear_kb()
+    for line in parity(report):
+        print(f"MISMATCH {line}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        print(f"{len(regressions)} regression(s) against {args.compare}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark mitre.search_groups as the number of matched groups grows.
+
+Runs against a stand-in connection that charges a fixed round-trip time per
+query, so the numbers show how many round trips a search costs rather than
+how fast a particular MySQL server is. Latency should stay flat across rows.
+
+Usage: python benchmarks/bench_search_groups.py [--rtt-ms 2] [--techniques 40] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import mitre
+
+class RoundTripCursor:
+    """Cursor that sleeps for one round trip per execute and returns synthetic rows."""
+
+    def __init__(self, bench):
+        self.bench = bench
+        self.rows = []
+
+    def execute(self, query, params=()):
+        self.bench.queries += 1
+        time.sleep(self.bench.rtt)
+        if 'group_technique_relationships' in query:
+            self.rows = [
+                {"group_id": group_id, "technique_attack_id": f"attack-pattern--{group_id}-{i}",
+                 "technique_name": f"Technique {i}", "ttp_id": f"T{1000 + i}"}
+                for group_id in params for i in range(self.bench.techniques)
+            ]
+        else:
+            self.rows = [
+                {"attack_id": f"intrusion-set--{i}", "name": f"APT{i}", "description": "", "group_id": f"G{i:04d}"}
+                for i in range(self.bench.groups)
+            ]
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+class RoundTripBench:
+    def __init__(self, rtt_ms: float, techniques: int):
+        self.rtt = rtt_ms / 1000
+        self.techniques = techniques
+        self.groups = 0
+        self.queries = 0
+
+    def cursor(self, dictionary=False):
+        return RoundTripCursor(self)
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rtt-ms', type=float, default=2.0, help='simulated round-trip time per query')
+    parser.add_argument('--techniques', type=int, default=40, help='related techniques per group')
+    parser.add_argument('--repeat', type=int, default=5, help='searches per group count')
+    args = parser.parse_args()
+
+    bench = RoundTripBench(args.rtt_ms, args.techniques)
+    mitre.connection = bench.connection
+    mitre.get_kb = lambda: None  # Always exercise the MySQL path
+
+    print(f"{'groups':>8} {'queries':>8} {'ms/search':>10}")
+    for groups in (1, 5, 10, 25, 50, 100):
+        bench.groups = groups
+        bench.queries = 0
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            results = mitre.search_groups('APT')
+        elapsed_ms = (time.perf_counter() - started) * 1000 / args.repeat
+        assert len(results) == groups
+        print(f"{groups:>8} {bench.queries // args.repeat:>8} {elapsed_ms:>10.2f}")
+
+if __name__ == "__main__":
+    main()
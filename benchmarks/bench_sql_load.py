@@ -0,0 +1,60 @@
+"""
+Compare replay time of mitre2sql output: one row per INSERT with autocommit
+("before") against batched multi-row INSERTs in one transaction ("after").
+
+Each file is piped through the mysql client into a scratch database that is
+dropped and recreated before every run. Connection settings come from the
+usual DB_HOST / DB_USER / DB_PASS variables.
+
+Usage: python benchmarks/bench_sql_load.py enterprise-attack.json [--database mitre_bench] [--batch-size 500]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dotenv import load_dotenv
+import mitre2sql
+
+def mysql_command(database=None):
+    command = ['mysql', f"--host={os.getenv('DB_HOST') or 'localhost'}", f"--user={os.getenv('DB_USER') or 'root'}"]
+    if os.getenv('DB_PASS'):
+        command.append(f"--password={os.getenv('DB_PASS')}")
+    if database:
+        command.append(database)
+    return command
+
+def replay(sql_file_path, database):
+    """Recreate the scratch database, pipe the file through mysql and return elapsed seconds."""
+    subprocess.run(mysql_command(), input=f"DROP DATABASE IF EXISTS {database}; CREATE DATABASE {database};",
+                   text=True, check=True)
+    with open(sql_file_path, 'rb') as sql_file:
+        started = time.monotonic()
+        subprocess.run(mysql_command(database), stdin=sql_file, check=True)
+        return time.monotonic() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('json_file', help='STIX bundle, e.g. enterprise-attack.json')
+    parser.add_argument('--database', default='mitre_bench', help='scratch database (dropped and recreated)')
+    parser.add_argument('--batch-size', type=int, default=mitre2sql.DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+    load_dotenv()
+
+    variants = [
+        ("per-row, autocommit", {"batch_size": 1, "transaction": False}),
+        (f"batched x{args.batch_size}, transaction", {"batch_size": args.batch_size, "transaction": True}),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'variant':<32} {'file MB':>8} {'load s':>8}")
+        for label, options in variants:
+            sql_file_path = os.path.join(tmp, 'mitre.sql')
+            mitre2sql.generate_mitre_sql(args.json_file, sql_file_path, stream=True, **options)
+            size_mb = os.path.getsize(sql_file_path) / (1024 * 1024)
+            print(f"{label:<32} {size_mb:>8.1f} {replay(sql_file_path, args.database):>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Deterministic stand-in for Ollama's /api/generate endpoint, for load testing without a model.
+
+Replies with a canned Markdown tabletop shaped by the prompt (narrative, the requested
+number of injects, facilitation tips, or a single section for pipelined prompts).
+Each request waits --latency-ms before the first token, then emits tokens at
+--tokens-per-sec, streamed as NDJSON when the request asks for "stream": true.
+--error-rate makes that fraction of requests fail with a 503, seeded by --seed.
+
+Usage: python benchmarks/fake_ollama.py [--port 11435] [--latency-ms 500] [--tokens-per-sec 40] [--error-rate 0]
+Then point OLLAMA_URL at http://127.0.0.1:11435/api/generate.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+
+from aiohttp import web
+
+WORDS = ("the attacker moves laterally while the security team reviews alerts from the firewall "
+         "and domain controller logs showing unusual authentication patterns").split()
+
+def fake_document(prompt: str, rng: random.Random, words_per_section: int) -> str:
+    """Markdown that looks like what the real prompts ask for, sized like a real response."""
+    def paragraph():
+        return " ".join(rng.choice(WORDS) for _ in range(words_per_section)) + "."
+
+    inject = re.search(r"`### Inject (\d+)`", prompt)
+    if inject:
+        return (f"### Inject {inject.group(1)}\n{paragraph()}\n```\n2024-01-01T09:00:00Z fw01 deny tcp 10.0.0.5:445\n```\n"
+                "- What do you check first?\n- Who do you notify?\n")
+    if "Respond with only a `## Narrative`" in prompt:
+        return f"## Narrative\n{paragraph()}\n"
+    if "Respond with only a `## Facilitation Tips`" in prompt:
+        return f"## Facilitation Tips\n- {paragraph()}\n- {paragraph()}\n"
+
+    count = re.search(r"Number of Injects: (\d+)", prompt)
+    injects = "".join(
+        f"### Inject {i}\n{paragraph()}\n```\n2024-01-01T09:0{i % 10}:00Z dc01 4625 logon failure\n```\n"
+        for i in range(1, int(count.group(1)) + 1 if count else 3)
+    )
+    return f"## Narrative\n{paragraph()}\n## Injects\n{injects}## Facilitation Tips\n- {paragraph()}\n"
+
+class FakeOllama:
+    def __init__(self, latency_ms: float = 500, tokens_per_sec: float = 40, error_rate: float = 0.0,
+                 seed: int = 0, words_per_section: int = 60):
+        self.latency = latency_ms / 1000
+        self.token_delay = 1 / tokens_per_sec if tokens_per_sec > 0 else 0
+        self.error_rate = error_rate
+        self.words_per_section = words_per_section
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.active = 0
+        self.peak_active = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/api/generate', self.generate)
+        return app
+
+    async def generate(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503, text="injected failure")
+
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            tokens = re.findall(r"\S+\s*", fake_document(body.get('prompt', ''), self.rng, self.words_per_section))
+            await asyncio.sleep(self.latency)
+            eval_duration = int(self.token_delay * len(tokens) * 1e9)
+            if not body.get('stream', True):
+                await asyncio.sleep(self.token_delay * len(tokens))
+                return web.json_response({"model": body.get('model'), "response": "".join(tokens), "done": True,
+                                          "eval_count": len(tokens), "eval_duration": eval_duration})
+
+            response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await response.prepare(request)
+            for token in tokens:
+                await asyncio.sleep(self.token_delay)
+                await response.write((json.dumps({"response": token, "done": False}) + "\n").encode())
+            await response.write((json.dumps({"response": "", "done": True, "eval_count": len(tokens),
+                                               "eval_duration": eval_duration}) + "\n").encode())
+            return response
+        finally:
+            self.active -= 1
+
+async def start(server: FakeOllama, host: str = '127.0.0.1', port: int = 0) -> tuple:
+    """Start the server in the running loop; returns (runner, url). Port 0 picks a free port."""
+    runner = web.AppRunner(server.app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}/api/generate"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--latency-ms', type=float, default=500, help='delay before the first token')
+    parser.add_argument('--tokens-per-sec', type=float, default=40, help='token rate after the first token')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeOllama(args.latency_ms, args.tokens_per_sec, args.error_rate, args.seed)
+    print(f"Fake Ollama listening on http://{args.host}:{args.port}/api/generate")
+    web.run_app(server.app(), host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
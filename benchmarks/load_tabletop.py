@@ -0,0 +1,165 @@
+"""
+Load-test tabletop generation with simulated users against a fake (or real) Ollama.
+
+Every simulated user submits tabletop requests through the same FairScheduler and
+shared OllamaClient the bot uses, with requests spread over --guilds guilds. The
+report gives end-to-end latency, queue wait and time to first section (p50/p95/p99),
+throughput and error rates. By default an in-process fake Ollama server from
+fake_ollama.py answers the requests; pass --url to aim at a running server instead.
+
+Usage: python benchmarks/load_tabletop.py [--users 10] [--requests 2] [--mode stream|single|pipeline]
+       [--injects 3] [--workers 1] [--max-concurrent 2] [--latency-ms 500] [--tokens-per-sec 40]
+       [--error-rate 0] [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import ollama
+import scheduler
+import tabletop
+from fake_ollama import FakeOllama, start
+
+def percentile(values, pct):
+    """Nearest-rank percentile; 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+def summary(values):
+    return {f"p{pct}": round(percentile(values, pct), 3) for pct in (50, 95, 99)} | {
+        "max": round(max(values), 3) if values else 0.0}
+
+def request_data(user: int, injects: int):
+    return {
+        "day_time": "Monday morning",
+        "technologies": ["Fortinet", "Microsoft AD"],
+        "num_injects": injects,
+        "basis_type": "group",
+        "basis_id": f"G{user % 50:04d}",
+        "ttps": ["T1059", "T1071", "T1003"],
+        "context": "",
+    }
+
+async def generate(data, mode, first_section):
+    """One tabletop in the given mode; calls first_section() when the first content is ready."""
+    if mode == "single":
+        document = await tabletop.generate_document(data)
+        first_section()
+        if document.startswith("Error:"):
+            raise ollama.OllamaError(document)
+        return document
+    if mode == "pipeline":
+        async def on_section(section):
+            first_section()
+        document, failed = await tabletop.generate_pipelined(data, on_section=on_section)
+        if failed:
+            raise ollama.OllamaError(f"{failed} sections could not be generated")
+        return document
+    sections = []
+    async for section in tabletop.stream_sections(data):
+        first_section()
+        sections.append(section)
+    return "".join(sections)
+
+async def simulated_user(user, args, jobs, results):
+    for _ in range(args.requests):
+        submitted = time.monotonic()
+        first = []
+
+        def first_section():
+            if not first:
+                first.append(time.monotonic())
+
+        data = request_data(user, args.injects)
+        try:
+            job = await jobs.submit(user, user % args.guilds, lambda: generate(data, args.mode, first_section))
+        except scheduler.QueueFullError:
+            results.append({"outcome": "rejected"})
+            continue
+        try:
+            await job.result()
+            outcome = "ok"
+        except Exception:
+            outcome = "error"
+        finished = time.monotonic()
+        results.append({
+            "outcome": outcome,
+            "latency": finished - submitted,
+            "wait": (job.started or finished) - submitted,
+            "first_section": (first[0] - submitted) if first else None,
+        })
+
+async def run(args):
+    runner = server = None
+    url = args.url
+    if url is None:
+        server = FakeOllama(args.latency_ms, args.tokens_per_sec, args.error_rate, args.seed)
+        runner, url = await start(server)
+    ollama._client = ollama.OllamaClient(url=url, max_concurrent=args.max_concurrent, retries=args.retries,
+                                         backoff=0.1)
+    jobs = scheduler.FairScheduler("load", workers=args.workers, max_queued=args.max_queued,
+                                   max_per_user=1)
+    results = []
+    started = time.monotonic()
+    await asyncio.gather(*(simulated_user(user, args, jobs, results) for user in range(args.users)))
+    elapsed = time.monotonic() - started
+    await jobs.shutdown()
+    client_stats = ollama.get_client().stats()
+    await ollama.close_client()
+    if runner is not None:
+        await runner.cleanup()
+
+    ok = [r for r in results if r["outcome"] == "ok"]
+    finished = [r for r in results if r["outcome"] != "rejected"]
+    return {
+        "config": {key: value for key, value in vars(args).items() if key != "json"},
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": sum(r["outcome"] == "error" for r in results),
+        "rejected": sum(r["outcome"] == "rejected" for r in results),
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_min": round(len(ok) / elapsed * 60, 2) if elapsed else 0.0,
+        "latency_s": summary([r["latency"] for r in ok]),
+        "queue_wait_s": summary([r["wait"] for r in finished]),
+        "first_section_s": summary([r["first_section"] for r in ok if r["first_section"] is not None]),
+        "ollama_client": client_stats,
+        "server": {"requests": server.requests, "injected_errors": server.errors,
+                   "peak_concurrency": server.peak_active} if server else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=10, help='concurrent simulated users')
+    parser.add_argument('--requests', type=int, default=2, help='tabletops per user, one after another')
+    parser.add_argument('--guilds', type=int, default=3, help='guilds the users are spread over')
+    parser.add_argument('--mode', choices=('stream', 'single', 'pipeline'), default='stream')
+    parser.add_argument('--injects', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=scheduler.TABLETOP_WORKERS, help='scheduler workers')
+    parser.add_argument('--max-queued', type=int, default=scheduler.TABLETOP_MAX_QUEUED)
+    parser.add_argument('--max-concurrent', type=int, default=ollama.OLLAMA_MAX_CONCURRENT,
+                        help='concurrent Ollama requests allowed by the client')
+    parser.add_argument('--retries', type=int, default=ollama.OLLAMA_RETRIES)
+    parser.add_argument('--url', help='existing Ollama (or fake) generate endpoint; default starts a fake')
+    parser.add_argument('--latency-ms', type=float, default=500)
+    parser.add_argument('--tokens-per-sec', type=float, default=40)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,22 @@ from discord import app_commands
 from dotenv import load_dotenv
 import mitre
 import graph
+import graph_cache
+import attack_kb
+import search_index
+import workers
+import asyncio
 import textwrap
-from typing import List, Dict
+import time
+import math
+from typing import Callable, List, Dict, Tuple
 import logging
-import aiohttp
+import ollama
+import tabletop
+import tabletop_cache
+import scheduler
+import db
+import metrics
 import io
 
 # Set up logging
@@ -17,11 +29,16 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
-OLLAMA_URL = os.getenv("OLLAMA_URL")
+KB_LOAD_TIMEOUT = 300.0
+SEARCH_PAGE_SIZE = 25
+TABLETOP_STREAM = os.getenv("TABLETOP_STREAM", "1").lower() in ("1", "true", "yes")
+TABLETOP_EDIT_INTERVAL = 2.0  # Seconds between progress edits, well inside Discord's edit rate limit
+TABLETOP_PREVIEW_CHARS = 1500
 
 # Set up Discord client with intents
 intents = discord.Intents.default()
 intents.message_content = True
+intents.members = os.getenv("DISCORD_MEMBERS_INTENT", "0").lower() in ("1", "true", "yes")
 client = discord.Client(intents=intents)
 tree = app_commands.CommandTree(client)
 
@@ -32,17 +49,21 @@ def split_message(text: str, max_length: int = 1500) -> List[str]:
 
 # Unified response sender
 async def send_response(interaction: discord.Interaction, message: str):
-    """Send a response, splitting if necessary."""
+    """Send a response, splitting if necessary. Works before or after the interaction is deferred."""
     chunks = split_message(message)
-    if len(chunks) == 1:
-        await interaction.response.send_message(chunks[0])
+    await reply(interaction, chunks[0])
+    for chunk in chunks[1:]:
+        await interaction.followup.send(chunk)
+
+async def reply(interaction: discord.Interaction, message: str):
+    """Reply to an interaction whether or not it has already been responded to."""
+    if interaction.response.is_done():
+        await interaction.followup.send(message)
     else:
-        await interaction.response.send_message(chunks[0])
-        for chunk in chunks[1:]:
-            await interaction.followup.send(chunk)
+        await interaction.response.send_message(message)
 
 # Command handlers
-async def handle_ttp(interaction: discord.Interaction, method: str, query: str):
+async def handle_ttp(interaction: discord.Interaction, method: str, query: str, page: int = 1):
     method = method.lower()
     if method not in ['id', 'search', 'detail']:
         await interaction.response.send_message("Invalid method. Use `id`, `search`, or `detail`.")
@@ -50,53 +71,119 @@ async def handle_ttp(interaction: discord.Interaction, method: str, query: str):
     if not query:
         await interaction.response.send_message("Please provide a query.")
         return
-    if method == 'id':
-        result = mitre.search_by_ttp_id(query)
-    elif method == 'search':
-        result = mitre.search_by_name_or_description(query)
-    else:
-        result = mitre.get_technique_details(query)
-    if not result:
-        await interaction.response.send_message(f"No technique found for: {query.upper()}")
-        return
-    if method == 'detail':
-        msg = f"TTP ID: {result['ttp_id']}\nName: {result['name']}\nDescription: {result['description']}\n---------\n"
-    else:
-        msg = '\n'.join(f"{res['ttp_id']} - {res['name']}" for res in result)
-    await send_response(interaction, msg)
+    with metrics.trace(f"attack.ttp.{method}", query=query) as trace:
+        # Discord drops interactions not acknowledged within 3s; a query may take longer
+        with trace.stage("discord"):
+            await interaction.response.defer(thinking=True)
+        with trace.stage("db"):
+            if method == 'id':
+                result = await workers.run_db(mitre.search_by_ttp_id, query)
+            elif method == 'search':
+                result, total = await workers.run_db(mitre.search_techniques, query, page, SEARCH_PAGE_SIZE)
+            else:
+                result = await workers.run_db(mitre.get_technique_details, query)
+        if not result:
+            trace.outcome = "not_found"
+            with trace.stage("discord"):
+                await interaction.followup.send(f"No technique found for: {query.upper()}")
+            return
+        if method == 'detail':
+            trace.rows(1)
+            msg = f"TTP ID: {result['ttp_id']}\nName: {result['name']}\nDescription: {result['description']}\n---------\n"
+        else:
+            trace.rows(len(result))
+            msg = '\n'.join(f"{res['ttp_id']} - {res['name']}" for res in result)
+            if method == 'search' and total > page * SEARCH_PAGE_SIZE:
+                msg += f"\n(Page {page} of {math.ceil(total / SEARCH_PAGE_SIZE)}, use `page:{page + 1}` for more results)"
+        trace.upload(len(msg.encode('utf-8')))
+        with trace.stage("discord"):
+            await send_response(interaction, msg)
+
+KIND_PLURALS = {'group': 'groups', 'software': 'software', 'campaign': 'campaigns'}
+
+async def handle_search(interaction: discord.Interaction, kind: str, search: Callable, query: str, fields: List[tuple]):
+    """Shared body of the group, software and campaign lookups: fields are (label, result key) pairs."""
+    with metrics.trace(f"attack.{kind}", query=query) as trace:
+        with trace.stage("discord"):
+            await interaction.response.defer(thinking=True)
+        with trace.stage("db"):
+            results = await workers.run_db(search, query)
+        if not results:
+            trace.outcome = "not_found"
+            with trace.stage("discord"):
+                await interaction.followup.send(f"No {KIND_PLURALS[kind]} found for query: {query}")
+            return
+        trace.rows(len(results))
+        msg = ''.join(''.join(f"{label}: {r[key]}\n" for label, key in fields) for r in results)
+        trace.upload(len(msg.encode('utf-8')))
+        with trace.stage("discord"):
+            await send_response(interaction, msg)
 
 async def handle_group(interaction: discord.Interaction, query: str):
-    results = mitre.search_groups(query)
-    if not results:
-        await interaction.response.send_message(f"No groups found for query: {query}")
-        return
-    msg = ''.join(f"Group ID: {r['group_id']}\nName: {r['name']}\nAttack ID: {r['attack_id']}\nDescription: {r['description']}\n" for r in results)
-    await send_response(interaction, msg)
+    await handle_search(interaction, 'group', mitre.search_groups, query, [
+        ("Group ID", 'group_id'), ("Name", 'name'), ("Attack ID", 'attack_id'), ("Description", 'description')])
 
 async def handle_software(interaction: discord.Interaction, query: str):
-    results = mitre.search_software(query)
-    if not results:
-        await interaction.response.send_message(f"No software found for query: {query}")
-        return
-    msg = ''.join(f"Software ID: {r['software_id']}\nName: {r['name']}\nAttack ID: {r['attack_id']}\nDescription: {r['description']}\n" for r in results)
-    await send_response(interaction, msg)
+    await handle_search(interaction, 'software', mitre.search_software, query, [
+        ("Software ID", 'software_id'), ("Name", 'name'), ("Attack ID", 'attack_id'), ("Description", 'description')])
 
 async def handle_campaign(interaction: discord.Interaction, query: str):
-    results = mitre.search_campaigns(query)
-    if not results:
-        await interaction.response.send_message(f"No campaigns found for query: {query}")
+    await handle_search(interaction, 'campaign', mitre.search_campaigns, query, [
+        ("Campaign ID", 'campaign_id'), ("Name", 'name'), ("Attack ID", 'attack_id'), ("Description", 'description')])
+
+async def handle_graph(interaction: discord.Interaction, query: str, depth: int = 1, types: str = None, fmt: str = "png"):
+    fmt = fmt.lower()
+    if fmt not in graph.GRAPH_FORMATS:
+        await interaction.response.send_message(f"Invalid graph method. Use {', '.join(f'`{f}`' for f in graph.GRAPH_FORMATS)}.")
         return
-    msg = ''.join(f"Campaign ID: {r['campaign_id']}\nName: {r['name']}\nAttack ID: {r['attack_id']}\nDescription: {r['description']}\n" for r in results)
-    await send_response(interaction, msg)
-
-async def handle_graph(interaction: discord.Interaction, query: str):
-    await interaction.response.send_message("Generating graph, please wait...", ephemeral=True)
-    img_buffer = graph.generate_graph(query)
-    if img_buffer:
-        file = discord.File(img_buffer, filename=f"{query}_chart.png")
-        await interaction.followup.send(f"Chart for {query}:", file=file)
-    else:
-        await interaction.followup.send(f"No linked items found for {query}")
+    entity_types = {t.strip().lower() for t in types.split(',') if t.strip()} if types else None
+    unknown = (entity_types or set()) - set(graph.GRAPH_ENTITY_TYPES)
+    if unknown:
+        await interaction.response.send_message(f"Unknown entity type(s): {', '.join(sorted(unknown))}. Use {', '.join(graph.GRAPH_ENTITY_TYPES)}.")
+        return
+    with metrics.trace("attack.graph", query=query, depth=depth, fmt=fmt) as trace:
+        with trace.stage("discord"):
+            await interaction.response.send_message("Generating graph, please wait...", ephemeral=True)
+        with trace.stage("cache"):
+            version = await workers.run_db(attack_kb.current_data_version)
+            options = {"depth": depth, "types": sorted(entity_types or ()), "fmt": fmt}
+            key = graph_cache.make_key(query, version, **options)
+            note_key = graph_cache.make_key(query, version, part="note", **options)
+            output = await workers.run_db(graph_cache.cache.get, key)
+        trace.details["cache"] = "miss" if output is None else "hit"
+        if output is None:
+            with trace.stage("db"):
+                data = await workers.run_db(graph.expand_graph, query, depth, entity_types)
+            if not data:
+                trace.outcome = "not_found"
+                with trace.stage("discord"):
+                    await interaction.followup.send(f"No linked items found for {query}")
+                return
+            trace.rows(len(data[0]) + len(data[1]))
+            if fmt in graph.EXPORT_FORMATS:
+                # The viewer's browser does the layout, so there is nothing to summarise or rasterise
+                note = ""
+                with trace.stage("export"):
+                    output = await workers.run_db(graph.export_graph, *data, fmt=fmt, title=f"ATT&CK graph for {query}")
+            else:
+                with trace.stage("summarize"):
+                    entities, relationships, collapsed = graph.summarize_graph(*data)
+                    note = graph.describe_collapsed(collapsed)
+                with trace.stage("render"):
+                    output, timings = await workers.run_render(graph.render_graph_timed, entities, relationships, fmt=fmt)
+                for stage, seconds in timings.items():
+                    trace.record(stage, seconds)
+            with trace.stage("cache"):
+                await workers.run_db(graph_cache.cache.put, key, output)
+                await workers.run_db(graph_cache.cache.put, note_key, note.encode('utf-8'))
+        else:
+            with trace.stage("cache"):
+                note = (await workers.run_db(graph_cache.cache.get, note_key) or b"").decode('utf-8')
+        logger.debug(f"Graph cache: {graph_cache.cache.stats()}")
+        trace.upload(len(output))
+        file = discord.File(io.BytesIO(output), filename=f"{query}_chart.{fmt}")
+        with trace.stage("discord"):
+            await interaction.followup.send(f"Chart for {query}:" + (f"\n{note}" if note else ""), file=file)
 
 # Tabletop Command Logic
 async def collect_tabletop_data(user: discord.User, dm_channel: discord.DMChannel) -> Dict:
@@ -114,14 +201,14 @@ async def collect_tabletop_data(user: discord.User, dm_channel: discord.DMChanne
     msg = await client.wait_for('message', check=check, timeout=300.0)
     data['technologies'] = [tech.strip() for tech in msg.content.split(',')]
 
-    await dm_channel.send("How many injects do you want? (Enter a number):")
+    await dm_channel.send(f"How many injects do you want? (Enter a number up to {tabletop.TABLETOP_MAX_INJECTS}):")
     while True:
         msg = await client.wait_for('message', check=check, timeout=300.0)
         try:
             data['num_injects'] = int(msg.content.strip())
-            if data['num_injects'] > 0:
+            if 0 < data['num_injects'] <= tabletop.TABLETOP_MAX_INJECTS:
                 break
-            await dm_channel.send("Please enter a positive number.")
+            await dm_channel.send(f"Please enter a number between 1 and {tabletop.TABLETOP_MAX_INJECTS}.")
         except ValueError:
             await dm_channel.send("Invalid input. Please enter a number.")
 
@@ -138,7 +225,7 @@ async def collect_tabletop_data(user: discord.User, dm_channel: discord.DMChanne
         data['basis_type'] = 'ttp_chain'
         data['ttps'] = [ttp.strip() for ttp in basis_input.split(',')]
     else:
-        entities, _ = graph.fetch_linked_entities(basis_input) or ({}, [])
+        entities, _ = await workers.run_db(graph.fetch_linked_entities, basis_input) or ({}, [])
         if not entities:
             await dm_channel.send(f"No data found for {basis_input}. Defaulting to empty TTP list.")
             data['ttps'] = []
@@ -153,46 +240,83 @@ async def collect_tabletop_data(user: discord.User, dm_channel: discord.DMChanne
 
     return data
 
-async def generate_tabletop_document(data: Dict) -> str:
-    """Generate tabletop document by querying Ollama and return as Markdown."""
-    prompt = (
-        "Generate a tabletop facilitation document in Markdown format for a cybersecurity exercise with the following details:\n"
-        f"- Day and Time: {data['day_time']}\n"
-        f"- Technologies in Use: {', '.join(data['technologies'])}\n"
-        f"- Number of Injects: {data['num_injects']}\n"
-        f"- Attack Basis: {data['basis_type']} ({data.get('basis_id', 'TTP Chain')})\n"
-        f"- TTPs Involved: {', '.join(data['ttps']) if data['ttps'] else 'None'}\n\n"
-        "Include:\n"
-        "1. A short narrative of the event (200-300 words) under a `## Narrative` heading.\n"
-        "2. Each inject with a corresponding sample log file from a relevant system (e.g., Fortinet, Microsoft AD) under `## Injects` with subheadings `### Inject X`.\n"
-        "3. Facilitation tips under a `## Facilitation Tips` heading.\n"
-        "Use Markdown syntax (e.g., `##`, `###`, `-` for lists, ``` for code blocks)."
+async def send_tabletop_file(dm_channel: discord.DMChannel, document: str):
+    """Send the document as a Markdown file and sign off."""
+    md_buffer = io.BytesIO(document.encode('utf-8'))
+    md_file = discord.File(md_buffer, filename="tabletop_facilitation_guide.md")
+    await dm_channel.send("Here's your facilitation guide as a downloadable Markdown file:", file=md_file)
+
+    await dm_channel.send("Document generated! Let me know if you need adjustments.")
+
+async def pipeline_tabletop_document(data: Dict, dm_channel: discord.DMChannel) -> Tuple[str, int]:
+    """
+    Generate a large tabletop section by section, posting each section once it and those
+    before it are done. Returns (document, failed) like tabletop.generate_pipelined.
+    """
+    status = await dm_channel.send(
+        f"Generating your tabletop document: the narrative first, then {data['num_injects']} injects in parallel..."
     )
 
-    async with aiohttp.ClientSession() as session:
-        payload = {
-            "model": "mistral",
-            "prompt": prompt,
-            "stream": False
-        }
-        try:
-            async with session.post(OLLAMA_URL, json=payload) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result.get('response', 'Error: No response from Ollama')
-                else:
-                    return f"Error: Ollama returned status {response.status}"
-        except Exception as e:
-            return f"Error connecting to Ollama: {str(e)}"
+    async def post(section: str):
+        for chunk in split_message(section, max_length=2000):
+            await dm_channel.send(chunk)
+
+    document, failed = await tabletop.generate_pipelined(data, on_section=post)
+    if failed:
+        await status.edit(content=f"Tabletop document complete, but {failed} sections could not be generated.")
+    else:
+        await status.edit(content="Tabletop document complete.")
+    return document, failed
+
+async def stream_tabletop_document(data: Dict, dm_channel: discord.DMChannel) -> str:
+    """
+    Stream the tabletop document into the DM: each finished section is posted as it
+    completes, and a progress message is edited with a preview of the section being written.
+    If the model fails mid-stream the status says so and an "Error: ..." document is returned.
+    """
+    status = await dm_channel.send("Generating your tabletop document, please wait...")
+    buffer = tabletop.MarkdownSectionBuffer()
+    sections = []
+
+    async def show_progress():
+        shown = ""
+        while True:
+            await asyncio.sleep(TABLETOP_EDIT_INTERVAL)
+            preview = buffer.pending.strip()[-TABLETOP_PREVIEW_CHARS:]
+            if preview and preview != shown:
+                shown = preview
+                try:
+                    await status.edit(content=f"Writing section {len(sections) + 1}...\n{preview}")
+                except discord.HTTPException as e:
+                    logger.warning(f"Could not update tabletop progress: {e}")
+
+    progress = asyncio.create_task(show_progress())
+    try:
+        async for section in tabletop.stream_sections(data, buffer):
+            sections.append(section)
+            for chunk in split_message(section, max_length=2000):
+                await dm_channel.send(chunk)
+    except ollama.OllamaError as e:
+        logger.error(f"Tabletop stream failed after {len(sections)} sections: {e}")
+        await status.edit(content=f"Tabletop generation failed after {len(sections)} sections: {e}")
+        return f"Error: {e}"
+    finally:
+        progress.cancel()
+    await status.edit(content=f"Tabletop document complete ({len(sections)} sections).")
+    return "".join(sections)
 
 # Define slash commands
 @tree.command(name="attack", description="Query MITRE ATT&CK data")
 @app_commands.describe(
     query_type="Type of query (ttp, group, software, campaign, graph)",
-    method="For TTP: id, search, or detail (optional)",
-    query="The ID or name to search for"
+    method="For TTP: id, search, or detail. For graph: png (default), svg, html or json",
+    query="The ID or name to search for",
+    page="Result page for TTP search (default 1)",
+    depth="Hops to expand for graph (1-3, default 1)",
+    types="For graph: comma-separated entity types to include (technique, group, software, campaign)"
 )
-async def attack(interaction: discord.Interaction, query_type: str, method: str = None, query: str = None):
+async def attack(interaction: discord.Interaction, query_type: str, method: str = None, query: str = None, page: int = 1,
+                 depth: app_commands.Range[int, 1, graph.MAX_GRAPH_DEPTH] = 1, types: str = None):
     logger.info("Command executed: attack")
     query_type = query_type.lower()
     handlers = {
@@ -205,19 +329,29 @@ async def attack(interaction: discord.Interaction, query_type: str, method: str
     if query_type not in handlers:
         await interaction.response.send_message("Invalid query type. Use `ttp`, `group`, `software`, `campaign`, or `graph`.")
         return
-    if query_type == 'ttp':
-        if not method:
-            await interaction.response.send_message("For TTP, specify a method: `id`, `search`, or `detail`.")
-            return
-        if not query:
-            await interaction.response.send_message("Please provide a query for TTP.")
-            return
-        await handle_ttp(interaction, method, query)
-    else:
-        if not query:
-            await interaction.response.send_message("Please provide a query.")
-            return
-        await handlers[query_type](interaction, query)
+    try:
+        if query_type == 'ttp':
+            if not method:
+                await interaction.response.send_message("For TTP, specify a method: `id`, `search`, or `detail`.")
+                return
+            if not query:
+                await interaction.response.send_message("Please provide a query for TTP.")
+                return
+            await handle_ttp(interaction, method, query, page)
+        elif query_type == 'graph':
+            if not query:
+                await interaction.response.send_message("Please provide a query.")
+                return
+            await handle_graph(interaction, query, depth, types, method or "png")
+        else:
+            if not query:
+                await interaction.response.send_message("Please provide a query.")
+                return
+            await handlers[query_type](interaction, query)
+    except workers.BusyError:
+        await reply(interaction, workers.BUSY_MESSAGE)
+    except asyncio.TimeoutError:
+        await reply(interaction, workers.TIMEOUT_MESSAGE)
 
 @tree.command(name="help", description="Show available commands")
 async def help_command(interaction: discord.Interaction):
@@ -225,15 +359,58 @@ async def help_command(interaction: discord.Interaction):
     msg = (
         "**/attack <query_type> [method] <query>** - Query MITRE ATT&CK data\n"
         "- `query_type`: `ttp`, `group`, `software`, `campaign`, `graph`\n"
-        "- `method` (for `ttp` only): `id`, `search`, `detail`\n"
+        "- `method`: for `ttp` one of `id`, `search`, `detail`; for `graph` one of `png`, `svg`, `html` (interactive), `json`\n"
         "- `query`: ID (e.g., T1059) or name\n"
+        "- `page` (for `ttp search` only): result page, ranked by relevance\n"
+        "- `depth`, `types` (for `graph` only): hops to expand (1-3) and entity types to include\n"
         "**/help** - Display this message\n"
-        "**/create-tabletop** - Start a DM to create a tabletop exercise document"
+        "**/create-tabletop [regenerate]** - Start a DM to create a tabletop exercise document (`regenerate` skips the cache)\n"
+        "**/reload-attack** - Reload the in-memory ATT&CK snapshot (admins only)\n"
+        "**/tabletop-queue** - Show tabletop queue depth and wait times (admins only)"
     )
     await interaction.response.send_message(msg)
 
+@tree.command(name="reload-attack", description="Reload the in-memory ATT&CK snapshot from the database")
+@app_commands.default_permissions(administrator=True)
+async def reload_attack(interaction: discord.Interaction):
+    logger.info("Command executed: reload-attack")
+    search_index.reset_index()
+    mitre.clear_caches()
+    if not attack_kb.ATTACK_KB_ENABLED:
+        await interaction.response.send_message("Search index cleared. The in-memory ATT&CK snapshot is disabled (set ATTACK_KB=1).", ephemeral=True)
+        return
+    await interaction.response.send_message("Reloading ATT&CK data, please wait...", ephemeral=True)
+    try:
+        kb = await workers.run_db(attack_kb.reload_kb, timeout=KB_LOAD_TIMEOUT)
+    except workers.BusyError:
+        await interaction.followup.send(workers.BUSY_MESSAGE, ephemeral=True)
+        return
+    except asyncio.TimeoutError:
+        await interaction.followup.send("The reload timed out; if it had already started it may still finish in the background. Check the logs.", ephemeral=True)
+        return
+    if kb:
+        await interaction.followup.send(f"ATT&CK snapshot loaded with {len(kb.entity_types)} entities.", ephemeral=True)
+    elif attack_kb.get_kb() is not None:
+        await interaction.followup.send("Reload failed, the previous ATT&CK snapshot is still being served. Check the logs.", ephemeral=True)
+    else:
+        await interaction.followup.send("Reload failed, queries are using the database directly. Check the logs.", ephemeral=True)
+
+@tree.command(name="tabletop-queue", description="Show tabletop generation queue metrics")
+@app_commands.default_permissions(administrator=True)
+async def tabletop_queue(interaction: discord.Interaction):
+    logger.info("Command executed: tabletop-queue")
+    stats = scheduler.tabletop_scheduler.stats()
+    msg = (
+        f"Queued: {stats['queued']}, running: {stats['running']}\n"
+        f"Wait time (s): avg {stats['wait_avg']}, p95 {stats['wait_p95']}, max {stats['wait_max']}\n"
+        f"Submitted {stats['submitted']}, completed {stats['completed']}, failed {stats['failed']}, "
+        f"cancelled {stats['cancelled']}, rejected {stats['rejected']}"
+    )
+    await interaction.response.send_message(msg, ephemeral=True)
+
 @tree.command(name="create-tabletop", description="Start a DM to create a tabletop exercise document")
-async def create_tabletop(interaction: discord.Interaction):
+@app_commands.describe(regenerate="Generate a fresh document even if an identical one is cached")
+async def create_tabletop(interaction: discord.Interaction, regenerate: bool = False):
     logger.info("Command executed: create-tabletop")
     """Initiate a DM to gather data and generate a tabletop document with Markdown download."""
     user = interaction.user
@@ -246,21 +423,89 @@ async def create_tabletop(interaction: discord.Interaction):
         # Collect data
         data = await collect_tabletop_data(user, dm_channel)
 
-        # Generate document
-        await dm_channel.send("Generating your tabletop document, please wait...")
-        document = await generate_tabletop_document(data)
+        # Timed from here on: the questions above wait on the user, not the bot
+        with metrics.trace("create_tabletop", injects=data['num_injects']) as trace:
+            # Identical answers with the same model and prompt are served from the cache
+            pipelined = tabletop.use_pipeline(data)
+            prompt_version = tabletop.PROMPT_VERSION + ("-pipeline" if pipelined else "")
+            cache_key = tabletop_cache.make_key(data, ollama.get_client().model, prompt_version)
+            with trace.stage("cache"):
+                cached = None if regenerate else await workers.run_db(tabletop_cache.cache.get, cache_key)
+            if cached is not None:
+                trace.outcome = "cached"
+                trace.upload(len(cached.encode('utf-8')))
+                with trace.stage("discord"):
+                    await dm_channel.send("An identical tabletop was generated recently, here it is (use `regenerate` for a fresh one):")
+                    for chunk in split_message(cached, max_length=2000):
+                        await dm_channel.send(chunk)
+                    await send_tabletop_file(dm_channel, cached)
+                return
 
-        # Send document as text
-        chunks = split_message(document, max_length=2000)
-        for chunk in chunks:
-            await dm_channel.send(chunk)
+            # Ground the prompt in ATT&CK details for every TTP, fetched in one batch
+            with trace.stage("context"):
+                data['context'] = await workers.run_db(tabletop.retrieve_context, data)
+            trace.rows(len(data['context'].splitlines()) if data['context'] else 0)
+
+            # Generate document, streaming it section by section where enabled
+            usage = ollama.Usage()
+
+            async def generate():
+                """Returns (document, complete); incomplete documents are sent but not cached."""
+                with ollama.track_usage(usage):
+                    if pipelined:
+                        document, failed = await pipeline_tabletop_document(data, dm_channel)
+                        return document, not failed
+                    if TABLETOP_STREAM:
+                        document = await stream_tabletop_document(data, dm_channel)
+                        return document, not document.startswith("Error:")
+                    await dm_channel.send("Generating your tabletop document, please wait...")
+                    document = await tabletop.generate_document(data)
+
+                    # Send document as text
+                    chunks = split_message(document, max_length=2000)
+                    for chunk in chunks:
+                        await dm_channel.send(chunk)
+                    return document, not document.startswith("Error:")
+
+            queue_message = None
+
+            async def show_position(position: int):
+                nonlocal queue_message
+                text = f"You're number {position} in the tabletop queue. Reply `cancel` to give up your place."
+                if queue_message is None:
+                    queue_message = await dm_channel.send(text)
+                else:
+                    await queue_message.edit(content=text)
 
-        # Send document as Markdown file
-        md_buffer = io.BytesIO(document.encode('utf-8'))
-        md_file = discord.File(md_buffer, filename="tabletop_facilitation_guide.md")
-        await dm_channel.send("Here's your facilitation guide as a downloadable Markdown file:", file=md_file)
+            try:
+                job = await scheduler.tabletop_scheduler.submit(user.id, interaction.guild_id, generate, show_position)
+            except scheduler.QueueFullError as e:
+                trace.outcome = "rejected"
+                await dm_channel.send(e.message)
+                return
+            try:
+                document, complete = await job.result()
+            except asyncio.CancelledError:
+                if not job.future.cancelled():
+                    raise
+                trace.outcome = "cancelled"
+                await dm_channel.send("Your tabletop request was cancelled.")
+                return
+            finally:
+                if job.started is not None:
+                    trace.record("queue", job.started - job.submitted)
+                    trace.record("generate", time.monotonic() - job.started)
+                trace.tokens(usage.tokens, usage.seconds)
+                logger.info(f"Tabletop queue: {scheduler.tabletop_scheduler.stats()}")
+            if complete and document.strip():
+                with trace.stage("cache"):
+                    await workers.run_db(tabletop_cache.cache.put, cache_key, document)
+            else:
+                trace.outcome = "model_error"
 
-        await dm_channel.send("Document generated! Let me know if you need adjustments.")
+            trace.upload(len(document.encode('utf-8')))
+            with trace.stage("discord"):
+                await send_tabletop_file(dm_channel, document)
     except discord.errors.Forbidden:
         await interaction.response.send_message("I can't send you a DM. Please enable DMs from server members.", ephemeral=True)
     except Exception as e:
@@ -272,6 +517,11 @@ async def create_tabletop(interaction: discord.Interaction):
 @client.event
 async def on_ready():
     logger.info(f'{client.user} has connected to Discord!')
+    if attack_kb.ATTACK_KB_ENABLED and attack_kb.get_kb() is None:
+        try:
+            await workers.run_db(attack_kb.load_kb, timeout=KB_LOAD_TIMEOUT)
+        except (workers.BusyError, asyncio.TimeoutError) as e:
+            logger.error(f"ATT&CK snapshot not loaded at startup, queries use the database: {e!r}")
     try:
         # Log all currently registered commands before syncing
         pre_commands = tree.get_commands()
@@ -293,6 +543,38 @@ async def on_message(message):
         return
     if message.content == "ping":
         await message.channel.send("pong")
+    elif isinstance(message.channel, discord.DMChannel) and message.content.strip().lower() == "cancel":
+        if scheduler.tabletop_scheduler.cancel_user(message.author.id):
+            logger.info(f"Tabletop request cancelled by user {message.author.id}")
+
+@client.event
+async def on_member_remove(member: discord.Member):
+    # Only delivered when the members intent is enabled (DISCORD_MEMBERS_INTENT=1)
+    cancelled = scheduler.tabletop_scheduler.cancel_user(member.id, member.guild.id)
+    if cancelled:
+        logger.info(f"Cancelled {cancelled} tabletop request(s) for departed member {member.id}")
+
+# Existing counters, exported as gauges on the metrics endpoint
+metrics.register_stats("bot_graph_cache", graph_cache.cache.stats)
+metrics.register_stats("bot_tabletop_queue", scheduler.tabletop_scheduler.stats)
+metrics.register_stats("bot_tabletop_cache", tabletop_cache.cache.stats)
+metrics.register_stats("bot_ollama", lambda: ollama.get_client().stats())
+metrics.register_stats("bot_db_lane", workers.db_lane.stats)
+metrics.register_stats("bot_render_lane", workers.render_lane.stats)
+
+async def main():
+    """Run the bot, then release the metrics endpoint, Ollama session, database pool and worker pools."""
+    async with client:
+        await metrics.start_server()
+        try:
+            await client.start(TOKEN)
+        finally:
+            await metrics.stop_server()
+            await scheduler.tabletop_scheduler.shutdown()
+            await ollama.close_client()
+            db.close_pool()
+            workers.shutdown()
 
-# Run the bot
-client.run(TOKEN)
\ No newline at end of file
+# Run the bot (guarded so render worker processes can import this module safely)
+if __name__ == "__main__":
+    asyncio.run(main())
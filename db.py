@@ -0,0 +1,216 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import mysql.connector
+from mysql.connector import errors
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+DB_HOST = os.getenv("DB_HOST")
+DB_USER = os.getenv("DB_USER")
+DB_PASS = os.getenv("DB_PASS")
+DB = os.getenv("DB")
+
+# Pool tuning
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_IDLE_TIMEOUT = float(os.getenv("DB_POOL_IDLE_TIMEOUT", "300"))
+DB_POOL_PING_INTERVAL = float(os.getenv("DB_POOL_PING_INTERVAL", "30"))
+DATA_VERSION_TTL = float(os.getenv("DATA_VERSION_TTL", "30"))
+
+# Errors after which a connection is not handed out again
+BROKEN_CONNECTION_ERRORS = (errors.OperationalError, errors.InterfaceError)
+
+def db_config() -> Dict[str, Any]:
+    """Connection settings shared by every pooled connection."""
+    return {
+        "host": DB_HOST,
+        "user": DB_USER,
+        "password": DB_PASS,
+        "database": DB,
+        # Pooled connections are reused across commands, so never leave a
+        # snapshot open or unread rows behind for the next borrower.
+        "autocommit": True,
+        "buffered": True,
+    }
+
+def connect_to_db(
+    host: str = DB_HOST,
+    user: str = DB_USER,
+    password: str = DB_PASS,
+    database: str = DB
+) -> mysql.connector.connection.MySQLConnection:
+    """Establish a dedicated (unpooled) connection to the MySQL database."""
+    return mysql.connector.connect(
+        host=host,
+        user=user,
+        password=password,
+        database=database
+    )
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of MySQL connections.
+    Connections idle longer than `ping_interval` are health-checked before reuse,
+    and connections idle longer than `idle_timeout` are closed.
+    """
+
+    def __init__(self, size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT,
+                 idle_timeout: float = DB_POOL_IDLE_TIMEOUT,
+                 ping_interval: float = DB_POOL_PING_INTERVAL, **config):
+        self.size = size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self.config = config or db_config()
+        self._idle: List[tuple] = []  # (connection, last_used), most recently used last
+        self._open = 0
+        self._cond = threading.Condition()
+
+    def _reap_idle(self):
+        """Close connections that have sat idle past idle_timeout. Caller holds the lock."""
+        cutoff = time.monotonic() - self.idle_timeout
+        stale = [conn for conn, last_used in self._idle if last_used < cutoff]
+        if not stale:
+            return
+        self._idle = [(conn, last_used) for conn, last_used in self._idle if last_used >= cutoff]
+        self._open -= len(stale)
+        for conn in stale:
+            self._close_quietly(conn)
+        logger.debug(f"Reaped {len(stale)} idle database connection(s)")
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn, last_used: float) -> bool:
+        if time.monotonic() - last_used < self.ping_interval:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self, timeout: Optional[float] = None) -> mysql.connector.connection.MySQLConnection:
+        """Borrow a connection, waiting up to `timeout` seconds for one to free up."""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                self._reap_idle()
+                while not self._idle and self._open >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise errors.PoolError(f"No database connection available within {timeout}s")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    conn, last_used = None, None
+                    self._open += 1
+
+            if conn is None:
+                try:
+                    return mysql.connector.connect(**self.config)
+                except Exception:
+                    self._discard()
+                    raise
+            if self._healthy(conn, last_used):
+                return conn
+            # Dead connection: drop it and go round again for a fresh one
+            self._close_quietly(conn)
+            self._discard()
+
+    def release(self, conn, broken: bool = False):
+        """Return a borrowed connection to the pool."""
+        if broken:
+            self._close_quietly(conn)
+            self._discard()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self):
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that borrows a connection and always returns it."""
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except BROKEN_CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    def close_all(self):
+        """
+        Close every idle connection. Borrowed connections are not touched: they return
+        to the idle list on release and stay open until reaped or closed by a later call.
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+# Process-wide pool, created on first use
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+def connection():
+    """Borrow a connection from the process-wide pool (`with connection() as conn:`)."""
+    return get_pool().connection()
+
+_data_version: Optional[str] = None
+_data_version_checked = 0.0
+
+def data_version(max_age: float = DATA_VERSION_TTL) -> str:
+    """
+    The ATT&CK data version stamped by mitre2sql on every load or sync, re-read at
+    most every max_age seconds. Databases without attack_metadata report '0'.
+    """
+    global _data_version, _data_version_checked
+    if _data_version is not None and time.monotonic() - _data_version_checked < max_age:
+        return _data_version
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT value FROM attack_metadata WHERE name = 'data_version'")
+            row = cursor.fetchone()
+        except errors.ProgrammingError:
+            row = None
+    _data_version = row[0] if row else '0'
+    _data_version_checked = time.monotonic()
+    return _data_version
+
+def close_pool():
+    """Close idle connections in the process-wide pool (call on bot shutdown)."""
+    if _pool is not None:
+        _pool.close_all()
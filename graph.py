@@ -1,32 +1,20 @@
-import mysql.connector
 import networkx as nx
-import matplotlib.pyplot as plt
-import discord
-from discord import app_commands
-from typing import Dict, List, Optional
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from typing import Dict, List, Optional, Set
 import io
+import html
+import json
+from collections import defaultdict
 import re
 import matplotlib.patches as mpatches  # Added for legend
 import os
+import time
 from dotenv import load_dotenv
-
-DB_HOST = os.getenv("DB_HOST")
-DB_USER = os.getenv("DB_USER")
-DB_PASS = os.getenv("DB_PASS")
-DB = os.getenv("DB")
-def connect_to_db(
-    host: str = DB_HOST,
-    user: str = DB_USER,
-    password: str = DB_PASS,
-    database: str = DB
-) -> mysql.connector.connection.MySQLConnection:
-    """Establish a connection to the MySQL database."""
-    return mysql.connector.connect(
-        host=host,
-        user=user,
-        password=password,
-        database=database
-    )
+from db import connection
+from attack_kb import ENTITY_TABLES, get_kb, current_data_version
+import graph_cache
+from layouts import compute_layout
 
 # Validation functions
 def validate_id(query: str, prefix: str) -> bool:
@@ -34,122 +22,249 @@ def validate_id(query: str, prefix: str) -> bool:
     pattern = rf'^{prefix}\d{{4}}(\.\d{{3}})?$'
     return bool(re.match(pattern, query))
 
+# Load environment variables
+load_dotenv()
+
+# Graph expansion limits
+MAX_GRAPH_DEPTH = 3
+MAX_GRAPH_NODES = int(os.getenv("MAX_GRAPH_NODES", "300"))
+# Neighbourhoods bigger than this are summarised before drawing
+RENDER_MAX_NODES = int(os.getenv("RENDER_MAX_NODES", "40"))
+# Rendering options
+RENDER_FORMATS = ("png", "svg")
+EXPORT_FORMATS = ("html", "json")  # Laid out by the viewer, no server-side rendering
+GRAPH_FORMATS = RENDER_FORMATS + EXPORT_FORMATS
+GRAPH_DPI = int(os.getenv("GRAPH_DPI", "100"))
+EDGE_LABEL_LIMIT = int(os.getenv("GRAPH_EDGE_LABEL_LIMIT", "60"))
+NODE_COLORS = {
+    'technique': 'lightblue',
+    'group': 'lightgreen',
+    'software': 'lightcoral',
+    'campaign': 'lightyellow'
+}
+TYPE_PLURALS = {'technique': 'techniques', 'group': 'groups', 'software': 'software', 'campaign': 'campaigns'}
+GRAPH_ENTITY_TYPES = tuple(ENTITY_TABLES)
+
 # Fetch entity and relationships
 def fetch_linked_entities(query: str) -> Optional[tuple[Dict[str, str], List[tuple]]]:
-    """Fetch the focal entity and its linked entities from the database."""
-    conn = connect_to_db()
-    cursor = conn.cursor(dictionary=True)
-
-    # Determine entity type based on query format
-    entity_type = None
-    if validate_id(query, 'T'):
-        entity_type = 'technique'
-        table = 'techniques'
-        ref_table = 'external_references'
-        id_field = 'technique_id'
-    elif validate_id(query, 'G'):
-        entity_type = 'group'
-        table = 'groups'
-        ref_table = 'group_external_references'
-        id_field = 'group_id'
-    elif validate_id(query, 'S'):
-        entity_type = 'software'
-        table = 'software'
-        ref_table = 'software_external_references'
-        id_field = 'software_id'
-    elif validate_id(query, 'C'):
-        entity_type = 'campaign'
-        table = 'campaigns'
-        ref_table = 'campaign_external_references'
-        id_field = 'campaign_id'
-    else:
-        # Assume group name if not an ID
-        entity_type = 'group'
-        table = 'groups'
-        ref_table = 'group_external_references'
-        id_field = 'group_id'
-
-    # Fetch focal entity
-    if entity_type in ['technique', 'group', 'software', 'campaign'] and validate_id(query, entity_type[0].upper()):
-        query_sql = f"""
-            SELECT t.id AS attack_id, t.name, er.external_id AS attck_id
-            FROM {table} t
-            JOIN {ref_table} er ON t.id = er.{id_field}
-            WHERE er.source_name = 'mitre-attack'
-            AND er.external_id = %s
-        """
-        cursor.execute(query_sql, (query,))
-    else:  # Search by group name
-        query_sql = """
-            SELECT g.id AS attack_id, g.name, er.external_id AS attck_id
-            FROM groups g
-            LEFT JOIN group_external_references er ON g.id = er.group_id AND er.source_name = 'mitre-attack'
-            WHERE g.name LIKE %s
-        """
-        cursor.execute(query_sql, (f"%{query}%",))
-
-    focal_entity = cursor.fetchone()
-    if not focal_entity:
-        conn.close()
-        return None
-
-    entities = {focal_entity['attack_id']: {
-        'name': focal_entity['name'],
-        'attck_id': focal_entity['attck_id'] or focal_entity['attack_id'],
-        'type': entity_type
-    }}
-
-    # Fetch all relationships involving the focal entity
-    relationships = []
-    cursor.execute("""
-        SELECT source_id, target_id, relationship_type
-        FROM relationships
-        WHERE source_id = %s OR target_id = %s
-    """, (focal_entity['attack_id'], focal_entity['attack_id']))
-    for rel in cursor.fetchall():
-        relationships.append((rel['source_id'], rel['target_id'], rel['relationship_type']))
-
-    # Fetch all related entities
-    related_ids = set()
-    for src, tgt, _ in relationships:
-        related_ids.add(src)
-        related_ids.add(tgt)
-    related_ids.discard(focal_entity['attack_id'])  # Remove focal entity
-
-    for table, entity_type in [('techniques', 'technique'), ('groups', 'group'), ('software', 'software'), ('campaigns', 'campaign')]:
-        if related_ids:
-            ref_table = ('external_references' if table == 'techniques' else 
-                         'group_external_references' if table == 'groups' else 
-                         'software_external_references' if table == 'software' else 
-                         'campaign_external_references')
-            id_field = ('technique_id' if table == 'techniques' else 
-                       'group_id' if table == 'groups' else 
-                       'software_id' if table == 'software' else 
-                       'campaign_id')
-            query_related = f"""
-                SELECT t.id AS attack_id, t.name, er.external_id AS attck_id
+    """Fetch the focal entity and its directly linked entities."""
+    return expand_graph(query, depth=1, max_nodes=None)
+
+def _focal_type(query: str) -> Optional[str]:
+    """Entity type for an ATT&CK ID query, or None for a group name search."""
+    for prefix, entity_type in (('T', 'technique'), ('G', 'group'), ('S', 'software'), ('C', 'campaign')):
+        if validate_id(query, prefix):
+            return entity_type
+    return None
+
+def expand_graph(query: str, depth: int = 1, entity_types: Optional[Set[str]] = None,
+                 relationship_types: Optional[Set[str]] = None,
+                 max_nodes: Optional[int] = MAX_GRAPH_NODES) -> Optional[tuple[Dict[str, str], List[tuple]]]:
+    """
+    Breadth-first neighbourhood of the entity matching `query`, up to `depth` hops.
+    Only entities of `entity_types` and relationships of `relationship_types` are
+    followed (None means all), and expansion stops once `max_nodes` entities are found.
+    Each hop costs two queries against MySQL, or none when the snapshot is loaded.
+    """
+    depth = max(1, min(depth, MAX_GRAPH_DEPTH))
+    entity_type = _focal_type(query)
+
+    # Serve from the in-memory snapshot when it is loaded
+    kb = get_kb()
+    if kb is not None:
+        return kb.fetch_linked_entities(query, entity_type, depth, entity_types, relationship_types, max_nodes)
+
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+
+        # Fetch focal entity
+        if entity_type:
+            table, ref_table, id_field, _ = ENTITY_TABLES[entity_type]
+            query_sql = f"""
+                SELECT t.id AS attack_id, t.name, er.external_id AS attck_id{', t.tactic' if entity_type == 'technique' else ''}
                 FROM {table} t
-                LEFT JOIN {ref_table} er ON t.id = er.{id_field} AND er.source_name = 'mitre-attack'
-                WHERE t.id IN ({','.join(['%s'] * len(related_ids))})
+                JOIN {ref_table} er ON t.id = er.{id_field}
+                WHERE er.source_name = 'mitre-attack'
+                AND er.external_id = %s
             """
-            cursor.execute(query_related, tuple(related_ids))
-            for row in cursor.fetchall():
-                entities[row['attack_id']] = {
-                    'name': row['name'],
-                    'attck_id': row['attck_id'] or row['attack_id'],
-                    'type': entity_type
-                }
-
-    conn.close()
-    return entities, relationships
-
-def generate_graph(query: str) -> Optional[io.BytesIO]:
-    """Generate a graph image from the query and return it as a BytesIO object with a legend."""
-    data = fetch_linked_entities(query)
-    if not data:
-        return None
-
-    entities, relationships = data
+            cursor.execute(query_sql, (query,))
+        else:  # Search by group name
+            entity_type = 'group'
+            query_sql = """
+                SELECT g.id AS attack_id, g.name, er.external_id AS attck_id
+                FROM groups g
+                LEFT JOIN group_external_references er ON g.id = er.group_id AND er.source_name = 'mitre-attack'
+                WHERE g.name LIKE %s
+            """
+            cursor.execute(query_sql, (f"%{query}%",))
+
+        focal_entity = cursor.fetchone()
+        if not focal_entity:
+            return None
+
+        entities = {focal_entity['attack_id']: {
+            'name': focal_entity['name'],
+            'attck_id': focal_entity['attck_id'] or focal_entity['attack_id'],
+            'type': entity_type
+        }}
+        if entity_type == 'technique':
+            entities[focal_entity['attack_id']]['tactic'] = focal_entity['tactic']
+        relationships = []
+        frontier = [focal_entity['attack_id']]
+        for _ in range(depth):
+            # One query for every relationship touching the frontier...
+            placeholders = ','.join(['%s'] * len(frontier))
+            rel_sql = f"""
+                SELECT source_id, target_id, relationship_type
+                FROM relationships
+                WHERE (source_id IN ({placeholders}) OR target_id IN ({placeholders}))
+            """
+            params = frontier + frontier
+            if relationship_types:
+                rel_sql += f" AND relationship_type IN ({','.join(['%s'] * len(relationship_types))})"
+                params += sorted(relationship_types)
+            cursor.execute(rel_sql, tuple(params))
+            level_relationships = [(rel['source_id'], rel['target_id'], rel['relationship_type']) for rel in cursor.fetchall()]
+            candidates = {stix_id for rel in level_relationships for stix_id in rel[:2]} - entities.keys()
+
+            # ...and one for the entities at the far end, across every allowed entity table
+            found = _fetch_entities(cursor, candidates, entity_types)
+            frontier = sorted(found)
+            if max_nodes is not None:
+                frontier = frontier[:max(max_nodes - len(entities), 0)]
+            for stix_id in frontier:
+                entities[stix_id] = found[stix_id]
+            relationships.extend(level_relationships)
+            if not frontier:
+                break
+
+        relationships = list(dict.fromkeys(
+            rel for rel in relationships if rel[0] in entities and rel[1] in entities
+        ))
+        return entities, relationships
+
+def _fetch_entities(cursor, stix_ids: Set[str], entity_types: Optional[Set[str]]) -> Dict[str, Dict[str, str]]:
+    """Look up names and ATT&CK IDs for a batch of STIX ids in a single UNION query."""
+    if not stix_ids:
+        return {}
+    ids = sorted(stix_ids)
+    placeholders = ','.join(['%s'] * len(ids))
+    selects = []
+    params = []
+    for entity_type, (table, ref_table, id_field, _) in ENTITY_TABLES.items():
+        if entity_types and entity_type not in entity_types:
+            continue
+        selects.append(f"""
+            SELECT '{entity_type}' AS type, t.id AS attack_id, t.name, er.external_id AS attck_id,
+                   {'t.tactic' if entity_type == 'technique' else 'NULL'} AS tactic
+            FROM {table} t
+            LEFT JOIN {ref_table} er ON t.id = er.{id_field} AND er.source_name = 'mitre-attack'
+            WHERE t.id IN ({placeholders})
+        """)
+        params.extend(ids)
+    if not selects:
+        return {}
+    cursor.execute(" UNION ALL ".join(selects), tuple(params))
+    entities = {}
+    for row in cursor.fetchall():
+        entities[row['attack_id']] = {
+            'name': row['name'],
+            'attck_id': row['attck_id'] or row['attack_id'],
+            'type': row['type']
+        }
+        if row['type'] == 'technique':
+            entities[row['attack_id']]['tactic'] = row['tactic']
+    return entities
+
+def _collapse_key(info: Dict[str, str], by_tactic: bool) -> tuple:
+    """Aggregate bucket for an entity: its type, and for techniques its first tactic."""
+    if by_tactic and info['type'] == 'technique' and info.get('tactic'):
+        return info['type'], info['tactic'].split(',')[0]
+    return info['type'], None
+
+def summarize_graph(entities: Dict[str, Dict[str, str]], relationships: List[tuple],
+                    max_nodes: int = RENDER_MAX_NODES) -> tuple[Dict[str, Dict[str, str]], List[tuple], Dict[str, List[str]]]:
+    """
+    Bound a neighbourhood to at most `max_nodes` nodes before drawing it.
+    The focal entity (the first one) is always kept, then entities linked straight to it,
+    then the best connected. The rest are folded into one aggregate node per entity type
+    (per tactic for techniques, while that still fits). Returns (entities, relationships,
+    collapsed), where collapsed maps each aggregate node to the ATT&CK IDs it replaced.
+    The budget never drops below one node per entity type plus the focal entity.
+    """
+    max_nodes = max(max_nodes, len(TYPE_PLURALS) + 1)
+    if len(entities) <= max_nodes:
+        return entities, relationships, {}
+
+    focal = next(iter(entities))
+    degree: Dict[str, int] = defaultdict(int)
+    direct = set()
+    for src, tgt, _ in relationships:
+        degree[src] += 1
+        degree[tgt] += 1
+        if focal in (src, tgt):
+            direct.update((src, tgt))
+    ranked = sorted(
+        (stix_id for stix_id in entities if stix_id != focal),
+        key=lambda stix_id: (stix_id not in direct, -degree[stix_id], entities[stix_id]['attck_id'])
+    )
+
+    # Keep as many entities as possible while leaving room for the aggregate nodes
+    for by_tactic in (True, False):
+        keep = max_nodes - 1
+        while keep > 0 and keep + len({_collapse_key(entities[i], by_tactic) for i in ranked[keep:]}) > max_nodes - 1:
+            keep -= 1
+        if keep > 0:
+            break
+
+    summary = {focal: entities[focal]}
+    summary.update((stix_id, entities[stix_id]) for stix_id in ranked[:keep])
+    collapsed: Dict[str, List[str]] = {}
+    buckets: Dict[str, tuple] = {}
+    replaced: Dict[str, str] = {}
+    for stix_id in ranked[keep:]:
+        entity_type, tactic = _collapse_key(entities[stix_id], by_tactic)
+        aggregate_id = f"collapsed:{entity_type}" + (f":{tactic}" if tactic else "")
+        buckets[aggregate_id] = (entity_type, tactic)
+        collapsed.setdefault(aggregate_id, []).append(entities[stix_id]['attck_id'])
+        replaced[stix_id] = aggregate_id
+    for aggregate_id, attck_ids in collapsed.items():
+        entity_type, tactic = buckets[aggregate_id]
+        summary[aggregate_id] = {
+            'name': f"{len(attck_ids)} more {TYPE_PLURALS[entity_type]}" + (f" ({tactic})" if tactic else ""),
+            'attck_id': f"+{len(attck_ids)}",
+            'type': entity_type,
+            'collapsed': len(attck_ids),
+        }
+
+    edges = {}
+    for src, tgt, rel_type in relationships:
+        src, tgt = replaced.get(src, src), replaced.get(tgt, tgt)
+        if src != tgt:
+            edges.setdefault((src, tgt), rel_type)
+    return summary, [(src, tgt, rel_type) for (src, tgt), rel_type in edges.items()], collapsed
+
+def describe_collapsed(collapsed: Dict[str, List[str]]) -> str:
+    """One line saying what summarize_graph folded away, or '' if nothing was."""
+    if not collapsed:
+        return ""
+    counts: Dict[str, int] = defaultdict(int)
+    for aggregate_id, attck_ids in collapsed.items():
+        counts[aggregate_id.split(':')[1]] += len(attck_ids)
+    parts = ', '.join(f"{count} {TYPE_PLURALS[entity_type]}" for entity_type, count in sorted(counts.items()))
+    return f"Collapsed {sum(counts.values())} less connected entities into summary nodes ({parts})."
+
+def render_graph(entities: Dict[str, Dict[str, str]], relationships: List[tuple], layout: str = "auto",
+                 fmt: str = "png", dpi: int = GRAPH_DPI, timings: Optional[Dict[str, float]] = None) -> bytes:
+    """
+    Render fetched entities and relationships to PNG or SVG bytes with a legend.
+    The first entity is the focal one; `layout` is one of layouts.LAYOUTS.
+    Uses its own Figure and Agg canvas rather than pyplot's global state, so renders
+    can run concurrently in worker threads or processes.
+    Pass a dict as `timings` to get the seconds spent on "layout" and "draw".
+    """
+    if fmt not in RENDER_FORMATS:
+        raise ValueError(f"Unknown graph format {fmt!r}, expected one of {', '.join(RENDER_FORMATS)}")
     G = nx.DiGraph()
 
     # Add nodes
@@ -162,21 +277,24 @@ def generate_graph(query: str) -> Optional[io.BytesIO]:
             G.add_edge(src, tgt, label=rel_type)
 
     # Define node colors based on type
-    color_map = {
-        'technique': 'lightblue',
-        'group': 'lightgreen',
-        'software': 'lightcoral',
-        'campaign': 'lightyellow'
-    }
-    node_colors = [color_map[G.nodes[node]['type']] for node in G.nodes]
+    node_colors = [NODE_COLORS[G.nodes[node]['type']] for node in G.nodes]
 
     # Draw the graph
-    plt.figure(figsize=(12, 8))
-    pos = nx.spring_layout(G)
-    nx.draw(G, pos, with_labels=True, labels=nx.get_node_attributes(G, 'label'),
-            node_color=node_colors, node_size=2000, font_size=8, font_weight='bold')
-    edge_labels = nx.get_edge_attributes(G, 'label')
-    nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=6)
+    fig = Figure(figsize=(12, 8))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_axis_off()
+    started = time.monotonic()
+    pos = compute_layout(G, focal=next(iter(entities), None), method=layout)
+    laid_out = time.monotonic()
+    nx.draw_networkx_nodes(G, pos, ax=ax, node_color=node_colors, node_size=2000)
+    nx.draw_networkx_edges(G, pos, ax=ax, node_size=2000)
+    nx.draw_networkx_labels(G, pos, ax=ax, labels=nx.get_node_attributes(G, 'label'),
+                            font_size=8, font_weight='bold')
+    # Edge labels are the slowest part to draw and unreadable on busy graphs
+    if G.number_of_edges() <= EDGE_LABEL_LIMIT:
+        edge_labels = nx.get_edge_attributes(G, 'label')
+        nx.draw_networkx_edge_labels(G, pos, ax=ax, edge_labels=edge_labels, font_size=6)
 
     # Add legend
     legend_patches = [
@@ -185,11 +303,175 @@ def generate_graph(query: str) -> Optional[io.BytesIO]:
         mpatches.Patch(color='lightcoral', label='Software'),
         mpatches.Patch(color='lightyellow', label='Campaigns')
     ]
-    plt.legend(handles=legend_patches, loc='upper right', title='Entity Types')
+    ax.legend(handles=legend_patches, loc='upper right', title='Entity Types')
 
     # Save to BytesIO
     img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png', bbox_inches='tight')
-    img_buffer.seek(0)
-    plt.close()
-    return img_buffer
\ No newline at end of file
+    fig.savefig(img_buffer, format=fmt, dpi=dpi, bbox_inches='tight')
+    if timings is not None:
+        timings.update(layout=laid_out - started, draw=time.monotonic() - laid_out)
+    return img_buffer.getvalue()
+
+def render_graph_timed(entities: Dict[str, Dict[str, str]], relationships: List[tuple],
+                       **options) -> tuple[bytes, Dict[str, float]]:
+    """render_graph returning (output, timings), for callers on the render process pool."""
+    timings = {}
+    return render_graph(entities, relationships, timings=timings, **options), timings
+
+def to_node_link(entities: Dict[str, Dict[str, str]], relationships: List[tuple],
+                 collapsed: Optional[Dict[str, List[str]]] = None) -> Dict:
+    """Compact node-link document for the graph; the first node is the focal entity."""
+    nodes = [dict(info, id=entity_id) for entity_id, info in entities.items()]
+    links = [{'source': src, 'target': tgt, 'type': rel_type}
+             for src, tgt, rel_type in relationships if src in entities and tgt in entities]
+    document = {'directed': True, 'focal': next(iter(entities), None), 'nodes': nodes, 'links': links}
+    if collapsed:
+        document['collapsed'] = collapsed
+    return document
+
+def export_json(entities: Dict[str, Dict[str, str]], relationships: List[tuple],
+                collapsed: Optional[Dict[str, List[str]]] = None) -> bytes:
+    return json.dumps(to_node_link(entities, relationships, collapsed), separators=(',', ':')).encode('utf-8')
+
+def export_html(entities: Dict[str, Dict[str, str]], relationships: List[tuple],
+                collapsed: Optional[Dict[str, List[str]]] = None, title: str = "ATT&CK graph") -> bytes:
+    """Self-contained HTML page that lays the graph out in the viewer's browser (no external scripts)."""
+    data = export_json(entities, relationships, collapsed).decode('utf-8').replace('</', '<\\/')
+    return (HTML_TEMPLATE
+            .replace('{{title}}', html.escape(title))
+            .replace('{{colors}}', json.dumps(NODE_COLORS))
+            .replace('{{data}}', data)).encode('utf-8')
+
+def export_graph(entities: Dict[str, Dict[str, str]], relationships: List[tuple], fmt: str,
+                 collapsed: Optional[Dict[str, List[str]]] = None, title: str = "ATT&CK graph") -> bytes:
+    """Serialise the graph as one of EXPORT_FORMATS. Cheap enough to run on the event loop's DB lane."""
+    if fmt == "json":
+        return export_json(entities, relationships, collapsed)
+    if fmt == "html":
+        return export_html(entities, relationships, collapsed, title)
+    raise ValueError(f"Unknown export format {fmt!r}, expected one of {', '.join(EXPORT_FORMATS)}")
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{{title}}</title>
+<style>
+  body { margin: 0; font: 12px sans-serif; background: #fff; }
+  #info { position: fixed; top: 8px; left: 8px; background: #fffe; padding: 6px 8px; border: 1px solid #ccc; }
+  svg { width: 100vw; height: 100vh; cursor: grab; }
+  line { stroke: #999; stroke-opacity: .6; }
+  circle { stroke: #333; stroke-width: 1px; cursor: pointer; }
+  text { pointer-events: none; }
+</style>
+</head>
+<body>
+<div id="info"><b>{{title}}</b><br>Drag nodes to move them, scroll to zoom, drag the background to pan.</div>
+<svg id="graph"><g id="view"><g id="links"></g><g id="nodes"></g></g></svg>
+<script type="application/json" id="graph-data">{{data}}</script>
+<script>
+const graph = JSON.parse(document.getElementById('graph-data').textContent);
+const colors = {{colors}};
+const NS = 'http://www.w3.org/2000/svg';
+const svg = document.getElementById('graph'), view = document.getElementById('view');
+const W = window.innerWidth, H = window.innerHeight;
+const byId = {};
+graph.nodes.forEach((n, i) => {
+  const a = 2 * Math.PI * i / graph.nodes.length;
+  n.x = W / 2 + (n.id === graph.focal ? 0 : 200 * Math.cos(a));
+  n.y = H / 2 + (n.id === graph.focal ? 0 : 200 * Math.sin(a));
+  n.vx = n.vy = 0;
+  byId[n.id] = n;
+});
+const links = graph.links.map(l => ({source: byId[l.source], target: byId[l.target], type: l.type}));
+
+function el(tag, attrs, parent) {
+  const e = document.createElementNS(NS, tag);
+  for (const k in attrs) e.setAttribute(k, attrs[k]);
+  parent.appendChild(e);
+  return e;
+}
+links.forEach(l => {
+  l.el = el('line', {}, document.getElementById('links'));
+  el('title', {}, l.el).textContent = l.type;
+});
+graph.nodes.forEach(n => {
+  n.el = el('g', {}, document.getElementById('nodes'));
+  const c = el('circle', {r: n.id === graph.focal ? 14 : 9, fill: colors[n.type] || '#ccc'}, n.el);
+  el('title', {}, c).textContent = n.attck_id + ' ' + n.name + (n.tactic ? ' [' + n.tactic + ']' : '');
+  el('text', {x: 12, y: 4}, n.el).textContent = n.attck_id + ' ' + n.name;
+  c.addEventListener('mousedown', e => { dragging = n; e.stopPropagation(); });
+});
+
+// Small force simulation: repulsion between every pair, springs along links, pull to the centre
+let alpha = 1, dragging = null;
+function tick() {
+  const nodes = graph.nodes;
+  for (let i = 0; i < nodes.length; i++) {
+    for (let j = i + 1; j < nodes.length; j++) {
+      const a = nodes[i], b = nodes[j];
+      let dx = b.x - a.x, dy = b.y - a.y, d2 = dx * dx + dy * dy || 1;
+      const f = 900 * alpha / d2;
+      a.vx -= dx * f; a.vy -= dy * f; b.vx += dx * f; b.vy += dy * f;
+    }
+  }
+  links.forEach(l => {
+    const dx = l.target.x - l.source.x, dy = l.target.y - l.source.y;
+    const d = Math.sqrt(dx * dx + dy * dy) || 1, f = (d - 90) / d * 0.05 * alpha;
+    l.source.vx += dx * f; l.source.vy += dy * f; l.target.vx -= dx * f; l.target.vy -= dy * f;
+  });
+  nodes.forEach(n => {
+    n.vx += (W / 2 - n.x) * 0.002 * alpha; n.vy += (H / 2 - n.y) * 0.002 * alpha;
+    if (n !== dragging) { n.x += n.vx; n.y += n.vy; }
+    n.vx *= 0.6; n.vy *= 0.6;
+    n.el.setAttribute('transform', 'translate(' + n.x + ',' + n.y + ')');
+  });
+  links.forEach(l => {
+    l.el.setAttribute('x1', l.source.x); l.el.setAttribute('y1', l.source.y);
+    l.el.setAttribute('x2', l.target.x); l.el.setAttribute('y2', l.target.y);
+  });
+  alpha = Math.max(alpha * 0.99, 0.02);
+  requestAnimationFrame(tick);
+}
+requestAnimationFrame(tick);
+
+// Pan, zoom and drag
+let scale = 1, tx = 0, ty = 0, panning = null;
+function applyView() { view.setAttribute('transform', 'translate(' + tx + ',' + ty + ') scale(' + scale + ')'); }
+svg.addEventListener('wheel', e => {
+  e.preventDefault();
+  const k = e.deltaY < 0 ? 1.1 : 1 / 1.1;
+  tx = e.clientX - (e.clientX - tx) * k; ty = e.clientY - (e.clientY - ty) * k; scale *= k;
+  applyView();
+});
+svg.addEventListener('mousedown', e => { panning = {x: e.clientX - tx, y: e.clientY - ty}; });
+window.addEventListener('mousemove', e => {
+  if (dragging) { dragging.x = (e.clientX - tx) / scale; dragging.y = (e.clientY - ty) / scale; alpha = Math.max(alpha, 0.3); }
+  else if (panning) { tx = e.clientX - panning.x; ty = e.clientY - panning.y; applyView(); }
+});
+window.addEventListener('mouseup', () => { dragging = null; panning = null; });
+</script>
+</body>
+</html>
+"""
+
+def generate_graph(query: str, depth: int = 1, entity_types: Optional[Set[str]] = None,
+                   fmt: str = "png", dpi: int = GRAPH_DPI) -> Optional[io.BytesIO]:
+    """
+    Generate the graph for the query as a BytesIO object in one of GRAPH_FORMATS:
+    a PNG or SVG image with a legend, or an HTML/JSON export laid out by the viewer.
+    """
+    key = graph_cache.make_key(query, current_data_version(), depth=depth, types=sorted(entity_types or ()),
+                               fmt=fmt, dpi=dpi)
+    output = graph_cache.cache.get(key)
+    if output is None:
+        data = expand_graph(query, depth, entity_types)
+        if not data:
+            return None
+        if fmt in EXPORT_FORMATS:
+            output = export_graph(*data, fmt=fmt, title=f"ATT&CK graph for {query}")
+        else:
+            entities, relationships, _ = summarize_graph(*data)
+            output = render_graph(entities, relationships, fmt=fmt, dpi=dpi)
+        graph_cache.cache.put(key, output)
+    return io.BytesIO(output)
@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+GRAPH_CACHE_MAX_BYTES = int(os.getenv("GRAPH_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+GRAPH_CACHE_DIR = os.getenv("GRAPH_CACHE_DIR")  # Unset disables the on-disk tier
+GRAPH_CACHE_DISK_MAX_BYTES = int(os.getenv("GRAPH_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+
+def make_key(query: str, data_version: str, **options) -> str:
+    """Cache key for a rendered graph: normalised query, data version and render options."""
+    parts = [query.strip().casefold()] + [f"{name}={options[name]}" for name in sorted(options)]
+    return f"{data_version}/{hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()}"
+
+class GraphCache:
+    """
+    Two-tier cache of rendered graph bytes: an in-memory LRU bounded by total size,
+    backed by an optional directory on disk. Keys start with the data version, and
+    entries from older versions are dropped as soon as a newer version is seen.
+    Versions sort in time order; keys older than the newest version seen are misses
+    and are never stored.
+    """
+
+    def __init__(self, max_bytes: int = GRAPH_CACHE_MAX_BYTES, disk_dir: Optional[str] = GRAPH_CACHE_DIR,
+                 disk_max_bytes: int = GRAPH_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self._disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._trim_disk()
+
+    def _check_version(self, key: str) -> bool:
+        """
+        Move to the key's data version if it is newer, dropping every entry from older
+        versions. Returns False for a key older than the current version. Caller holds the lock.
+        """
+        version = key.split('/', 1)[0]
+        if version == self._version:
+            return True
+        if self._version is not None:
+            if version < self._version:
+                return False
+            self.counters["invalidations"] += 1
+            logger.info(f"ATT&CK data version changed to {version}, clearing graph cache")
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                if name < version:
+                    shutil.rmtree(os.path.join(self.disk_dir, name), ignore_errors=True)
+        self._version = version
+        return True
+
+    def _disk_path(self, key: str) -> str:
+        version, digest = key.split('/', 1)
+        return os.path.join(self.disk_dir, version, digest)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if not self._check_version(key):
+                self.counters["misses"] += 1
+                return None
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return data
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.counters["disk_hits"] += 1
+                    self._store(key, data)
+                return data
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            if not self._check_version(key):
+                return
+            self._store(key, data)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp{threading.get_ident()}"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                self._disk_bytes += len(data)
+                if self._disk_bytes > self.disk_max_bytes:
+                    self._trim_disk()
+            except OSError as e:
+                logger.warning(f"Could not write graph cache entry to disk: {e}")
+
+    def _store(self, key: str, data: bytes):
+        """Insert into the memory tier and evict least recently used entries. Caller holds the lock."""
+        if len(data) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._entries[key] = data
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.counters["evictions"] += 1
+
+    def _trim_disk(self):
+        """Recount the disk tier and delete the oldest files until it fits its size budget."""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.counters["evictions"] += 1
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = None
+        if self.disk_dir:
+            shutil.rmtree(self.disk_dir, ignore_errors=True)
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters plus current memory usage."""
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), bytes=self._bytes)
+
+# Process-wide cache shared by the bot's graph command
+cache = GraphCache()
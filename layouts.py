@@ -0,0 +1,95 @@
+import math
+import os
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Hashable, Optional, Tuple
+
+import networkx as nx
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+LAYOUT_SEED = int(os.getenv("LAYOUT_SEED", "42"))
+# Above this many nodes the force-directed layout gets slow and unreadable, so "auto" goes radial.
+# Keep it below RENDER_MAX_NODES, or summarized graphs never get this far.
+RADIAL_THRESHOLD = int(os.getenv("LAYOUT_RADIAL_THRESHOLD", "30"))
+LAYOUT_CACHE_SIZE = int(os.getenv("LAYOUT_CACHE_SIZE", "256"))
+
+LAYOUTS = ("auto", "spring", "radial")
+# Sector order around the focal node
+TYPE_ORDER = ("technique", "software", "group", "campaign")
+
+Position = Tuple[float, float]
+
+def _spring(G: nx.Graph, seed: int) -> Dict[Hashable, Position]:
+    """Seeded force-directed layout, so the same graph always renders the same way."""
+    pos = nx.spring_layout(G, seed=seed, k=1.5 / math.sqrt(max(len(G), 1)))
+    return {node: (float(x), float(y)) for node, (x, y) in pos.items()}
+
+def _radial(G: nx.Graph, focal: Optional[Hashable]) -> Dict[Hashable, Position]:
+    """
+    Linear-time structured layout: the focal node sits in the centre, each hop away
+    from it is a ring, and each entity type owns a sector of every ring. Busy rings
+    alternate between two radii so neighbouring labels don't sit on top of each other.
+    """
+    if focal is None or focal not in G:
+        focal = next(iter(G), None)
+    if focal is None:
+        return {}
+    depths = nx.single_source_shortest_path_length(G.to_undirected(as_view=True), focal)
+    max_depth = max(depths.values())
+    for node in G:
+        depths.setdefault(node, max_depth + 1)  # Disconnected nodes go on an outer ring
+
+    rings: Dict[int, Dict[str, list]] = defaultdict(lambda: defaultdict(list))
+    for node, depth in depths.items():
+        if depth:
+            rings[depth][G.nodes[node].get('type', '')].append(node)
+
+    pos = {focal: (0.0, 0.0)}
+    for depth, by_type in rings.items():
+        types = sorted(by_type, key=lambda t: (TYPE_ORDER.index(t) if t in TYPE_ORDER else len(TYPE_ORDER), t))
+        total = sum(len(nodes) for nodes in by_type.values())
+        stagger = 0.18 if total > 24 else 0.0
+        angle = 0.0
+        for entity_type in types:
+            # Sort within a sector by label so the order is stable between renders
+            nodes = sorted(by_type[entity_type], key=lambda n: (G.nodes[n].get('label', ''), str(n)))
+            sector = 2 * math.pi * len(nodes) / total
+            step = sector / len(nodes)
+            for i, node in enumerate(nodes):
+                theta = angle + step * (i + 0.5)
+                radius = depth + (stagger if i % 2 else 0.0)
+                pos[node] = (radius * math.cos(theta), radius * math.sin(theta))
+            angle += sector
+    return pos
+
+@lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def _cached_layout(method: str, nodes: tuple, edges: tuple, focal: Optional[Hashable], seed: int) -> Dict[Hashable, Position]:
+    G = nx.DiGraph()
+    G.add_nodes_from((node, {'type': entity_type, 'label': label}) for node, entity_type, label in nodes)
+    G.add_edges_from(edges)
+    if method == "spring":
+        return _spring(G, seed)
+    return _radial(G, focal)
+
+def compute_layout(G: nx.Graph, focal: Optional[Hashable] = None, method: str = "auto",
+                   seed: int = LAYOUT_SEED) -> Dict[Hashable, Position]:
+    """
+    Node positions for G. Layouts are deterministic and cached on the node and edge
+    set, so rendering the same neighbourhood again skips the layout step entirely.
+    The returned dict is shared with the cache and must not be modified.
+    """
+    if method not in LAYOUTS:
+        raise ValueError(f"Unknown layout {method!r}, expected one of {', '.join(LAYOUTS)}")
+    if method == "auto":
+        method = "spring" if len(G) <= RADIAL_THRESHOLD else "radial"
+    nodes = tuple(sorted(
+        ((node, data.get('type', ''), data.get('label', '')) for node, data in G.nodes(data=True)),
+        key=lambda n: str(n[0])
+    ))
+    edges = tuple(sorted(((src, tgt) for src, tgt in G.edges()), key=lambda e: (str(e[0]), str(e[1]))))
+    return _cached_layout(method, nodes, edges, focal, seed)
+
+def clear_layout_cache():
+    _cached_layout.cache_clear()
@@ -0,0 +1,243 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger("slow_commands")
+
+# Load environment variables
+load_dotenv()
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.getenv("METRICS_PORT", "9108")  # Empty disables the endpoint
+SLOW_COMMAND_SECONDS = float(os.getenv("SLOW_COMMAND_SECONDS", "5"))  # 0 disables the slow-command log
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+ROW_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+BYTE_BUCKETS = (1 << 10, 10 << 10, 100 << 10, 500 << 10, 1 << 20, 5 << 20, 8 << 20, 25 << 20)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 40, 80, 160, 320)
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Metric:
+    """A named metric with fixed label names; one series per distinct set of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(_escape(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, value in series:
+            lines.extend(self._render_series(key, value))
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def _render_series(self, key, value) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, key)} {value}"]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]  # per-bucket counts, sum, count
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _render_series(self, key, value) -> List[str]:
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            le = f'le="{bound:g}"'
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+        le = 'le="+Inf"'
+        lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {count}")
+        lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {round(total, 6)}")
+        lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+# Every metric registers itself here; stats sources are polled at scrape time
+REGISTRY: List[Metric] = []
+_stats_sources: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+
+def register_stats(prefix: str, source: Callable[[], Dict[str, Any]]):
+    """Export every numeric value of source()'s dict as a gauge named `<prefix>_<key>`."""
+    _stats_sources.append((prefix, source))
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for prefix, source in _stats_sources:
+        try:
+            stats = source()
+        except Exception as e:
+            logger.warning(f"Could not collect {prefix} stats: {e}")
+            continue
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+    return "\n".join(lines) + "\n"
+
+# --- Command instrumentation ---
+commands_total = Counter("bot_commands_total", "Commands handled, by outcome", ("command", "outcome"))
+command_seconds = Histogram("bot_command_duration_seconds", "End-to-end command latency", ("command",))
+stage_seconds = Histogram("bot_command_stage_seconds", "Time spent in each stage of a command", ("command", "stage"))
+rows_returned = Histogram("bot_db_rows_returned", "Rows or graph elements returned to a command", ("command",),
+                          buckets=ROW_BUCKETS)
+upload_bytes = Histogram("bot_upload_bytes", "Bytes sent back to Discord per command", ("command",),
+                         buckets=BYTE_BUCKETS)
+model_tokens_per_second = Histogram("bot_model_tokens_per_second", "Model generation speed per command",
+                                    ("command",), buckets=TOKEN_RATE_BUCKETS)
+slow_commands_total = Counter("bot_slow_commands_total", "Commands slower than SLOW_COMMAND_SECONDS", ("command",))
+
+class CommandTrace:
+    """
+    Timing and size breakdown of one command invocation. Use stage() around each
+    step; rows(), upload() and tokens() record what the command returned.
+    `outcome` defaults to "ok" and can be set by the handler (e.g. "not_found").
+    """
+
+    def __init__(self, command: str, **details):
+        self.command = command
+        self.details = details
+        self.outcome = "ok"
+        self.stages: Dict[str, float] = {}
+        self.started = time.monotonic()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - started)
+
+    def record(self, stage: str, seconds: float):
+        """Add time measured elsewhere (e.g. inside a render process) to a stage."""
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        stage_seconds.observe(seconds, command=self.command, stage=stage)
+
+    def rows(self, count: int):
+        self.details["rows"] = self.details.get("rows", 0) + count
+
+    def upload(self, size: int):
+        self.details["upload_bytes"] = self.details.get("upload_bytes", 0) + size
+
+    def tokens(self, count: int, seconds: float):
+        if count and seconds > 0:
+            rate = count / seconds
+            self.details.update(tokens=count, tokens_per_sec=round(rate, 1))
+            model_tokens_per_second.observe(rate, command=self.command)
+
+    def summary(self, elapsed: float) -> str:
+        stages = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.stages.items())
+        details = " ".join(f"{key}={value}" for key, value in self.details.items())
+        return f"{self.command} {self.outcome} in {elapsed:.3f}s" + (f" ({stages})" if stages else "") + (
+            f" {details}" if details else "")
+
+    def finish(self):
+        elapsed = time.monotonic() - self.started
+        commands_total.inc(command=self.command, outcome=self.outcome)
+        command_seconds.observe(elapsed, command=self.command)
+        # Totals per command, however many queries or messages they took
+        if "rows" in self.details:
+            rows_returned.observe(self.details["rows"], command=self.command)
+        if "upload_bytes" in self.details:
+            upload_bytes.observe(self.details["upload_bytes"], command=self.command)
+        if 0 < SLOW_COMMAND_SECONDS <= elapsed:
+            slow_commands_total.inc(command=self.command)
+            slow_logger.warning(f"Slow command: {self.summary(elapsed)}")
+        else:
+            logger.debug(f"Command {self.summary(elapsed)}")
+
+@contextmanager
+def trace(command: str, **details) -> Iterator[CommandTrace]:
+    """Trace a command; an exception escaping the block is recorded as its outcome and re-raised."""
+    command_trace = CommandTrace(command, **details)
+    try:
+        yield command_trace
+    except BaseException as e:
+        command_trace.outcome = type(e).__name__
+        raise
+    finally:
+        command_trace.finish()
+
+# --- HTTP endpoint ---
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+_runner: Optional[web.AppRunner] = None
+
+async def start_server(host: str = METRICS_HOST, port: str = METRICS_PORT) -> Optional[web.AppRunner]:
+    """Serve /metrics on host:port inside the running event loop (no-op when port is empty)."""
+    global _runner
+    if not port or _runner is not None:
+        return _runner
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, int(port)).start()
+    except OSError as e:
+        logger.error(f"Could not start the metrics endpoint on {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    _runner = runner
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return runner
+
+async def stop_server():
+    """Stop the metrics endpoint (call on bot shutdown)."""
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -1,32 +1,65 @@
 import mysql.connector
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from collections import defaultdict
+from functools import lru_cache
+from mysql.connector import errorcode
 import re 
-import os
-from dotenv import load_dotenv
-
-DB_HOST = os.getenv("DB_HOST")
-DB_USER = os.getenv("DB_USER")
-DB_PASS = os.getenv("DB_PASS")
-DB = os.getenv("DB")
-def connect_to_db(
-    host: str = DB_HOST,
-    user: str = DB_USER,
-    password: str = DB_PASS,
-    database: str = DB
-) -> mysql.connector.connection.MySQLConnection:
-    """Establish a connection to the MySQL database."""
-    return mysql.connector.connect(
-        host=host,
-        user=user,
-        password=password,
-        database=database
-    )
+from db import connection, data_version
+from attack_kb import get_kb
+import search_index
+
+RELATED_TTP_CACHE_SIZE = 1024
 
 def validate_ttp_id(ttp_id: str) -> bool:
     """Validate that the TTP ID matches the format T### or T###.###"""
     pattern = r'^T\d{4}(\.\d{3})?$'
     return bool(re.match(pattern, ttp_id))
 
+@lru_cache(maxsize=RELATED_TTP_CACHE_SIZE)
+def _related_ttps(technique_id: str, ttp_id: str, tactic: Optional[str], version: str) -> tuple:
+    """
+    Techniques sharing at least one tactic with technique_id, via the technique_tactics join table.
+    `version` is the data version, so entries from before a sync are never served again.
+    """
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("""
+                SELECT DISTINCT t.id AS attack_id, t.name, er.external_id AS ttp_id
+                FROM technique_tactics src
+                JOIN technique_tactics tt ON tt.tactic = src.tactic
+                JOIN techniques t ON t.id = tt.technique_id
+                JOIN external_references er ON t.id = er.technique_id
+                WHERE src.technique_id = %s
+                AND er.source_name = 'mitre-attack'
+                AND er.external_id != %s
+            """, (technique_id, ttp_id))
+        except mysql.connector.errors.ProgrammingError as e:
+            if e.errno != errorcode.ER_NO_SUCH_TABLE:
+                raise
+            # Database generated before technique_tactics existed: scan the comma-joined column
+            tactics = tactic.split(',') if tactic else []
+            if not tactics:
+                return ()
+            placeholders = ' OR '.join(['t.tactic LIKE %s' for _ in tactics])
+            cursor.execute(f"""
+                SELECT DISTINCT t.id AS attack_id, t.name, er.external_id AS ttp_id
+                FROM techniques t
+                JOIN external_references er ON t.id = er.technique_id
+                WHERE er.source_name = 'mitre-attack'
+                AND ({placeholders})
+                AND er.external_id != %s
+            """, [f"%{tactic}%" for tactic in tactics] + [ttp_id])
+        return tuple(cursor.fetchall())
+
+def related_ttps_for(technique_id: str, ttp_id: str, tactic: Optional[str]) -> List[Dict[str, str]]:
+    """Cached related-TTP lookup; returns fresh dicts so callers can't mutate the cache."""
+    return [dict(row) for row in _related_ttps(technique_id, ttp_id, tactic, data_version())]
+
+def clear_caches():
+    """Forget cached query results (call after the database is refreshed)."""
+    _related_ttps.cache_clear()
+
 def get_technique_details(ttp_id: str) -> Optional[Dict[str, any]]:
     """
     Query the database for a technique's description and related TTPs by TTP ID (T### or T###.###).
@@ -37,46 +70,32 @@ def get_technique_details(ttp_id: str) -> Optional[Dict[str, any]]:
         print(f"Invalid TTP ID format: {ttp_id}. Must be T#### or T####.###")
         return None
 
+    # Serve from the in-memory snapshot when it is loaded
+    kb = get_kb()
+    if kb is not None:
+        return kb.get_technique_details(ttp_id)
 
-    conn = connect_to_db()
-    cursor = conn.cursor(dictionary=True)
 
-    # Step 1: Get the technique details (description and tactics) by TTP ID
-    query_technique = """
-        SELECT t.id AS attack_id, t.name, t.description, t.tactic, er.external_id AS ttp_id
-        FROM techniques t
-        JOIN external_references er ON t.id = er.technique_id
-        WHERE er.source_name = 'mitre-attack'
-        AND er.external_id = %s
-    """
-    cursor.execute(query_technique, (ttp_id,))
-    technique = cursor.fetchone()
-
-    if not technique:
-        print(f"No technique found for TTP ID: {ttp_id}")
-        conn.close()
-        return None
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
 
-    # Step 2: Find related TTPs based on shared tactics
-    tactics = technique['tactic'].split(',') if technique['tactic'] else []
-    related_ttps = []
-    
-    if tactics:
-        # Prepare a query with multiple LIKE conditions for each tactic
-        placeholders = ' OR '.join(['t.tactic LIKE %s' for _ in tactics])
-        query_related = f"""
-            SELECT DISTINCT t.id AS attack_id, t.name, er.external_id AS ttp_id
+        # Step 1: Get the technique details (description and tactics) by TTP ID
+        query_technique = """
+            SELECT t.id AS attack_id, t.name, t.description, t.tactic, er.external_id AS ttp_id
             FROM techniques t
             JOIN external_references er ON t.id = er.technique_id
             WHERE er.source_name = 'mitre-attack'
-            AND ({placeholders})
-            AND er.external_id != %s
+            AND er.external_id = %s
         """
-        params = [f"%{tactic}%" for tactic in tactics] + [ttp_id]
-        cursor.execute(query_related, params)
-        related_ttps = cursor.fetchall()
+        cursor.execute(query_technique, (ttp_id,))
+        technique = cursor.fetchone()
+
+        if not technique:
+            print(f"No technique found for TTP ID: {ttp_id}")
+            return None
 
-    conn.close()
+    # Step 2: Find related TTPs sharing a tactic (cached per technique)
+    related_ttps = related_ttps_for(technique['attack_id'], technique['ttp_id'], technique['tactic'])
 
     # Construct the result
     result = {
@@ -92,51 +111,96 @@ def get_technique_details(ttp_id: str) -> Optional[Dict[str, any]]:
     print(result)
     return result
 
+def get_technique_context(ttp_ids: List[str]) -> List[Dict[str, str]]:
+    """
+    Name, tactics, platforms and detection text for a list of TTP IDs, in one query.
+    Results follow the order of ttp_ids; duplicates and unknown IDs are dropped.
+    """
+    ttp_ids = list(dict.fromkeys(ttp_id.strip().upper() for ttp_id in ttp_ids if validate_ttp_id(ttp_id.strip().upper())))
+    if not ttp_ids:
+        return []
+
+    kb = get_kb()
+    if kb is not None:
+        return kb.get_technique_context(ttp_ids)
+
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(f"""
+            SELECT er.external_id AS ttp_id, t.name, t.tactic, t.platforms, t.detection
+            FROM techniques t
+            JOIN external_references er ON t.id = er.technique_id
+            WHERE er.source_name = 'mitre-attack'
+            AND er.external_id IN ({','.join(['%s'] * len(ttp_ids))})
+        """, tuple(ttp_ids))
+        rows = {row['ttp_id']: row for row in cursor.fetchall()}
+    return [rows[ttp_id] for ttp_id in ttp_ids if ttp_id in rows]
+
 def search_by_ttp_id(ttp_id: str) -> List[Dict[str, str]]:
     """
     Search for techniques by their TTP ID (e.g., T1059, T1055.011).
     Returns a list of dictionaries with attack_id, name, and ttp_id.
     """
-    conn = connect_to_db()
-    cursor = conn.cursor(dictionary=True)  # Return results as dictionaries
-    
-    # Query external_references for matching external_id, join with techniques
-    query = """
-        SELECT t.id AS attack_id, t.name, er.external_id AS ttp_id
-        FROM techniques t
-        JOIN external_references er ON t.id = er.technique_id
-        WHERE er.source_name = 'mitre-attack'
-        AND er.external_id LIKE %s
-    """
-    cursor.execute(query, (f"{ttp_id}%",))  # Using LIKE with % for sub-techniques (e.g., T1055.011)
-    
-    results = cursor.fetchall()
-    
-    conn.close()
-    return results
+    kb = get_kb()
+    if kb is not None:
+        return kb.search_by_ttp_id(ttp_id)
+
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)  # Return results as dictionaries
+
+        # Query external_references for matching external_id, join with techniques
+        query = """
+            SELECT t.id AS attack_id, t.name, er.external_id AS ttp_id
+            FROM techniques t
+            JOIN external_references er ON t.id = er.technique_id
+            WHERE er.source_name = 'mitre-attack'
+            AND er.external_id LIKE %s
+        """
+        cursor.execute(query, (f"{ttp_id}%",))  # Using LIKE with % for sub-techniques (e.g., T1055.011)
+
+        return cursor.fetchall()
 
-def search_by_name_or_description(search_term: str) -> List[Dict[str, str]]:
+def search_by_name_or_description(search_term: str, page: int = 1, page_size: Optional[int] = None) -> List[Dict[str, str]]:
     """
     Search for techniques by keywords in name or description.
-    Returns a list of dictionaries with attack_id, name, and ttp_id.
-    """
-    conn = connect_to_db()
-    cursor = conn.cursor(dictionary=True)  # Return results as dictionaries
-    
-    # Query techniques and join with external_references for TTP ID
-    query = """
-        SELECT t.id AS attack_id, t.name, er.external_id AS ttp_id
-        FROM techniques t
-        LEFT JOIN external_references er ON t.id = er.technique_id AND er.source_name = 'mitre-attack'
-        WHERE (t.name LIKE %s OR t.description LIKE %s)
+    Returns a relevance-ranked list of dictionaries with attack_id, name, ttp_id and score.
+    Pass page_size to get one page (pages start at 1) instead of every match.
     """
-    search_pattern = f"%{search_term}%"
-    cursor.execute(query, (search_pattern, search_pattern))
-    
-    results = cursor.fetchall()
-    
-    conn.close()
+    results, _ = search_techniques(search_term, page, page_size)
     return results
+
+def search_techniques(search_term: str, page: int = 1, page_size: Optional[int] = None) -> Tuple[List[Dict[str, str]], int]:
+    """Like search_by_name_or_description, but returns (results, total number of matches)."""
+    try:
+        return search_index.get_index().search(search_term, page, page_size)
+    except mysql.connector.Error as e:
+        print(f"Search index unavailable, falling back to LIKE search: {e}")
+
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)  # Return results as dictionaries
+
+        # Query techniques and join with external_references for TTP ID
+        query = """
+            SELECT t.id AS attack_id, t.name, er.external_id AS ttp_id
+            FROM techniques t
+            LEFT JOIN external_references er ON t.id = er.technique_id AND er.source_name = 'mitre-attack'
+            WHERE (t.name LIKE %s OR t.description LIKE %s)
+        """
+        search_pattern = f"%{search_term}%"
+        params = [search_pattern, search_pattern]
+        if page_size:
+            query += " LIMIT %s OFFSET %s"
+            params += [page_size, (max(page, 1) - 1) * page_size]
+        cursor.execute(query, params)
+        results = cursor.fetchall()
+        if not page_size:
+            return results, len(results)
+
+        cursor.execute(
+            "SELECT COUNT(*) AS total FROM techniques t WHERE (t.name LIKE %s OR t.description LIKE %s)",
+            (search_pattern, search_pattern)
+        )
+        return results, cursor.fetchone()['total']
     
 def validate_group_id(group_id: str) -> bool:
     """Validate that the group ID matches the format G####"""
@@ -149,62 +213,68 @@ def search_groups(query: str) -> Optional[List[Dict[str, any]]]:
     Search for groups by ATT&CK ID (e.g., G0001) or name.
     Returns a list of dictionaries with group details and related techniques.
     """
+    kb = get_kb()
+    if kb is not None:
+        return kb.search_groups(query, validate_group_id(query))
+
     try:
-        conn = connect_to_db()
-        cursor = conn.cursor(dictionary=True)
+        with connection() as conn:
+            cursor = conn.cursor(dictionary=True)
 
-        # Check if query matches group ID format
-        is_group_id = validate_group_id(query)
-        
-        if is_group_id:
-            # Search by exact group ID
-            query_sql = """
-                SELECT g.id AS attack_id, g.name, g.description, er.external_id AS group_id
-                FROM groups g
-                JOIN external_references er ON g.id = er.technique_id
-                WHERE er.source_name = 'mitre-attack'
-                AND er.external_id = %s
-            """
-            cursor.execute(query_sql, (query,))
-        else:
-            # Search by name (partial match)
-            query_sql = """
-                SELECT g.id AS attack_id, g.name, g.description, er.external_id AS group_id
-                FROM groups g
-                LEFT JOIN external_references er ON g.id = er.technique_id AND er.source_name = 'mitre-attack'
-                WHERE g.name LIKE %s
-            """
-            cursor.execute(query_sql, (f"%{query}%",))
-
-        groups = cursor.fetchall()
-
-        if not groups:
-            print(f"No groups found for query: {query}")
-            conn.close()
-            return []
-
-        # For each group, fetch related techniques
-        results = []
-        for group in groups:
-            cursor.execute("""
-                SELECT t.id AS technique_attack_id, t.name AS technique_name, er.external_id AS ttp_id
+            # Check if query matches group ID format
+            is_group_id = validate_group_id(query)
+
+            if is_group_id:
+                # Search by exact group ID
+                query_sql = """
+                    SELECT g.id AS attack_id, g.name, g.description, er.external_id AS group_id
+                    FROM groups g
+                    JOIN group_external_references er ON g.id = er.group_id
+                    WHERE er.source_name = 'mitre-attack'
+                    AND er.external_id = %s
+                """
+                cursor.execute(query_sql, (query,))
+            else:
+                # Search by name (partial match)
+                query_sql = """
+                    SELECT g.id AS attack_id, g.name, g.description, er.external_id AS group_id
+                    FROM groups g
+                    LEFT JOIN group_external_references er ON g.id = er.group_id AND er.source_name = 'mitre-attack'
+                    WHERE g.name LIKE %s
+                """
+                cursor.execute(query_sql, (f"%{query}%",))
+
+            groups = cursor.fetchall()
+
+            if not groups:
+                print(f"No groups found for query: {query}")
+                return []
+
+            # Fetch related techniques for every matched group in one query
+            group_ids = [group['attack_id'] for group in groups]
+            cursor.execute(f"""
+                SELECT gtr.group_id, t.id AS technique_attack_id, t.name AS technique_name, er.external_id AS ttp_id
                 FROM group_technique_relationships gtr
                 JOIN techniques t ON gtr.technique_id = t.id
                 LEFT JOIN external_references er ON t.id = er.technique_id AND er.source_name = 'mitre-attack'
-                WHERE gtr.group_id = %s
-            """, (group['attack_id'],))
-            related_techniques = cursor.fetchall()
+                WHERE gtr.group_id IN ({','.join(['%s'] * len(group_ids))})
+            """, group_ids)
+            techniques_by_group = defaultdict(list)
+            for row in cursor.fetchall():
+                group_id = row.pop('group_id')
+                techniques_by_group[group_id].append(row)
 
-            results.append({
-                "group_id": group["group_id"],
-                "name": group["name"],
-                "attack_id": group["attack_id"],
-                "description": group["description"],
-                "related_techniques": related_techniques
-            })
+            results = []
+            for group in groups:
+                results.append({
+                    "group_id": group["group_id"],
+                    "name": group["name"],
+                    "attack_id": group["attack_id"],
+                    "description": group["description"],
+                    "related_techniques": techniques_by_group[group["attack_id"]]
+                })
 
-        conn.close()
-        return results
+            return results
 
     except mysql.connector.Error as e:
         print(f"Database error: {e}")
@@ -215,37 +285,40 @@ def search_groups(query: str) -> Optional[List[Dict[str, any]]]:
     
 def search_software(query: str) -> Optional[List[Dict[str, any]]]:
     """Search for software by ATT&CK ID (e.g., S####) or name."""
+    kb = get_kb()
+    if kb is not None:
+        return kb.search_software(query, validate_id(query, 'S'))
+
     try:
-        conn = connect_to_db()
-        cursor = conn.cursor(dictionary=True)
+        with connection() as conn:
+            cursor = conn.cursor(dictionary=True)
 
-        is_software_id = validate_id(query, 'S')
-        
-        if is_software_id:
-            query_sql = """
-                SELECT s.id AS attack_id, s.name, s.description, s.software_type, ser.external_id AS software_id
-                FROM software s
-                JOIN software_external_references ser ON s.id = ser.software_id
-                WHERE ser.source_name = 'mitre-attack'
-                AND ser.external_id = %s
-            """
-            cursor.execute(query_sql, (query,))
-        else:
-            query_sql = """
-                SELECT s.id AS attack_id, s.name, s.description, s.software_type, ser.external_id AS software_id
-                FROM software s
-                LEFT JOIN software_external_references ser ON s.id = ser.software_id AND ser.source_name = 'mitre-attack'
-                WHERE s.name LIKE %s
-            """
-            cursor.execute(query_sql, (f"%{query}%",))
+            is_software_id = validate_id(query, 'S')
 
-        results = cursor.fetchall()
-        conn.close()
-        
-        if not results:
-            print(f"No software found for query: {query}")
-            return []
-        return results
+            if is_software_id:
+                query_sql = """
+                    SELECT s.id AS attack_id, s.name, s.description, s.software_type, ser.external_id AS software_id
+                    FROM software s
+                    JOIN software_external_references ser ON s.id = ser.software_id
+                    WHERE ser.source_name = 'mitre-attack'
+                    AND ser.external_id = %s
+                """
+                cursor.execute(query_sql, (query,))
+            else:
+                query_sql = """
+                    SELECT s.id AS attack_id, s.name, s.description, s.software_type, ser.external_id AS software_id
+                    FROM software s
+                    LEFT JOIN software_external_references ser ON s.id = ser.software_id AND ser.source_name = 'mitre-attack'
+                    WHERE s.name LIKE %s
+                """
+                cursor.execute(query_sql, (f"%{query}%",))
+
+            results = cursor.fetchall()
+
+            if not results:
+                print(f"No software found for query: {query}")
+                return []
+            return results
 
     except mysql.connector.Error as e:
         print(f"Database error: {e}")
@@ -257,37 +330,40 @@ def search_software(query: str) -> Optional[List[Dict[str, any]]]:
 def search_campaigns(query: str) -> Optional[List[Dict[str, any]]]:
 
     """Search for campaigns by ATT&CK ID (e.g., C####) or name."""
+    kb = get_kb()
+    if kb is not None:
+        return kb.search_campaigns(query, validate_id(query, 'C'))
+
     try:
-        conn = connect_to_db()
-        cursor = conn.cursor(dictionary=True)
+        with connection() as conn:
+            cursor = conn.cursor(dictionary=True)
 
-        is_campaign_id = validate_id(query, 'C')
-        
-        if is_campaign_id:
-            query_sql = """
-                SELECT c.id AS attack_id, c.name, c.description, cer.external_id AS campaign_id
-                FROM campaigns c
-                JOIN campaign_external_references cer ON c.id = cer.campaign_id
-                WHERE cer.source_name = 'mitre-attack'
-                AND cer.external_id = %s
-            """
-            cursor.execute(query_sql, (query,))
-        else:
-            query_sql = """
-                SELECT c.id AS attack_id, c.name, c.description, cer.external_id AS campaign_id
-                FROM campaigns c
-                LEFT JOIN campaign_external_references cer ON c.id = cer.campaign_id AND cer.source_name = 'mitre-attack'
-                WHERE c.name LIKE %s
-            """
-            cursor.execute(query_sql, (f"%{query}%",))
+            is_campaign_id = validate_id(query, 'C')
 
-        results = cursor.fetchall()
-        conn.close()
-        
-        if not results:
-            print(f"No campaigns found for query: {query}")
-            return []
-        return results
+            if is_campaign_id:
+                query_sql = """
+                    SELECT c.id AS attack_id, c.name, c.description, cer.external_id AS campaign_id
+                    FROM campaigns c
+                    JOIN campaign_external_references cer ON c.id = cer.campaign_id
+                    WHERE cer.source_name = 'mitre-attack'
+                    AND cer.external_id = %s
+                """
+                cursor.execute(query_sql, (query,))
+            else:
+                query_sql = """
+                    SELECT c.id AS attack_id, c.name, c.description, cer.external_id AS campaign_id
+                    FROM campaigns c
+                    LEFT JOIN campaign_external_references cer ON c.id = cer.campaign_id AND cer.source_name = 'mitre-attack'
+                    WHERE c.name LIKE %s
+                """
+                cursor.execute(query_sql, (f"%{query}%",))
+
+            results = cursor.fetchall()
+
+            if not results:
+                print(f"No campaigns found for query: {query}")
+                return []
+            return results
 
     except mysql.connector.Error as e:
         print(f"Database error: {e}")
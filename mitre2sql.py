@@ -1,417 +1,700 @@
+import argparse
 import json
-from datetime import datetime
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+READ_CHUNK_SIZE = 1 << 16
+DEFAULT_BATCH_SIZE = 500
+
+def iter_stix_objects(json_file_path, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yield the entries of a STIX bundle's top-level `objects` array one at a time.
+    Only the object being decoded is held in memory, not the whole bundle.
+    """
+    decoder = json.JSONDecoder()
+    with open(json_file_path, 'r', encoding='utf-8') as f:
+        buf = ''
+        pos = 0
+        eof = False
+
+        def fill(min_read=chunk_size):
+            nonlocal buf, pos, eof
+            chunk = f.read(min_read)
+            if not chunk:
+                eof = True
+            buf = buf[pos:] + chunk
+            pos = 0
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in ' \t\r\n':
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        def expect(char):
+            nonlocal pos
+            skip_whitespace()
+            if pos >= len(buf) or buf[pos] != char:
+                raise ValueError(f"Malformed STIX bundle: expected '{char}'")
+            pos += 1
+
+        def peek():
+            skip_whitespace()
+            return buf[pos] if pos < len(buf) else ''
+
+        def decode_value():
+            nonlocal pos
+            skip_whitespace()
+            read_size = chunk_size
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                    # A value ending exactly at the buffer edge may be truncated (e.g. a number)
+                    if end < len(buf) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill(read_size)
+                read_size *= 2  # Large objects: grow reads instead of re-decoding many times
+
+        fill()
+        expect('{')
+        while peek() != '}':
+            key = decode_value()
+            expect(':')
+            if key == 'objects':
+                expect('[')
+                while peek() != ']':
+                    yield decode_value()
+                    if peek() == ',':
+                        pos += 1
+                expect(']')
+            else:
+                decode_value()  # Skip other bundle fields
+            if peek() == ',':
+                pos += 1
+        expect('}')
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+# --- Schema ---
+# (table, column definitions, insert verb, indexes). Tables are created in this order,
+# and indexes are only built once the data is in.
+SCHEMA = [
+    ("techniques", """
+        id VARCHAR(100) PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        description TEXT,
+        created VARCHAR(50),
+        modified VARCHAR(50),
+        attack_version VARCHAR(10),
+        tactic TEXT,
+        platforms TEXT,
+        detection TEXT,
+        mitigation TEXT
+    """, "INSERT", [
+        ("idx_techniques_id", "id"),
+    ]),
+    ("technique_tactics", """
+        technique_id VARCHAR(100),
+        tactic VARCHAR(100),
+        FOREIGN KEY (technique_id) REFERENCES techniques (id),
+        PRIMARY KEY (tactic, technique_id)
+    """, "INSERT IGNORE", [
+        ("idx_technique_tactics_technique_id", "technique_id"),
+    ]),
+    ("groups", """
+        id VARCHAR(100) PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        description TEXT,
+        created VARCHAR(50),
+        modified VARCHAR(50)
+    """, "INSERT", [
+        ("idx_groups_id", "id"),
+    ]),
+    ("software", """
+        id VARCHAR(100) PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        description TEXT,
+        created VARCHAR(50),
+        modified VARCHAR(50),
+        software_type VARCHAR(50)
+    """, "INSERT", [
+        ("idx_software_id", "id"),
+    ]),
+    ("campaigns", """
+        id VARCHAR(100) PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        description TEXT,
+        created VARCHAR(50),
+        modified VARCHAR(50)
+    """, "INSERT", [
+        ("idx_campaigns_id", "id"),
+    ]),
+    ("external_references", """
+        technique_id VARCHAR(100),
+        source_name VARCHAR(100),
+        external_id VARCHAR(50),
+        url TEXT,
+        FOREIGN KEY (technique_id) REFERENCES techniques (id)
+    """, "INSERT", [
+        ("idx_extref_technique_id", "technique_id"),
+        ("idx_extref_external_id", "external_id"),
+    ]),
+    ("group_external_references", """
+        group_id VARCHAR(100),
+        source_name VARCHAR(100),
+        external_id VARCHAR(50),
+        url TEXT,
+        FOREIGN KEY (group_id) REFERENCES groups (id)
+    """, "INSERT", [
+        ("idx_group_extref_group_id", "group_id"),
+        ("idx_group_extref_external_id", "external_id"),
+    ]),
+    ("software_external_references", """
+        software_id VARCHAR(100),
+        source_name VARCHAR(100),
+        external_id VARCHAR(50),
+        url TEXT,
+        FOREIGN KEY (software_id) REFERENCES software (id)
+    """, "INSERT", [
+        ("idx_software_extref_software_id", "software_id"),
+        ("idx_software_extref_external_id", "external_id"),
+    ]),
+    ("campaign_external_references", """
+        campaign_id VARCHAR(100),
+        source_name VARCHAR(100),
+        external_id VARCHAR(50),
+        url TEXT,
+        FOREIGN KEY (campaign_id) REFERENCES campaigns (id)
+    """, "INSERT", [
+        ("idx_campaign_extref_campaign_id", "campaign_id"),
+        ("idx_campaign_extref_external_id", "external_id"),
+    ]),
+    ("group_technique_relationships", """
+        group_id VARCHAR(100),
+        technique_id VARCHAR(100),
+        FOREIGN KEY (group_id) REFERENCES groups (id),
+        FOREIGN KEY (technique_id) REFERENCES techniques (id),
+        PRIMARY KEY (group_id, technique_id)
+    """, "INSERT IGNORE", [
+        ("idx_group_tech_group_id", "group_id"),
+        ("idx_group_tech_technique_id", "technique_id"),
+    ]),
+    ("software_technique_relationships", """
+        software_id VARCHAR(100),
+        technique_id VARCHAR(100),
+        FOREIGN KEY (software_id) REFERENCES software (id),
+        FOREIGN KEY (technique_id) REFERENCES techniques (id),
+        PRIMARY KEY (software_id, technique_id)
+    """, "INSERT IGNORE", [
+        ("idx_software_tech_software_id", "software_id"),
+        ("idx_software_tech_technique_id", "technique_id"),
+    ]),
+    ("campaign_technique_relationships", """
+        campaign_id VARCHAR(100),
+        technique_id VARCHAR(100),
+        FOREIGN KEY (campaign_id) REFERENCES campaigns (id),
+        FOREIGN KEY (technique_id) REFERENCES techniques (id),
+        PRIMARY KEY (campaign_id, technique_id)
+    """, "INSERT IGNORE", [
+        ("idx_campaign_tech_campaign_id", "campaign_id"),
+        ("idx_campaign_tech_technique_id", "technique_id"),
+    ]),
+    ("group_campaign_relationships", """
+        group_id VARCHAR(100),
+        campaign_id VARCHAR(100),
+        FOREIGN KEY (group_id) REFERENCES groups (id),
+        FOREIGN KEY (campaign_id) REFERENCES campaigns (id),
+        PRIMARY KEY (group_id, campaign_id)
+    """, "INSERT IGNORE", [
+        ("idx_group_camp_group_id", "group_id"),
+        ("idx_group_camp_campaign_id", "campaign_id"),
+    ]),
+    ("relationships", """
+        source_id VARCHAR(100),
+        target_id VARCHAR(100),
+        relationship_type VARCHAR(50),
+        PRIMARY KEY (source_id, target_id)
+    """, "INSERT IGNORE", [
+        ("idx_rel_source_id", "source_id"),
+        ("idx_rel_target_id", "target_id"),
+    ]),
+    # Not STIX data: holds the data_version stamp that tells the bot its caches are stale
+    ("attack_metadata", """
+        name VARCHAR(50) PRIMARY KEY,
+        value VARCHAR(255)
+    """, "REPLACE", []),
+]
+
+# Column names per table, in insert order
+COLUMNS = {
+    table: [line.split()[0] for line in columns.strip().splitlines()
+            if not line.strip().startswith(("FOREIGN KEY", "PRIMARY KEY ("))]
+    for table, columns, _, _ in SCHEMA
+}
+
+# Summary labels, in the order they are reported
+SUMMARY_LABELS = [
+    ("techniques", "Techniques"),
+    ("technique_tactics", "Technique Tactics"),
+    ("groups", "Groups"),
+    ("software", "Software"),
+    ("campaigns", "Campaigns"),
+    ("external_references", "External References (Techniques)"),
+    ("group_external_references", "Group External References"),
+    ("software_external_references", "Software External References"),
+    ("campaign_external_references", "Campaign External References"),
+    ("group_technique_relationships", "Group-Technique Relationships"),
+    ("software_technique_relationships", "Software-Technique Relationships"),
+    ("campaign_technique_relationships", "Campaign-Technique Relationships"),
+    ("group_campaign_relationships", "Group-Campaign Relationships"),
+    ("relationships", "Generic Relationships"),
+]
+
+def _value(value):
+    """Normalise empty strings to NULL, matching how the tables have always been populated."""
+    return None if value is None or value == '' else value
+
+# Entity tables and the child tables keyed on the entity's id (first column)
+ENTITY_CHILD_TABLES = {
+    "techniques": ["technique_tactics", "external_references"],
+    "groups": ["group_external_references"],
+    "software": ["software_external_references"],
+    "campaigns": ["campaign_external_references"],
+}
+LINK_TABLES = [
+    "group_technique_relationships",
+    "software_technique_relationships",
+    "campaign_technique_relationships",
+    "group_campaign_relationships",
+    "relationships",
+]
+
+def new_data_version():
+    """A fresh, sortable data version stamp for attack_metadata."""
+    return datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+
+def is_active(item):
+    """Revoked and deprecated objects are left out of the database in every mode."""
+    return not (item.get('revoked') or item.get('x_mitre_deprecated'))
+
+def relationship_rows(source_ref, target_ref, rel_type):
+    """The relationships row for one STIX relationship, plus its row in the matching join table, if any."""
+    yield 'relationships', (source_ref, target_ref, rel_type)
+
+    if rel_type == 'uses':
+        if source_ref.startswith('intrusion-set--') and target_ref.startswith('attack-pattern--'):
+            yield 'group_technique_relationships', (source_ref, target_ref)
+        elif source_ref.startswith('malware--') or source_ref.startswith('tool--'):
+            if target_ref.startswith('attack-pattern--'):
+                yield 'software_technique_relationships', (source_ref, target_ref)
+        elif source_ref.startswith('campaign--') and target_ref.startswith('attack-pattern--'):
+            yield 'campaign_technique_relationships', (source_ref, target_ref)
+    elif rel_type == 'attributed-to':
+        if source_ref.startswith('campaign--') and target_ref.startswith('intrusion-set--'):
+            yield 'group_campaign_relationships', (target_ref, source_ref)
+
+def iter_rows(objects):
+    """
+    Map active STIX objects to (table, row) pairs, with row values in COLUMNS[table] order.
+    Relationships come last and skip any whose source or target was revoked or deprecated,
+    so the join tables never point at objects that were left out.
+    """
+    filtered = set()
+    relationships = []
+    entity_tables = {
+        'attack-pattern': ('techniques', 'external_references'),
+        'intrusion-set': ('groups', 'group_external_references'),
+        'malware': ('software', 'software_external_references'),
+        'tool': ('software', 'software_external_references'),
+        'campaign': ('campaigns', 'campaign_external_references'),
+    }
+    for item in objects:
+        if not is_active(item):
+            filtered.add(item.get('id'))
+            continue
+        item_type = item.get('type')
+
+        if item_type in entity_tables:
+            table, ref_table = entity_tables[item_type]
+            stix_id = item.get('id')
+            common = (stix_id, _value(item.get('name')), _value(item.get('description', '')),
+                      _value(item.get('created')), _value(item.get('modified')))
 
-def generate_mitre_sql(json_file_path, sql_file_path="mitre_full.sql"):
-    """Generate an SQL file for the mitre database from enterprise-attack.json."""
+            # Techniques (attack-pattern)
+            if item_type == 'attack-pattern':
+                phases = [phase.get('phase_name', '') for phase in item.get('kill_chain_phases', []) if isinstance(phase, dict)]
+                yield table, common + (
+                    _value(item.get('spec_version')),
+                    _value(','.join(phases)),
+                    _value(','.join(item.get('x_mitre_platforms', []))),
+                    _value(item.get('x_mitre_detection', '')),
+                    None,  # mitigation
+                )
+                for phase_name in phases:
+                    if phase_name:
+                        yield 'technique_tactics', (stix_id, phase_name)
+            # Software (malware or tool)
+            elif table == 'software':
+                yield table, common + (item_type,)
+            # Groups (intrusion-set) and Campaigns (campaign)
+            else:
+                yield table, common
+
+            for ref in item.get('external_references', []):
+                yield ref_table, (stix_id, _value(ref.get('source_name')),
+                                  _value(ref.get('external_id')), _value(ref.get('url')))
+
+        # Relationships
+        # Relationships wait until every revoked or deprecated object has been seen
+        elif item_type == 'relationship' and item.get('relationship_type'):
+            relationships.append((item.get('source_ref'), item.get('target_ref'), item.get('relationship_type')))
+
+    for source_ref, target_ref, rel_type in relationships:
+        if source_ref not in filtered and target_ref not in filtered:
+            yield from relationship_rows(source_ref, target_ref, rel_type)
+
+def load_objects(json_file_path, stream=False):
+    """Return an iterable of the bundle's STIX objects, streamed or loaded whole."""
+    if stream:
+        return iter_stix_objects(json_file_path)
     with open(json_file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
+        return json.load(f).get('objects', [])
+
+def escape_sql(text):
+    """Render a value as an SQL literal."""
+    if text is None or text == '':
+        return 'NULL'
+    return "'" + str(text).replace("'", "") + "'"  # Remove single quotes to avoid SQL errors
+
+def generate_mitre_sql(json_file_path, sql_file_path="mitre_full.sql", stream=False,
+                       batch_size=DEFAULT_BATCH_SIZE, transaction=True):
+    """
+    Generate an SQL file for the mitre database from enterprise-attack.json.
+    Rows are written as multi-row INSERTs of up to batch_size rows, inside a single
+    transaction with key checks off (unless transaction=False), and indexes are
+    created after the data. With stream=True the bundle is parsed incrementally.
+    Returns a dict with the object count, elapsed seconds and objects/sec.
+    """
+    stats = new_stats()
+    insert_verbs = {table: verb for table, _, verb, _ in SCHEMA}
+    pending = {table: [] for table, _, _, _ in SCHEMA}
+    row_counts = {table: 0 for table, _, _, _ in SCHEMA}
+
     # Open SQL file for writing
     with open(sql_file_path, 'w', encoding='utf-8') as sql_file:
-        # Helper function to escape SQL values
-        def escape_sql(text):
-            if text is None or text == '':
-                return 'NULL'
-            return f"'{str(text).replace('\'', '')}'"  # Remove single quotes to avoid SQL errors
+        def flush(table):
+            rows = pending[table]
+            if not rows:
+                return
+            sql_file.write(f"{insert_verbs[table]} INTO {table} ({','.join(COLUMNS[table])}) VALUES\n")
+            sql_file.write(",\n".join(rows))
+            sql_file.write(";\n")
+            pending[table] = []
 
         # --- Table Creation ---
-        # Techniques
-        sql_file.write("-- Create techniques table\n")
-        sql_file.write("""
-            CREATE TABLE techniques (
-                id VARCHAR(100) PRIMARY KEY,
-                name VARCHAR(255) NOT NULL,
-                description TEXT,
-                created VARCHAR(50),
-                modified VARCHAR(50),
-                attack_version VARCHAR(10),
-                tactic TEXT,
-                platforms TEXT,
-                detection TEXT,
-                mitigation TEXT
-            );\n\n
-        """)
-        sql_file.write("CREATE INDEX idx_techniques_id ON techniques (id);\n\n")
-
-        # Groups
-        sql_file.write("-- Create groups table\n")
-        sql_file.write("""
-            CREATE TABLE groups (
-                id VARCHAR(100) PRIMARY KEY,
-                name VARCHAR(255) NOT NULL,
-                description TEXT,
-                created VARCHAR(50),
-                modified VARCHAR(50)
-            );\n\n
-        """)
-        sql_file.write("CREATE INDEX idx_groups_id ON groups (id);\n\n")
-
-        # Software
-        sql_file.write("-- Create software table\n")
-        sql_file.write("""
-            CREATE TABLE software (
-                id VARCHAR(100) PRIMARY KEY,
-                name VARCHAR(255) NOT NULL,
-                description TEXT,
-                created VARCHAR(50),
-                modified VARCHAR(50),
-                software_type VARCHAR(50)
-            );\n\n
-        """)
-        sql_file.write("CREATE INDEX idx_software_id ON software (id);\n\n")
-
-        # Campaigns
-        sql_file.write("-- Create campaigns table\n")
-        sql_file.write("""
-            CREATE TABLE campaigns (
-                id VARCHAR(100) PRIMARY KEY,
-                name VARCHAR(255) NOT NULL,
-                description TEXT,
-                created VARCHAR(50),
-                modified VARCHAR(50)
-            );\n\n
-        """)
-        sql_file.write("CREATE INDEX idx_campaigns_id ON campaigns (id);\n\n")
-
-        # External References
-        sql_file.write("-- Create external_references table (for techniques)\n")
-        sql_file.write("""
-            CREATE TABLE external_references (
-                technique_id VARCHAR(100),
-                source_name VARCHAR(100),
-                external_id VARCHAR(50),
-                url TEXT,
-                FOREIGN KEY (technique_id) REFERENCES techniques (id)
-            );\n\n
-        """)
-        sql_file.write("CREATE INDEX idx_extref_technique_id ON external_references (technique_id);\n")
-        sql_file.write("CREATE INDEX idx_extref_external_id ON external_references (external_id);\n\n")
-
-        sql_file.write("-- Create group_external_references table\n")
-        sql_file.write("""
-            CREATE TABLE group_external_references (
-                group_id VARCHAR(100),
-                source_name VARCHAR(100),
-                external_id VARCHAR(50),
-                url TEXT,
-                FOREIGN KEY (group_id) REFERENCES groups (id)
-            );\n\n
-        """)
-        sql_file.write("CREATE INDEX idx_group_extref_group_id ON group_external_references (group_id);\n")
-        sql_file.write("CREATE INDEX idx_group_extref_external_id ON group_external_references (external_id);\n\n")
-
-        sql_file.write("-- Create software_external_references table\n")
-        sql_file.write("""
-            CREATE TABLE software_external_references (
-                software_id VARCHAR(100),
-                source_name VARCHAR(100),
-                external_id VARCHAR(50),
-                url TEXT,
-                FOREIGN KEY (software_id) REFERENCES software (id)
-            );\n\n
-        """)
-        sql_file.write("CREATE INDEX idx_software_extref_software_id ON software_external_references (software_id);\n")
-        sql_file.write("CREATE INDEX idx_software_extref_external_id ON software_external_references (external_id);\n\n")
-
-        sql_file.write("-- Create campaign_external_references table\n")
-        sql_file.write("""
-            CREATE TABLE campaign_external_references (
-                campaign_id VARCHAR(100),
-                source_name VARCHAR(100),
-                external_id VARCHAR(50),
-                url TEXT,
-                FOREIGN KEY (campaign_id) REFERENCES campaigns (id)
-            );\n\n
-        """)
-        sql_file.write("CREATE INDEX idx_campaign_extref_campaign_id ON campaign_external_references (campaign_id);\n")
-        sql_file.write("CREATE INDEX idx_campaign_extref_external_id ON campaign_external_references (external_id);\n\n")
-
-        # Relationship Tables
-        sql_file.write("-- Create group_technique_relationships\n")
-        sql_file.write("""
-            CREATE TABLE group_technique_relationships (
-                group_id VARCHAR(100),
-                technique_id VARCHAR(100),
-                FOREIGN KEY (group_id) REFERENCES groups (id),
-                FOREIGN KEY (technique_id) REFERENCES techniques (id),
-                PRIMARY KEY (group_id, technique_id)
-            );\n\n
-        """)
-        sql_file.write("CREATE INDEX idx_group_tech_group_id ON group_technique_relationships (group_id);\n")
-        sql_file.write("CREATE INDEX idx_group_tech_technique_id ON group_technique_relationships (technique_id);\n\n")
-
-        sql_file.write("-- Create software_technique_relationships\n")
-        sql_file.write("""
-            CREATE TABLE software_technique_relationships (
-                software_id VARCHAR(100),
-                technique_id VARCHAR(100),
-                FOREIGN KEY (software_id) REFERENCES software (id),
-                FOREIGN KEY (technique_id) REFERENCES techniques (id),
-                PRIMARY KEY (software_id, technique_id)
-            );\n\n
-        """)
-        sql_file.write("CREATE INDEX idx_software_tech_software_id ON software_technique_relationships (software_id);\n")
-        sql_file.write("CREATE INDEX idx_software_tech_technique_id ON software_technique_relationships (technique_id);\n\n")
-
-        sql_file.write("-- Create campaign_technique_relationships\n")
-        sql_file.write("""
-            CREATE TABLE campaign_technique_relationships (
-                campaign_id VARCHAR(100),
-                technique_id VARCHAR(100),
-                FOREIGN KEY (campaign_id) REFERENCES campaigns (id),
-                FOREIGN KEY (technique_id) REFERENCES techniques (id),
-                PRIMARY KEY (campaign_id, technique_id)
-            );\n\n
-        """)
-        sql_file.write("CREATE INDEX idx_campaign_tech_campaign_id ON campaign_technique_relationships (campaign_id);\n")
-        sql_file.write("CREATE INDEX idx_campaign_tech_technique_id ON campaign_technique_relationships (technique_id);\n\n")
-
-        sql_file.write("-- Create group_campaign_relationships\n")
-        sql_file.write("""
-            CREATE TABLE group_campaign_relationships (
-                group_id VARCHAR(100),
-                campaign_id VARCHAR(100),
-                FOREIGN KEY (group_id) REFERENCES groups (id),
-                FOREIGN KEY (campaign_id) REFERENCES campaigns (id),
-                PRIMARY KEY (group_id, campaign_id)
-            );\n\n
-        """)
-        sql_file.write("CREATE INDEX idx_group_camp_group_id ON group_campaign_relationships (group_id);\n")
-        sql_file.write("CREATE INDEX idx_group_camp_campaign_id ON group_campaign_relationships (campaign_id);\n\n")
-
-        sql_file.write("-- Create generic relationships table\n")
-        sql_file.write("""
-            CREATE TABLE relationships (
-                source_id VARCHAR(100),
-                target_id VARCHAR(100),
-                relationship_type VARCHAR(50),
-                PRIMARY KEY (source_id, target_id)
-            );\n\n
-        """)
-        sql_file.write("CREATE INDEX idx_rel_source_id ON relationships (source_id);\n")
-        sql_file.write("CREATE INDEX idx_rel_target_id ON relationships (target_id);\n\n")
+        for table, columns, _, _ in SCHEMA:
+            sql_file.write(f"-- Create {table} table\n")
+            sql_file.write(f"CREATE TABLE {table} ({' '.join(columns.split())});\n")
 
         # --- Data Insertion ---
-        technique_count = 0
-        group_count = 0
-        software_count = 0
-        campaign_count = 0
-        ext_ref_count = 0
-        group_ext_ref_count = 0
-        software_ext_ref_count = 0
-        campaign_ext_ref_count = 0
-        group_tech_count = 0
-        soft_tech_count = 0
-        camp_tech_count = 0
-        group_camp_count = 0
-        generic_rel_count = 0
-
-        sql_file.write("-- Insert data\n")
-        for item in data.get('objects', []):
-            item_type = item.get('type')
-
-            # Techniques (attack-pattern)
-            if item_type == 'attack-pattern':
-                sql_file.write("-- Insert technique\n")
-                technique_id = item.get('id')
-                name = escape_sql(item.get('name'))
-                description = escape_sql(item.get('description', ''))
-                created = escape_sql(item.get('created'))
-                modified = escape_sql(item.get('modified'))
-                attack_version = escape_sql(item.get('spec_version'))
-                tactics = escape_sql(','.join(phase.get('phase_name', '') for phase in item.get('kill_chain_phases', []) if isinstance(phase, dict)))
-                platforms = escape_sql(','.join(item.get('x_mitre_platforms', [])))
-                detection = escape_sql(item.get('x_mitre_detection', ''))
-                mitigation = escape_sql('')
-
-                sql_file.write(f"""
-                    INSERT INTO techniques 
-                    (id, name, description, created, modified, attack_version, tactic, platforms, detection, mitigation)
-                    VALUES (
-                        '{technique_id}', {name}, {description}, {created}, {modified}, 
-                        {attack_version}, {tactics}, {platforms}, {detection}, {mitigation}
-                    );\n
-                """)
-                technique_count += 1
-
-                for ref in item.get('external_references', []):
-                    sql_file.write(f"""
-                        INSERT INTO external_references 
-                        (technique_id, source_name, external_id, url)
-                        VALUES (
-                            '{technique_id}', {escape_sql(ref.get('source_name'))}, 
-                            {escape_sql(ref.get('external_id'))}, {escape_sql(ref.get('url'))}
-                        );\n
-                    """)
-                    ext_ref_count += 1
-
-            # Groups (intrusion-set)
-            elif item_type == 'intrusion-set':
-                sql_file.write("-- Insert group\n")
-                group_id = item.get('id')
-                name = escape_sql(item.get('name'))
-                description = escape_sql(item.get('description', ''))
-                created = escape_sql(item.get('created'))
-                modified = escape_sql(item.get('modified'))
-
-                sql_file.write(f"""
-                    INSERT INTO groups 
-                    (id, name, description, created, modified)
-                    VALUES (
-                        '{group_id}', {name}, {description}, {created}, {modified}
-                    );\n
-                """)
-                group_count += 1
-
-                for ref in item.get('external_references', []):
-                    sql_file.write(f"""
-                        INSERT INTO group_external_references 
-                        (group_id, source_name, external_id, url)
-                        VALUES (
-                            '{group_id}', {escape_sql(ref.get('source_name'))}, 
-                            {escape_sql(ref.get('external_id'))}, {escape_sql(ref.get('url'))}
-                        );\n
-                    """)
-                    group_ext_ref_count += 1
-
-            # Software (malware or tool)
-            elif item_type in ['malware', 'tool']:
-                sql_file.write("-- Insert software\n")
-                software_id = item.get('id')
-                name = escape_sql(item.get('name'))
-                description = escape_sql(item.get('description', ''))
-                created = escape_sql(item.get('created'))
-                modified = escape_sql(item.get('modified'))
-                software_type = escape_sql(item_type)
-
-                sql_file.write(f"""
-                    INSERT INTO software 
-                    (id, name, description, created, modified, software_type)
-                    VALUES (
-                        '{software_id}', {name}, {description}, {created}, {modified}, {software_type}
-                    );\n
-                """)
-                software_count += 1
-
-                for ref in item.get('external_references', []):
-                    sql_file.write(f"""
-                        INSERT INTO software_external_references 
-                        (software_id, source_name, external_id, url)
-                        VALUES (
-                            '{software_id}', {escape_sql(ref.get('source_name'))}, 
-                            {escape_sql(ref.get('external_id'))}, {escape_sql(ref.get('url'))}
-                        );\n
-                    """)
-                    software_ext_ref_count += 1
-
-            # Campaigns (campaign)
-            elif item_type == 'campaign':
-                sql_file.write("-- Insert campaign\n")
-                campaign_id = item.get('id')
-                name = escape_sql(item.get('name'))
-                description = escape_sql(item.get('description', ''))
-                created = escape_sql(item.get('created'))
-                modified = escape_sql(item.get('modified'))
-
-                sql_file.write(f"""
-                    INSERT INTO campaigns 
-                    (id, name, description, created, modified)
-                    VALUES (
-                        '{campaign_id}', {name}, {description}, {created}, {modified}
-                    );\n
-                """)
-                campaign_count += 1
-
-                for ref in item.get('external_references', []):
-                    sql_file.write(f"""
-                        INSERT INTO campaign_external_references 
-                        (campaign_id, source_name, external_id, url)
-                        VALUES (
-                            '{campaign_id}', {escape_sql(ref.get('source_name'))}, 
-                            {escape_sql(ref.get('external_id'))}, {escape_sql(ref.get('url'))}
-                        );\n
-                    """)
-                    campaign_ext_ref_count += 1
-
-            # Relationships
-            elif item_type == 'relationship' and item.get('relationship_type'):
-                source_ref = item.get('source_ref')
-                target_ref = item.get('target_ref')
-                rel_type = item.get('relationship_type')
-
-                sql_file.write(f"""
-                    INSERT IGNORE INTO relationships 
-                    (source_id, target_id, relationship_type)
-                    VALUES (
-                        '{source_ref}', '{target_ref}', '{rel_type}'
-                    );\n
-                """)
-                generic_rel_count += 1
-
-                if rel_type == 'uses':
-                    if source_ref.startswith('intrusion-set--') and target_ref.startswith('attack-pattern--'):
-                        sql_file.write(f"""
-                            INSERT IGNORE INTO group_technique_relationships 
-                            (group_id, technique_id)
-                            VALUES (
-                                '{source_ref}', '{target_ref}'
-                            );\n
-                        """)
-                        group_tech_count += 1
-                    elif source_ref.startswith('malware--') or source_ref.startswith('tool--'):
-                        if target_ref.startswith('attack-pattern--'):
-                            sql_file.write(f"""
-                                INSERT IGNORE INTO software_technique_relationships 
-                                (software_id, technique_id)
-                                VALUES (
-                                    '{source_ref}', '{target_ref}'
-                                );\n
-                            """)
-                            soft_tech_count += 1
-                    elif source_ref.startswith('campaign--') and target_ref.startswith('attack-pattern--'):
-                        sql_file.write(f"""
-                            INSERT IGNORE INTO campaign_technique_relationships 
-                            (campaign_id, technique_id)
-                            VALUES (
-                                '{source_ref}', '{target_ref}'
-                            );\n
-                        """)
-                        camp_tech_count += 1
-                elif rel_type == 'attributed-to':
-                    if source_ref.startswith('campaign--') and target_ref.startswith('intrusion-set--'):
-                        sql_file.write(f"""
-                            INSERT IGNORE INTO group_campaign_relationships 
-                            (group_id, campaign_id)
-                            VALUES (
-                                '{target_ref}', '{source_ref}'
-                            );\n
-                        """)
-                        group_camp_count += 1
+        sql_file.write("\n-- Insert data\n")
+        if transaction:
+            sql_file.write("SET unique_checks = 0;\nSET foreign_key_checks = 0;\nSTART TRANSACTION;\n")
+        for table, row in iter_rows(counted(load_objects(json_file_path, stream), stats)):
+            pending[table].append("(" + ",".join(escape_sql(value) for value in row) + ")")
+            row_counts[table] += 1
+            if len(pending[table]) >= batch_size:
+                flush(table)
+        for table in pending:
+            flush(table)
+        sql_file.write(f"REPLACE INTO attack_metadata (name,value) VALUES ('data_version','{new_data_version()}');\n")
+        if transaction:
+            sql_file.write("COMMIT;\nSET foreign_key_checks = 1;\nSET unique_checks = 1;\n")
+
+        # --- Indexes (after the data, so they are built once instead of row by row) ---
+        sql_file.write("\n-- Create indexes\n")
+        for table, _, _, indexes in SCHEMA:
+            for index_name, column in indexes:
+                sql_file.write(f"CREATE INDEX {index_name} ON {table} ({column});\n")
 
         # --- Summary ---
         sql_file.write(f"\n-- Summary of Inserted Data:\n")
-        sql_file.write(f"-- Techniques: {technique_count}\n")
-        sql_file.write(f"-- Groups: {group_count}\n")
-        sql_file.write(f"-- Software: {software_count}\n")
-        sql_file.write(f"-- Campaigns: {campaign_count}\n")
-        sql_file.write(f"-- External References (Techniques): {ext_ref_count}\n")
-        sql_file.write(f"-- Group External References: {group_ext_ref_count}\n")
-        sql_file.write(f"-- Software External References: {software_ext_ref_count}\n")
-        sql_file.write(f"-- Campaign External References: {campaign_ext_ref_count}\n")
-        sql_file.write(f"-- Group-Technique Relationships: {group_tech_count}\n")
-        sql_file.write(f"-- Software-Technique Relationships: {soft_tech_count}\n")
-        sql_file.write(f"-- Campaign-Technique Relationships: {camp_tech_count}\n")
-        sql_file.write(f"-- Group-Campaign Relationships: {group_camp_count}\n")
-        sql_file.write(f"-- Generic Relationships: {generic_rel_count}\n")
+        for table, label in SUMMARY_LABELS:
+            sql_file.write(f"-- {label}: {row_counts[table]}\n")
         sql_file.write(f"-- Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
 
+    return finish_stats(stats)
+
+def load_into_database(json_file_path, stream=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Load the bundle straight into the configured database, skipping the SQL file.
+    Rows go into fresh `<table>_new` staging tables through parameterized executemany
+    batches, indexes are built once the data is in, and a single RENAME TABLE then swaps
+    every staging table in at once. Readers see the old data until the swap and the new
+    data after it; if the load fails, the live tables are left untouched.
+    Values are passed as parameters, so quotes survive instead of being stripped.
+    Returns the same stats dict as generate_mitre_sql.
+    """
+    from db import connect_to_db
+
+    stats = new_stats()
+    conn = connect_to_db()
+    tables = [table for table, _, _, _ in SCHEMA]
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SET foreign_key_checks = 0")
+        cursor.execute("SET unique_checks = 0")
+
+        # --- Staging Tables (leftovers from an interrupted load are discarded) ---
+        for table in reversed(tables):
+            cursor.execute(f"DROP TABLE IF EXISTS {table}_new, {table}_old")
+        for table, columns, _, _ in SCHEMA:
+            # Foreign keys point at the other staging tables and follow them through the rename
+            columns = re.sub(r"REFERENCES (\w+) \(", r"REFERENCES \1_new (", ' '.join(columns.split()))
+            cursor.execute(f"CREATE TABLE {table}_new ({columns})")
+
+        # --- Data Insertion ---
+        statements = {
+            table: f"{verb} INTO {table}_new ({','.join(COLUMNS[table])}) VALUES ({','.join(['%s'] * len(COLUMNS[table]))})"
+            for table, _, verb, _ in SCHEMA
+        }
+        pending = {table: [] for table in statements}
+        conn.start_transaction()
+        for table, row in iter_rows(counted(load_objects(json_file_path, stream), stats)):
+            pending[table].append(row)
+            if len(pending[table]) >= batch_size:
+                cursor.executemany(statements[table], pending[table])
+                pending[table] = []
+        for table, rows in pending.items():
+            if rows:
+                cursor.executemany(statements[table], rows)
+        cursor.execute(statements["attack_metadata"], ("data_version", new_data_version()))
+        conn.commit()
+
+        # --- Indexes ---
+        for table, _, _, indexes in SCHEMA:
+            for index_name, column in indexes:
+                cursor.execute(f"CREATE INDEX {index_name} ON {table}_new ({column})")
+
+        # --- Atomic Swap ---
+        cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = DATABASE()")
+        existing = {row[0] for row in cursor.fetchall()}
+        renames = [f"{table} TO {table}_old" for table in tables if table in existing]
+        renames += [f"{table}_new TO {table}" for table in tables]
+        cursor.execute(f"RENAME TABLE {', '.join(renames)}")
+        for table in reversed(tables):
+            cursor.execute(f"DROP TABLE IF EXISTS {table}_old")
+
+        cursor.execute("SET unique_checks = 1")
+        cursor.execute("SET foreign_key_checks = 1")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return finish_stats(stats)
+
+def sync_database(json_file_path, stream=False, dry_run=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Bring an existing database up to date with a newer bundle, touching only what changed.
+    Entities are diffed by STIX id and `modified`: new ones are inserted, changed ones are
+    upserted with their references and tactics rewritten, and ones missing from the bundle
+    (or now revoked/deprecated) are deleted. Relationship tables are diffed row by row.
+    Everything is applied in one transaction, so readers never see a half-synced state.
+    Returns stats including a per-table summary; with dry_run=True nothing is written.
+    """
+    from db import connect_to_db
+
+    stats = new_stats()
+    conn = connect_to_db()
+    try:
+        cursor = conn.cursor()
+
+        # --- Current state ---
+        current = {}  # STIX id -> (table, modified)
+        for table in ENTITY_CHILD_TABLES:
+            cursor.execute(f"SELECT id, modified FROM {table}")
+            for stix_id, modified in cursor.fetchall():
+                current[stix_id] = (table, modified)
+        current_links = {}
+        for table in LINK_TABLES:
+            cursor.execute(f"SELECT {','.join(COLUMNS[table])} FROM {table}")
+            current_links[table] = set(cursor.fetchall())
+
+        # --- Diff against the bundle ---
+        seen = set()
+        filtered = set()  # revoked or deprecated STIX ids
+        changed = {table: {"insert": [], "update": []} for table in ENTITY_CHILD_TABLES}
+        upserts = {table: [] for table, _, _, _ in SCHEMA}
+        desired_links = {table: {} for table in LINK_TABLES}
+        for item in counted(load_objects(json_file_path, stream), stats):
+            if not is_active(item):
+                filtered.add(item.get('id'))
+                continue
+            rows = list(iter_rows([item]))
+            if not rows:
+                continue
+            table, row = rows[0]
+            if table in desired_links:
+                for link_table, link in rows:
+                    # relationships is keyed on (source_id, target_id); the first row wins, like INSERT IGNORE
+                    key = link[:2] if link_table == "relationships" else link
+                    desired_links[link_table].setdefault(key, link)
+                continue
+
+            stix_id = row[0]
+            seen.add(stix_id)
+            previous = current.get(stix_id)
+            modified = row[COLUMNS[table].index("modified")]
+            if previous == (table, modified):
+                continue
+            changed[table]["insert" if previous is None else "update"].append(stix_id)
+            for child_table, child_row in rows:
+                upserts[child_table].append(child_row)
+
+        # Every link table starts with the two ids it joins; drop links to objects that were left out
+        for table in LINK_TABLES:
+            desired_links[table] = {key: link for key, link in desired_links[table].items()
+                                    if link[0] not in filtered and link[1] not in filtered}
+
+        removed = {table: [] for table in ENTITY_CHILD_TABLES}
+        for stix_id, (table, _) in current.items():
+            if stix_id not in seen:
+                removed[table].append(stix_id)
+        links_added = {table: set(desired_links[table].values()) - current_links[table] for table in LINK_TABLES}
+        links_removed = {table: current_links[table] - set(desired_links[table].values()) for table in LINK_TABLES}
+
+        stats["summary"] = {}
+        for table in ENTITY_CHILD_TABLES:
+            stats["summary"][table] = {
+                "inserted": len(changed[table]["insert"]),
+                "updated": len(changed[table]["update"]),
+                "deleted": len(removed[table]),
+            }
+        for table in LINK_TABLES:
+            stats["summary"][table] = {"inserted": len(links_added[table]), "deleted": len(links_removed[table])}
+
+        if dry_run:
+            return finish_stats(stats)
+
+        # --- Apply ---
+        def in_batches(items):
+            items = list(items)
+            for start in range(0, len(items), batch_size):
+                yield items[start:start + batch_size]
+
+        metadata_columns = [columns for table, columns, _, _ in SCHEMA if table == "attack_metadata"][0]
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS attack_metadata ({' '.join(metadata_columns.split())})")
+        cursor.execute("SET foreign_key_checks = 0")
+        conn.start_transaction()
+        for table, children in ENTITY_CHILD_TABLES.items():
+            # Children of updated and removed entities are rewritten from scratch
+            stale = changed[table]["update"] + removed[table]
+            for batch in in_batches(stale):
+                placeholders = ','.join(['%s'] * len(batch))
+                for child_table in children:
+                    cursor.execute(f"DELETE FROM {child_table} WHERE {COLUMNS[child_table][0]} IN ({placeholders})", batch)
+            for batch in in_batches(removed[table]):
+                cursor.execute(f"DELETE FROM {table} WHERE id IN ({','.join(['%s'] * len(batch))})", batch)
+        for table in LINK_TABLES:
+            key_columns = COLUMNS[table][:2]
+            where = ' AND '.join(f"{column} = %s" for column in key_columns)
+            for batch in in_batches(links_removed[table]):
+                cursor.executemany(f"DELETE FROM {table} WHERE {where}", [link[:2] for link in batch])
+
+        for table, _, verb, _ in SCHEMA:
+            columns = COLUMNS[table]
+            if table in ENTITY_CHILD_TABLES:
+                updates = ', '.join(f"{column} = VALUES({column})" for column in columns[1:])
+                statement = f"INSERT INTO {table} ({','.join(columns)}) VALUES ({','.join(['%s'] * len(columns))}) ON DUPLICATE KEY UPDATE {updates}"
+                rows = upserts[table]
+            else:
+                statement = f"{verb} INTO {table} ({','.join(columns)}) VALUES ({','.join(['%s'] * len(columns))})"
+                rows = links_added[table] if table in links_added else upserts[table]
+            for batch in in_batches(rows):
+                cursor.executemany(statement, batch)
+        if any(count for counts in stats["summary"].values() for count in counts.values()):
+            cursor.execute("REPLACE INTO attack_metadata (name, value) VALUES ('data_version', %s)", (new_data_version(),))
+        conn.commit()
+        cursor.execute("SET foreign_key_checks = 1")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return finish_stats(stats)
+
+def print_sync_summary(stats, dry_run=False):
+    print("Sync summary" + (" (dry run, nothing written)" if dry_run else "") + ":")
+    for table, counts in stats["summary"].items():
+        print(f"  {table}: " + ", ".join(f"{action} {count}" for action, count in counts.items()))
+
+def new_stats():
+    return {"objects": 0, "started": time.monotonic()}
+
+def counted(objects, stats):
+    """Pass objects through while counting them into stats."""
+    for item in objects:
+        stats["objects"] += 1
+        yield item
+
+def finish_stats(stats):
+    elapsed = time.monotonic() - stats.pop("started")
+    stats["seconds"] = elapsed
+    stats["objects_per_sec"] = stats["objects"] / elapsed if elapsed else 0.0
+    return stats
+
+def print_stats(stats):
+    print(f"Processed {stats['objects']} objects in {stats['seconds']:.2f}s ({stats['objects_per_sec']:.0f} objects/sec)")
+    peak = peak_rss_mb()
+    if peak is not None:
+        print(f"Peak RSS: {peak:.1f} MB")
+
 def main():
-    json_file_path = 'enterprise-attack.json'
-    sql_file_path = 'mitre_full.sql'
-    
+    parser = argparse.ArgumentParser(description="Generate the mitre database from a STIX ATT&CK bundle.")
+    parser.add_argument('json_file', nargs='?', default='enterprise-attack.json', help='STIX bundle to read')
+    parser.add_argument('--mode', choices=['sql', 'load', 'sync'], default='sql',
+                        help='sql: write an SQL file; load: rebuild the DB_* database; '
+                             'sync: apply only the changes since the last load')
+    parser.add_argument('--dry-run', action='store_true', help='sync mode: report the changes without applying them')
+    parser.add_argument('-o', '--output', default='mitre_full.sql', help='SQL file to write (sql mode)')
+    parser.add_argument('--stream', action='store_true', help='parse the bundle incrementally with bounded memory')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='rows per INSERT batch')
+    args = parser.parse_args()
+    json_file_path = args.json_file
+    sql_file_path = args.output
+
     try:
-        generate_mitre_sql(json_file_path, sql_file_path)
-        print(f"Successfully generated {sql_file_path}")
+        if args.mode == 'load':
+            stats = load_into_database(json_file_path, stream=args.stream, batch_size=args.batch_size)
+            print("Successfully loaded the database")
+        elif args.mode == 'sync':
+            stats = sync_database(json_file_path, stream=args.stream, dry_run=args.dry_run, batch_size=args.batch_size)
+            print_sync_summary(stats, dry_run=args.dry_run)
+        else:
+            stats = generate_mitre_sql(json_file_path, sql_file_path, stream=args.stream, batch_size=args.batch_size)
+            print(f"Successfully generated {sql_file_path}")
+        print_stats(stats)
     except FileNotFoundError:
         print(f"Error: Could not find {json_file_path}. Please download it from https://raw.githubusercontent.com/mitre/cti/master/enterprise-attack/enterprise-attack.json")
     except Exception as e:
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+import aiohttp
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+OLLAMA_URL = os.getenv("OLLAMA_URL")  # Full generate endpoint, e.g. http://localhost:11434/api/generate
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
+OLLAMA_POOL_LIMIT = int(os.getenv("OLLAMA_POOL_LIMIT", "4"))
+OLLAMA_MAX_CONCURRENT = int(os.getenv("OLLAMA_MAX_CONCURRENT", "2"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "10"))
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "600"))
+OLLAMA_RETRIES = int(os.getenv("OLLAMA_RETRIES", "3"))
+OLLAMA_BACKOFF = float(os.getenv("OLLAMA_BACKOFF", "1.0"))
+
+# Statuses worth retrying: the model server is loading a model or briefly overloaded
+RETRY_STATUSES = {429, 502, 503, 504}
+
+class OllamaError(Exception):
+    """Raised when Ollama cannot produce a response, after any retries."""
+
+class Usage:
+    """Tokens generated and model time spent across the generations of one piece of work."""
+
+    def __init__(self):
+        self.generations = 0
+        self.tokens = 0
+        self.seconds = 0.0
+
+    def add(self, tokens: int, seconds: float):
+        self.generations += 1
+        self.tokens += tokens
+        self.seconds += seconds
+
+    @property
+    def tokens_per_sec(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+# Usage being accumulated in the current task; tasks it creates inherit it
+_usage: ContextVar[Optional[Usage]] = ContextVar("ollama_usage", default=None)
+
+@contextmanager
+def track_usage(usage: Optional[Usage] = None) -> Iterator[Usage]:
+    """Count tokens for every generation started inside the block, including from tasks it spawns."""
+    usage = usage or Usage()
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+class OllamaClient:
+    """
+    Long-lived Ollama client shared by every generation path.
+    Holds one keep-alive HTTP session, retries transient failures with exponential
+    backoff, and caps concurrent generations so extra requests queue here rather
+    than piling onto the model server.
+    """
+
+    def __init__(self, url: Optional[str] = OLLAMA_URL, model: str = OLLAMA_MODEL,
+                 pool_limit: int = OLLAMA_POOL_LIMIT, max_concurrent: int = OLLAMA_MAX_CONCURRENT,
+                 connect_timeout: float = OLLAMA_CONNECT_TIMEOUT, timeout: float = OLLAMA_TIMEOUT,
+                 retries: int = OLLAMA_RETRIES, backoff: float = OLLAMA_BACKOFF):
+        self.url = url
+        self.model = model
+        self.pool_limit = pool_limit
+        self.max_concurrent = max_concurrent
+        self.timeout = aiohttp.ClientTimeout(total=timeout, sock_connect=connect_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.counters = {"generations": 0, "failures": 0, "retries": 0, "tokens": 0, "eval_seconds": 0.0}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared session, created on first use inside the running event loop."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_limit, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    def payload(self, prompt: str, model: Optional[str] = None, stream: bool = False, **options) -> Dict[str, Any]:
+        payload = {"model": model or self.model, "prompt": prompt, "stream": stream}
+        if options:
+            payload["options"] = options
+        return payload
+
+    async def generate(self, prompt: str, model: Optional[str] = None, **options) -> str:
+        """Run a non-streaming generation and return the response text."""
+        if not self.url:
+            raise OllamaError("OLLAMA_URL is not configured")
+        payload = self.payload(prompt, model, **options)
+        await self._acquire()
+        try:
+            return await self._post_with_retries(payload)
+        except OllamaError:
+            self.counters["failures"] += 1
+            raise
+        finally:
+            self.semaphore.release()
+
+    async def stream(self, prompt: str, model: Optional[str] = None, **options) -> AsyncIterator[str]:
+        """
+        Run a streaming generation, yielding text fragments as Ollama produces them.
+        Failures are retried only until the first fragment arrives; after that they raise.
+        """
+        if not self.url:
+            raise OllamaError("OLLAMA_URL is not configured")
+        payload = self.payload(prompt, model, stream=True, **options)
+        await self._acquire()
+        try:
+            for attempt in range(self.retries + 1):
+                started = False
+                requested = time.monotonic()
+                try:
+                    async with self.session.post(self.url, json=payload) as response:
+                        if response.status != 200:
+                            error = OllamaError(f"Ollama returned status {response.status}")
+                            if response.status not in RETRY_STATUSES:
+                                raise error
+                        else:
+                            # NDJSON: one object per line, the last one has "done": true
+                            async for line in response.content:
+                                if not line.strip():
+                                    continue
+                                try:
+                                    chunk = json.loads(line)
+                                except ValueError as e:
+                                    raise OllamaError(f"Malformed response from Ollama: {e}") from e
+                                if not isinstance(chunk, dict):
+                                    raise OllamaError("Malformed response from Ollama: expected a JSON object")
+                                if chunk.get('error'):
+                                    raise OllamaError(f"Ollama error: {chunk['error']}")
+                                if chunk.get('response'):
+                                    started = True
+                                    yield chunk['response']
+                                if chunk.get('done'):
+                                    self._record(chunk, time.monotonic() - requested)
+                                    return
+                            raise OllamaError("Ollama stream ended early")
+                except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                    error = OllamaError(f"Error connecting to Ollama: {e or type(e).__name__}")
+                    if started:
+                        raise error
+                if attempt < self.retries:
+                    delay = self.backoff * 2 ** attempt
+                    logger.warning(f"{error}; retrying in {delay:.1f}s ({attempt + 1}/{self.retries})")
+                    self.counters["retries"] += 1
+                    await asyncio.sleep(delay)
+            raise error
+        except OllamaError:
+            self.counters["failures"] += 1
+            raise
+        finally:
+            self.semaphore.release()
+
+    async def _acquire(self):
+        """Wait for a generation slot, counting how many callers are queued."""
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+    def _record(self, result: Dict[str, Any], elapsed: float):
+        """Count a finished generation, using Ollama's own eval timing when it reports one."""
+        tokens = result.get('eval_count') or 0
+        seconds = result['eval_duration'] / 1e9 if result.get('eval_duration') else elapsed
+        self.counters["generations"] += 1
+        self.counters["tokens"] += tokens
+        self.counters["eval_seconds"] += seconds
+        usage = _usage.get()
+        if usage is not None:
+            usage.add(tokens, seconds)
+
+    async def _post_with_retries(self, payload: Dict[str, Any]) -> str:
+        for attempt in range(self.retries + 1):
+            requested = time.monotonic()
+            try:
+                async with self.session.post(self.url, json=payload) as response:
+                    if response.status == 200:
+                        try:
+                            result = await response.json(content_type=None)
+                        except ValueError as e:
+                            raise OllamaError(f"Malformed response from Ollama: {e}") from e
+                        if not isinstance(result, dict) or 'response' not in result:
+                            raise OllamaError("No response from Ollama")
+                        self._record(result, time.monotonic() - requested)
+                        return result['response']
+                    if response.status not in RETRY_STATUSES:
+                        raise OllamaError(f"Ollama returned status {response.status}")
+                    error = OllamaError(f"Ollama returned status {response.status}")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                error = OllamaError(f"Error connecting to Ollama: {e or type(e).__name__}")
+            if attempt < self.retries:
+                delay = self.backoff * 2 ** attempt
+                logger.warning(f"{error}; retrying in {delay:.1f}s ({attempt + 1}/{self.retries})")
+                self.counters["retries"] += 1
+                await asyncio.sleep(delay)
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        """Generation counters, overall tokens/sec and how many callers are waiting for a slot."""
+        seconds = self.counters["eval_seconds"]
+        return dict(
+            self.counters,
+            eval_seconds=round(seconds, 3),
+            tokens_per_sec=round(self.counters["tokens"] / seconds, 2) if seconds else 0.0,
+            waiting=self.waiting,
+        )
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+# Process-wide client, created on first use
+_client: Optional[OllamaClient] = None
+
+def get_client() -> OllamaClient:
+    """Return the process-wide Ollama client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = OllamaClient()
+    return _client
+
+async def close_client():
+    """Close the shared HTTP session (call on bot shutdown)."""
+    if _client is not None:
+        await _client.close()
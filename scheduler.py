@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+TABLETOP_WORKERS = int(os.getenv("TABLETOP_WORKERS", "1"))
+TABLETOP_MAX_QUEUED = int(os.getenv("TABLETOP_MAX_QUEUED", "20"))
+TABLETOP_MAX_PER_USER = int(os.getenv("TABLETOP_MAX_PER_USER", "1"))
+
+QUEUE_FULL_MESSAGE = "The tabletop queue is full right now, please try again later."
+USER_LIMIT_MESSAGE = "You already have a tabletop being generated. Please wait for it to finish."
+
+# How many recent wait times to keep for the wait-time metrics
+WAIT_SAMPLES = 200
+
+class QueueFullError(Exception):
+    """Raised when the scheduler, or the submitting user's share of it, is full."""
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+class Job:
+    """One queued piece of work. Await `result()` for its return value."""
+
+    def __init__(self, user_id: int, guild_id: Optional[int], func: Callable[[], Awaitable[Any]],
+                 on_position: Optional[Callable[[int], Awaitable[None]]] = None):
+        self.user_id = user_id
+        self.guild_id = guild_id
+        self.func = func
+        self.on_position = on_position
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.submitted = time.monotonic()
+        self.started: Optional[float] = None
+        self.position: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def result(self) -> Any:
+        return await asyncio.shield(self.future)
+
+class FairScheduler:
+    """
+    Bounded async job queue with a fixed number of workers.
+    Waiting jobs are taken round-robin across guilds and, within a guild, across
+    users, so one busy server or one impatient user can't starve everyone else.
+    """
+
+    def __init__(self, name: str, workers: int = TABLETOP_WORKERS, max_queued: int = TABLETOP_MAX_QUEUED,
+                 max_per_user: int = TABLETOP_MAX_PER_USER):
+        self.name = name
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        # guild -> user -> waiting jobs; both levels rotate as jobs are taken
+        self._queues: "OrderedDict[Optional[int], OrderedDict[int, Deque[Job]]]" = OrderedDict()
+        self._running: List[Job] = []
+        self._wakeup: Optional[asyncio.Condition] = None
+        self._tasks: List[asyncio.Task] = []
+        self._notify_tasks: Set[asyncio.Task] = set()  # held so pending notifications aren't garbage-collected
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+
+    @property
+    def depth(self) -> int:
+        return sum(len(jobs) for users in self._queues.values() for jobs in users.values())
+
+    def _user_jobs(self, user_id: int) -> List[Job]:
+        jobs = [job for job in self._running if job.user_id == user_id]
+        for users in self._queues.values():
+            jobs.extend(users.get(user_id, ()))
+        return jobs
+
+    def _start(self):
+        if not self._tasks:
+            self._wakeup = asyncio.Condition()
+            self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def submit(self, user_id: int, guild_id: Optional[int], func: Callable[[], Awaitable[Any]],
+                     on_position: Optional[Callable[[int], Awaitable[None]]] = None) -> Job:
+        """Queue func() for a worker. Raises QueueFullError if the queue or the user's share is full."""
+        self._start()
+        if len(self._user_jobs(user_id)) >= self.max_per_user:
+            self.counters["rejected"] += 1
+            raise QueueFullError(USER_LIMIT_MESSAGE)
+        if self.depth >= self.max_queued:
+            self.counters["rejected"] += 1
+            raise QueueFullError(QUEUE_FULL_MESSAGE)
+        job = Job(user_id, guild_id, func, on_position)
+        self._queues.setdefault(guild_id, OrderedDict()).setdefault(user_id, deque()).append(job)
+        self.counters["submitted"] += 1
+        async with self._wakeup:
+            self._wakeup.notify()
+        self._announce_positions()
+        return job
+
+    def _next_job(self) -> Optional[Job]:
+        """Take the next job in guild/user round-robin order and rotate both levels."""
+        while self._queues:
+            guild_id, users = next(iter(self._queues.items()))
+            if not users:
+                del self._queues[guild_id]
+                continue
+            user_id, jobs = next(iter(users.items()))
+            job = jobs.popleft()
+            if jobs:
+                users.move_to_end(user_id)
+            else:
+                del users[user_id]
+            if users:
+                self._queues.move_to_end(guild_id)
+            else:
+                del self._queues[guild_id]
+            return job
+        return None
+
+    def _waiting_order(self) -> List[Job]:
+        """Every waiting job in the order the workers will take them."""
+        queues = OrderedDict(
+            (guild_id, OrderedDict((user_id, deque(jobs)) for user_id, jobs in users.items()))
+            for guild_id, users in self._queues.items()
+        )
+        saved, self._queues = self._queues, queues
+        try:
+            order = []
+            job = self._next_job()
+            while job is not None:
+                order.append(job)
+                job = self._next_job()
+            return order
+        finally:
+            self._queues = saved
+
+    def _announce_positions(self):
+        """Tell waiting jobs their (1-based) queue position whenever it changes."""
+        # Jobs that an idle worker is about to pick up aren't really waiting
+        free_workers = max(self.workers - len(self._running), 0)
+        for position, job in enumerate(self._waiting_order(), start=1 - free_workers):
+            if position >= 1 and job.position != position:
+                job.position = position
+                if job.on_position is not None:
+                    task = asyncio.create_task(self._notify(job, position))
+                    self._notify_tasks.add(task)
+                    task.add_done_callback(self._notify_tasks.discard)
+
+    async def _notify(self, job: Job, position: int):
+        try:
+            await job.on_position(position)
+        except Exception as e:
+            logger.warning(f"{self.name} queue position update failed: {e}")
+
+    async def _worker(self, index: int):
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: self.depth > 0)
+                job = self._next_job()
+            job.started = time.monotonic()
+            self._waits.append(job.started - job.submitted)
+            self._running.append(job)
+            self._announce_positions()
+            job.task = asyncio.create_task(job.func())
+            try:
+                # wait() rather than await, so cancelling the job doesn't cancel this worker
+                await asyncio.wait([job.task])
+            except asyncio.CancelledError:
+                job.task.cancel()  # The worker itself is shutting down
+                raise
+            finally:
+                self._running.remove(job)
+            if job.task.cancelled():
+                job.future.cancel()
+                self.counters["cancelled"] += 1
+            elif job.task.exception() is not None:
+                logger.error(f"{self.name} job for user {job.user_id} failed: {job.task.exception()}")
+                job.future.set_exception(job.task.exception())
+                self.counters["failed"] += 1
+            else:
+                job.future.set_result(job.task.result())
+                self.counters["completed"] += 1
+
+    def cancel(self, job: Job) -> bool:
+        """Cancel a waiting or running job. Returns False if it had already finished."""
+        if job.future.done():
+            return False
+        users = self._queues.get(job.guild_id, {})
+        jobs = users.get(job.user_id)
+        if jobs is not None and job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                del users[job.user_id]
+            if not users:
+                self._queues.pop(job.guild_id, None)
+            job.future.cancel()
+            self.counters["cancelled"] += 1
+            self._announce_positions()
+            return True
+        if job.task is not None:
+            job.task.cancel()
+            return True
+        return False
+
+    def cancel_user(self, user_id: int, guild_id: Optional[int] = None) -> int:
+        """Cancel every job of a user (optionally only those from one guild). Returns how many."""
+        jobs = [job for job in self._user_jobs(user_id) if guild_id is None or job.guild_id == guild_id]
+        return sum(self.cancel(job) for job in jobs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, running jobs and wait-time figures (seconds) for monitoring."""
+        waits = sorted(self._waits)
+        return dict(
+            self.counters,
+            queued=self.depth,
+            running=len(self._running),
+            wait_avg=round(sum(waits) / len(waits), 3) if waits else 0.0,
+            wait_p95=round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0.0,
+            wait_max=round(waits[-1], 3) if waits else 0.0,
+        )
+
+    async def shutdown(self):
+        tasks = self._tasks + list(self._notify_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+# Scheduler in front of tabletop generation
+tabletop_scheduler = FairScheduler("tabletop")
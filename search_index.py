@@ -0,0 +1,154 @@
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from db import connection
+from attack_kb import get_kb, current_data_version
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+NAME_WEIGHT = 3  # A hit in the technique name counts as this many description hits
+
+TOKEN_PATTERN = re.compile(r"[tgsc]\d{4}(?:\.\d{3})?|[a-z0-9]+")
+ID_PATTERN = re.compile(r"^[tgsc]\d{4}(?:\.\d{3})?$")
+STOPWORDS = frozenset(
+    "a an and are as at be by can for from has have in into is it its may of on or such that the their "
+    "this to use used uses using via was were which with".split()
+)
+
+def stem(word: str) -> str:
+    """Light suffix-stripping stemmer; good enough to fold plurals and verb forms together."""
+    if len(word) <= 3 or ID_PATTERN.match(word):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("sses"):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+    for suffix, min_len in (("ion", 6), ("ing", 5), ("ed", 4)):
+        if word.endswith(suffix) and len(word) > min_len:
+            word = word[:-len(suffix)]
+            break
+    if word.endswith("e") and len(word) > 4:
+        word = word[:-1]
+    return word
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase, split and stem text. ATT&CK IDs stay whole and sub-technique IDs also emit their parent."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall((text or "").lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(stem(token))
+        if ID_PATTERN.match(token) and "." in token:
+            tokens.append(token.split(".")[0])
+    return tokens
+
+class SearchIndex:
+    """Inverted index with BM25 ranking over technique names, descriptions and TTP IDs."""
+
+    def __init__(self, documents: List[Dict[str, Any]], source: Any = None):
+        self.source = source
+        self.docs = [{"attack_id": d["attack_id"], "name": d["name"], "ttp_id": d["ttp_id"]} for d in documents]
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths: List[int] = []
+
+        for doc_id, doc in enumerate(documents):
+            counts: Dict[str, int] = defaultdict(int)
+            name_tokens = tokenize(doc["name"]) + tokenize(doc["ttp_id"])
+            for token in name_tokens:
+                counts[token] += NAME_WEIGHT
+            description_tokens = tokenize(doc["description"])
+            for token in description_tokens:
+                counts[token] += 1
+            for token, tf in counts.items():
+                self.postings[token].append((doc_id, tf))
+            self.doc_lengths.append(len(name_tokens) * NAME_WEIGHT + len(description_tokens))
+
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        # Length normalisation is fixed per document, so compute it once
+        self.norms = [K1 * (1 - B + B * length / (self.avg_length or 1)) for length in self.doc_lengths]
+        total = len(self.docs)
+        self.idf = {
+            token: math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+            for token, posting in self.postings.items()
+        }
+
+    def search(self, query: str, page: int = 1, page_size: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Return (page of ranked results, total number of matches)."""
+        scores: Dict[int, float] = defaultdict(float)
+        norms = self.norms
+        for token in set(tokenize(query)):
+            idf = self.idf.get(token)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[token]:
+                scores[doc_id] += idf * tf * (K1 + 1) / (tf + norms[doc_id])
+
+        def rank_key(item):
+            return (-item[1], self.docs[item[0]]["ttp_id"] or "")
+
+        if page_size:
+            # Only the requested page needs ordering, not every match
+            start = (max(page, 1) - 1) * page_size
+            ranked = heapq.nsmallest(start + page_size, scores.items(), key=rank_key)[start:]
+        else:
+            ranked = sorted(scores.items(), key=rank_key)
+        results = [dict(self.docs[doc_id], score=round(score, 4)) for doc_id, score in ranked]
+        return results, len(scores)
+
+def _documents_from_kb(kb) -> List[Dict[str, Any]]:
+    return [{
+        "attack_id": row["id"],
+        "name": row["name"],
+        "description": row["description"],
+        "ttp_id": kb.external_ids.get(row["id"]),
+    } for row in kb.entities["technique"].values()]
+
+def _documents_from_db() -> List[Dict[str, Any]]:
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT t.id AS attack_id, t.name, t.description, er.external_id AS ttp_id
+            FROM techniques t
+            LEFT JOIN external_references er ON t.id = er.technique_id AND er.source_name = 'mitre-attack'
+        """)
+        return cursor.fetchall()
+
+# Process-wide index, rebuilt when the snapshot or data version changes, or after reset_index()
+_index: Optional[SearchIndex] = None
+_index_lock = threading.Lock()
+
+def get_index() -> SearchIndex:
+    """
+    Return the technique search index, building it from the snapshot or database if needed.
+    Without a snapshot the index is keyed on the database's data version, so a sync rebuilds it.
+    """
+    global _index
+    version = current_data_version()  # also reloads a snapshot the database has moved past
+    kb = get_kb()
+    source = kb if kb is not None else version
+    index = _index
+    if index is not None and index.source == source:
+        return index
+    with _index_lock:
+        if _index is None or _index.source != source:
+            started = time.monotonic()
+            documents = _documents_from_kb(kb) if kb is not None else _documents_from_db()
+            _index = SearchIndex(documents, source=source)
+            logger.info(f"Built technique search index over {len(documents)} techniques in {time.monotonic() - started:.2f}s")
+        return _index
+
+def reset_index():
+    """Drop the index so the next search rebuilds it (call after the database is refreshed)."""
+    global _index
+    _index = None
@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import os
+import re
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+import mitre
+import ollama
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+# Rough size of the ATT&CK reference block added to the prompt
+TABLETOP_CONTEXT_TOKENS = int(os.getenv("TABLETOP_CONTEXT_TOKENS", "1500"))
+CHARS_PER_TOKEN = 4  # Close enough for English text with most local models
+# Tabletops with at least this many injects are generated section by section (0 disables)
+TABLETOP_PIPELINE_MIN_INJECTS = int(os.getenv("TABLETOP_PIPELINE_MIN_INJECTS", "4"))
+TABLETOP_INJECT_CONCURRENCY = int(os.getenv("TABLETOP_INJECT_CONCURRENCY", "3"))
+TABLETOP_SECTION_RETRIES = int(os.getenv("TABLETOP_SECTION_RETRIES", "2"))
+# Each inject is a model generation in the pipelined path, so cap how many one request can ask for
+TABLETOP_MAX_INJECTS = int(os.getenv("TABLETOP_MAX_INJECTS", "20"))
+
+# Bump whenever build_prompt changes, so cached documents from the old prompt are not reused
+PROMPT_VERSION = "2"
+
+# Headings the prompt asks for; a new section starts at any `##` or `###` heading
+SECTION_HEADING = re.compile(r"^#{2,3} ")
+CODE_FENCE = "```"
+
+def _truncate(text: str, limit: int) -> str:
+    """Cut text to at most limit characters on a word boundary."""
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    cut = text[:max(limit - 3, 0)].rsplit(" ", 1)[0]
+    return f"{cut}..." if cut else ""
+
+def format_context(techniques: List[Dict[str, str]], token_budget: int = TABLETOP_CONTEXT_TOKENS) -> str:
+    """
+    Reference lines for the prompt, one per technique, within roughly token_budget tokens.
+    Every technique gets its name, tactics and platforms first; whatever budget is left
+    is shared evenly between their detection notes. Techniques that don't fit are counted.
+    """
+    budget = token_budget * CHARS_PER_TOKEN
+    headers = []
+    used = 0
+    for technique in techniques:
+        header = (
+            f"- {technique['ttp_id']} {technique['name']}"
+            f" (tactics: {(technique['tactic'] or 'unknown').replace(',', ', ')};"
+            f" platforms: {(technique['platforms'] or 'unknown').replace(',', ', ')})"
+        )
+        if used + len(header) + 1 > budget:
+            break
+        headers.append(header)
+        used += len(header) + 1
+    if not headers:
+        return ""
+
+    detection_budget = (budget - used) // len(headers)
+    lines = []
+    for header, technique in zip(headers, techniques):
+        detection = _truncate(technique['detection'] or "", detection_budget - len(" Detection: "))
+        lines.append(f"{header} Detection: {detection}" if detection else header)
+    omitted = len(techniques) - len(headers)
+    if omitted:
+        lines.append(f"- ...and {omitted} more techniques")
+    return "\n".join(lines)
+
+def retrieve_context(data: Dict, token_budget: int = TABLETOP_CONTEXT_TOKENS) -> str:
+    """Look up every TTP in the request in one batch and format it for the prompt (blocking, run on the DB lane)."""
+    return format_context(mitre.get_technique_context(data.get('ttps', [])), token_budget)
+
+def build_prompt(data: Dict) -> str:
+    """Prompt for a tabletop facilitation document from the answers collected over DM."""
+    context = data.get('context')
+    reference = (
+        "Reference details for the TTPs, from MITRE ATT&CK. Base injects and sample logs on these:\n"
+        f"{context}\n\n"
+    ) if context else ""
+    return (
+        "Generate a tabletop facilitation document in Markdown format for a cybersecurity exercise with the following details:\n"
+        f"- Day and Time: {data['day_time']}\n"
+        f"- Technologies in Use: {', '.join(data['technologies'])}\n"
+        f"- Number of Injects: {data['num_injects']}\n"
+        f"- Attack Basis: {data['basis_type']} ({data.get('basis_id', 'TTP Chain')})\n"
+        f"- TTPs Involved: {', '.join(data['ttps']) if data['ttps'] else 'None'}\n\n"
+        f"{reference}"
+        "Include:\n"
+        "1. A short narrative of the event (200-300 words) under a `## Narrative` heading.\n"
+        "2. Each inject with a corresponding sample log file from a relevant system (e.g., Fortinet, Microsoft AD) under `## Injects` with subheadings `### Inject X`.\n"
+        "3. Facilitation tips under a `## Facilitation Tips` heading.\n"
+        "Use Markdown syntax (e.g., `##`, `###`, `-` for lists, ``` for code blocks)."
+    )
+
+class MarkdownSectionBuffer:
+    """
+    Accumulates streamed Markdown and hands back whole sections.
+    A section ends where the next `##`/`###` heading begins; headings inside code
+    fences (sample logs often contain `#`) don't count, and a bare heading is kept
+    with the section that follows it.
+    """
+
+    def __init__(self):
+        self._line = ""  # Partial line still being streamed
+        self._lines: List[str] = []  # Complete lines of the current section
+        self._in_fence = False
+
+    @property
+    def pending(self) -> str:
+        """Text of the section currently being written, for live previews."""
+        return "".join(self._lines) + self._line
+
+    def feed(self, text: str) -> List[str]:
+        """Add streamed text and return any sections it completed."""
+        sections = []
+        self._line += text
+        while "\n" in self._line:
+            line, self._line = self._line.split("\n", 1)
+            line += "\n"
+            if not self._in_fence and SECTION_HEADING.match(line) and self._has_body():
+                sections.append("".join(self._lines))
+                self._lines = []
+            if line.lstrip().startswith(CODE_FENCE):
+                self._in_fence = not self._in_fence
+            self._lines.append(line)
+        return sections
+
+    def _has_body(self) -> bool:
+        """True once the current section holds more than a bare heading (`## Injects` stays with `### Inject 1`)."""
+        return any(line.strip() and not SECTION_HEADING.match(line) for line in self._lines)
+
+    def flush(self) -> str:
+        """Return whatever is left once the stream has finished."""
+        rest = self.pending
+        self._lines, self._line, self._in_fence = [], "", False
+        return rest
+
+async def generate_document(data: Dict) -> str:
+    """Generate the whole tabletop document in one request and return it as Markdown."""
+    try:
+        return await ollama.get_client().generate(build_prompt(data))
+    except ollama.OllamaError as e:
+        return f"Error: {e}"
+
+async def stream_sections(data: Dict, buffer: MarkdownSectionBuffer = None) -> AsyncIterator[str]:
+    """
+    Stream the tabletop document section by section as the model writes it.
+    Pass a buffer to peek at the section in progress via buffer.pending.
+    Raises ollama.OllamaError if generation fails.
+    """
+    buffer = buffer or MarkdownSectionBuffer()
+    async for fragment in ollama.get_client().stream(build_prompt(data)):
+        for section in buffer.feed(fragment):
+            yield section
+    rest = buffer.flush()
+    if rest.strip():
+        yield rest
+
+# --- Pipelined generation: narrative first, then one request per inject ---
+def use_pipeline(data: Dict) -> bool:
+    return 0 < TABLETOP_PIPELINE_MIN_INJECTS <= data['num_injects']
+
+def _exercise_details(data: Dict) -> str:
+    return (
+        f"- Day and Time: {data['day_time']}\n"
+        f"- Technologies in Use: {', '.join(data['technologies'])}\n"
+        f"- Attack Basis: {data['basis_type']} ({data.get('basis_id', 'TTP Chain')})\n"
+    )
+
+def _ttp_context(data: Dict, ttp: str) -> str:
+    """The reference line for one TTP out of the retrieved context, if there is one."""
+    for line in (data.get('context') or '').splitlines():
+        if line.startswith(f"- {ttp} "):
+            return line[2:]
+    return ""
+
+def build_narrative_prompt(data: Dict) -> str:
+    context = data.get('context')
+    return (
+        "Write the opening narrative for a cybersecurity tabletop exercise with these details:\n"
+        f"{_exercise_details(data)}"
+        f"- Number of Injects: {data['num_injects']}\n"
+        f"- TTPs Involved: {', '.join(data['ttps']) if data['ttps'] else 'None'}\n\n"
+        + (f"Reference details from MITRE ATT&CK:\n{context}\n\n" if context else "")
+        + "Respond with only a `## Narrative` heading followed by a 200-300 word narrative of the event in Markdown."
+    )
+
+def build_inject_prompt(data: Dict, narrative: str, number: int, ttp: Optional[str]) -> str:
+    reference = _ttp_context(data, ttp) if ttp else ""
+    return (
+        f"You are writing inject {number} of {data['num_injects']} for a cybersecurity tabletop exercise.\n"
+        f"{_exercise_details(data)}\n"
+        f"The scenario so far:\n{narrative.strip()}\n\n"
+        + (f"This inject should show the attacker using {ttp}" + (f": {reference}" if reference else ".") + "\n\n" if ttp else "")
+        + f"Respond with only a `### Inject {number}` heading, a short description of what the participants observe, "
+        "a realistic sample log excerpt from one of the technologies in use inside a ``` code block, "
+        "and two or three discussion questions as a `-` list."
+    )
+
+def build_tips_prompt(data: Dict, narrative: str) -> str:
+    return (
+        "Write facilitation tips for a cybersecurity tabletop exercise with these details:\n"
+        f"{_exercise_details(data)}"
+        f"- Number of Injects: {data['num_injects']}\n\n"
+        f"The scenario:\n{narrative.strip()}\n\n"
+        "Respond with only a `## Facilitation Tips` heading followed by a `-` list of tips in Markdown."
+    )
+
+async def _generate_section(prompt: str, heading: str) -> Tuple[str, bool]:
+    """
+    One section with its own retries, as (text, ok). A section that keeps failing
+    becomes a placeholder and ok is False.
+    """
+    error = None
+    for attempt in range(TABLETOP_SECTION_RETRIES + 1):
+        try:
+            text = (await ollama.get_client().generate(prompt)).strip()
+            if text:
+                if not text.startswith(heading):
+                    text = f"{heading}\n{text}"
+                return text + "\n\n", True
+            error = "empty response"
+        except ollama.OllamaError as e:
+            error = str(e)
+        logger.warning(f"Tabletop section '{heading}' failed ({error}), attempt {attempt + 1}")
+    return f"{heading}\n_This section could not be generated ({error})._\n\n", False
+
+async def generate_pipelined(data: Dict, on_section: Optional[Callable[[str], Awaitable[None]]] = None,
+                             concurrency: int = TABLETOP_INJECT_CONCURRENCY) -> Tuple[str, int]:
+    """
+    Generate the narrative, then every inject and the facilitation tips concurrently (at most
+    `concurrency` at once, and never more than the Ollama client allows). Sections are passed
+    to on_section in document order as soon as they and everything before them are ready.
+    Returns (document, failed) where failed counts the sections left as placeholders.
+    At most TABLETOP_MAX_INJECTS injects are generated.
+    """
+    if data['num_injects'] > TABLETOP_MAX_INJECTS:
+        logger.warning(f"Tabletop asked for {data['num_injects']} injects, generating {TABLETOP_MAX_INJECTS}")
+        data = dict(data, num_injects=TABLETOP_MAX_INJECTS)
+    sections: List[Optional[str]] = []
+    failed = 0
+    delivered = 0
+    delivery = asyncio.Lock()  # Keeps sections from being delivered twice or out of order
+
+    async def ready(index: int, text: str):
+        nonlocal delivered
+        sections[index] = text
+        async with delivery:
+            while delivered < len(sections) and sections[delivered] is not None:
+                if on_section is not None:
+                    await on_section(sections[delivered])
+                delivered += 1
+
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run(index: int, prompt: str, heading: str):
+        nonlocal failed
+        async with limit:
+            text, ok = await _generate_section(prompt, heading)
+        failed += not ok
+        await ready(index, text)
+
+    sections.append(None)
+    await run(0, build_narrative_prompt(data), "## Narrative")
+    narrative = sections[0]
+
+    ttps = data['ttps']
+    jobs = []
+    sections.append(None)
+    await ready(1, "## Injects\n\n")
+    for number in range(1, data['num_injects'] + 1):
+        ttp = ttps[(number - 1) % len(ttps)] if ttps else None
+        sections.append(None)
+        jobs.append(run(len(sections) - 1, build_inject_prompt(data, narrative, number, ttp), f"### Inject {number}"))
+    sections.append(None)
+    jobs.append(run(len(sections) - 1, build_tips_prompt(data, narrative), "## Facilitation Tips"))
+    await asyncio.gather(*jobs)
+    return "".join(sections), failed
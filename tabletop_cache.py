@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+TABLETOP_CACHE_DIR = os.getenv("TABLETOP_CACHE_DIR", "tabletop_cache")  # Empty disables the cache
+TABLETOP_CACHE_TTL = float(os.getenv("TABLETOP_CACHE_TTL", str(7 * 24 * 3600)))
+TABLETOP_CACHE_MAX_BYTES = int(os.getenv("TABLETOP_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+def _normalise(text: Optional[str]) -> str:
+    return " ".join((text or "").split()).casefold()
+
+def canonical_request(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The parts of collect_tabletop_data's answers that shape the document, normalised so
+    that answers differing only in case, spacing or technology order share a cache entry.
+    TTP order is kept since a TTP chain is sequential.
+    """
+    return {
+        "day_time": _normalise(data.get("day_time")),
+        "technologies": sorted({_normalise(tech) for tech in data.get("technologies", []) if tech.strip()}),
+        "num_injects": int(data.get("num_injects", 0)),
+        "basis_type": _normalise(data.get("basis_type")),
+        "basis_id": (data.get("basis_id") or "").strip().upper(),
+        "ttps": [ttp.strip().upper() for ttp in data.get("ttps", []) if ttp.strip()],
+    }
+
+def make_key(data: Dict[str, Any], model: str, prompt_version: str) -> str:
+    """Content address for a tabletop: canonical answers, model name and prompt template version."""
+    document = json.dumps(
+        {"request": canonical_request(data), "model": model, "prompt_version": prompt_version},
+        sort_keys=True, separators=(',', ':')
+    )
+    return hashlib.sha256(document.encode('utf-8')).hexdigest()
+
+class TabletopCache:
+    """
+    Generated tabletop documents on disk, one file per key. Entries older than `ttl`
+    are treated as missing, and the oldest files are removed once the directory
+    grows past `max_bytes`.
+    """
+
+    def __init__(self, directory: Optional[str] = TABLETOP_CACHE_DIR, ttl: float = TABLETOP_CACHE_TTL,
+                 max_bytes: int = TABLETOP_CACHE_MAX_BYTES):
+        self.directory = directory or None
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.md")
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, encoding='utf-8') as f:
+                document = f.read()
+        except OSError:
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+        with self._lock:
+            self.counters["hits"] += 1
+        return document
+
+    def put(self, key: str, document: str):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.tmp{threading.get_ident()}"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(document)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write tabletop cache entry: {e}")
+            return
+        with self._lock:
+            self.counters["stores"] += 1
+        self._evict()
+
+    def _evict(self):
+        """Remove expired entries, then the oldest ones until the directory fits max_bytes."""
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.md'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in sorted(files):
+            if now - mtime <= self.ttl and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                with self._lock:
+                    self.counters["evictions"] += 1
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+# Process-wide cache used by /create-tabletop
+cache = TabletopCache()
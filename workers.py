@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+DB_WORKERS = int(os.getenv("DB_WORKERS", "8"))
+DB_MAX_PENDING = int(os.getenv("DB_MAX_PENDING", "32"))
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "15"))
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_MAX_PENDING = int(os.getenv("RENDER_MAX_PENDING", "8"))
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "60"))
+
+BUSY_MESSAGE = "The bot is busy right now, please try again in a moment."
+TIMEOUT_MESSAGE = "That request took too long to complete, please try again later."
+
+class BusyError(Exception):
+    """Raised when a worker lane already has its maximum number of jobs queued or running."""
+
+class WorkerLane:
+    """
+    An executor with a bounded number of outstanding jobs and a per-job timeout.
+    Jobs are submitted from the event loop; the loop never blocks on them.
+    """
+
+    def __init__(self, name: str, executor_factory: Callable[[], Executor], max_pending: int, timeout: float):
+        self.name = name
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor_factory = executor_factory
+        self._executor: Optional[Executor] = None
+        self.pending = 0
+        self.counters = {"completed": 0, "rejected": 0, "timeouts": 0}
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._executor_factory()
+        return self._executor
+
+    def _job_done(self, _future):
+        self.pending -= 1
+        self.counters["completed"] += 1
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run func(*args, **kwargs) on this lane, raising BusyError or asyncio.TimeoutError."""
+        if self.pending >= self.max_pending:
+            logger.warning(f"{self.name} lane full ({self.pending} pending), rejecting job")
+            self.counters["rejected"] += 1
+            raise BusyError(self.name)
+
+        loop = asyncio.get_running_loop()
+        job = self.executor.submit(partial(func, *args, **kwargs))
+        self.pending += 1
+        # The slot is held until the job really finishes, even if the caller times out,
+        # so a backlog of abandoned jobs still counts against the queue depth.
+        job.add_done_callback(lambda f: loop.call_soon_threadsafe(self._job_done, f))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(job), self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            job.cancel()  # Only succeeds if the job has not started yet
+            logger.warning(f"{self.name} job {getattr(func, '__name__', func)} timed out")
+            self.counters["timeouts"] += 1
+            raise
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counters, pending=self.pending, max_pending=self.max_pending)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Thread pool for blocking database I/O
+db_lane = WorkerLane(
+    "db",
+    lambda: ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db"),
+    DB_MAX_PENDING,
+    DB_TIMEOUT,
+)
+
+# Process pool for CPU-bound graph layout and rasterizing. Spawned rather than
+# forked so children don't inherit the bot's event loop and socket state.
+render_lane = WorkerLane(
+    "render",
+    lambda: ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn")),
+    RENDER_MAX_PENDING,
+    RENDER_TIMEOUT,
+)
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking database call on the DB thread pool."""
+    return await db_lane.run(func, *args, **kwargs)
+
+async def run_render(func: Callable, *args, **kwargs) -> Any:
+    """Run a CPU-bound rendering call on the render process pool. func and args must be picklable."""
+    return await render_lane.run(func, *args, **kwargs)
+
+def shutdown():
+    """Stop both worker pools."""
+    db_lane.shutdown()
+    render_lane.shutdown()